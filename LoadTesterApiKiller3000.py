@@ -2,10 +2,11 @@ import argparse
 import requests
 import json
 import boto3
-import copy
 import uuid
 from datetime import datetime, timedelta
 
+from tests.loadtest.workloads import query_combinations
+
 ####################
 ## CORE FUNCTIONS ##
 ####################
@@ -135,28 +136,9 @@ def hammer_api(stack_name: str, count: int=10, should_cold_start: bool=False, **
     return average_query_time, query_times
 
 def complex_query(stack_name: str, query_dict: dict, should_cold_start: bool=False) -> (timedelta, list):
-    # This needs to be in scope for the recursive method,
-    # it saves the output.
-    query_list = []
-    def recursive_query_list(query_left: dict, current_query: list) -> None:
-        # If nothing left todo, you're a recursive leaf. Save and return.
-        if not query_left:
-            query_list.append(current_query)
-            return
-        # Grab a random item, and recurse through it's value_list:
-        query_left_copy = copy.copy(query_left)
-        first_item_key = next(iter(query_left_copy))
-        first_item_val = query_left_copy[first_item_key]
-        del query_left_copy[first_item_key]
-        for item in first_item_val:
-            recursive_query_list(query_left_copy, current_query + [(first_item_key, item)])
-    # Back to complex_query method. Make each value in dict a list if it's not already.
-    # (makes it easier to recurse through).
-    for key, val in query_dict.items():
-        if not isinstance(val, list):
-            query_dict[key] = [val]
-    # Make a list of possible queries, iterating over the dict of possibilities:
-    recursive_query_list(query_dict, [])
+    # Make a list of possible queries, iterating over the dict of possibilities.
+    # (Shared with the offline load tester, see tests/loadtest):
+    query_list = query_combinations(query_dict)
     total_time = timedelta(0)
     # If it shouldn't cold start, make sure the container is warm:
     if not should_cold_start:
@@ -3,11 +3,16 @@
 
 # (api_logger needs to be created before
 # the "from . import"'s to avoid a circular import)
+import importlib
 import logging
 from . import logger
 api_logger = logger.get_logger(__name__, logging.DEBUG)
 
-# Generic imports:
-from . import application
-from . import main
-from . import log_router
+# The API itself is only imported once something asks for it (i.e. 'SearchAPI.main.lambda_handler'),
+# so importing the package, or just its logger, doesn't pull in the whole app:
+_LAZY_SUBMODULES = ("application", "main", "log_router")
+
+def __getattr__(name: str):
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
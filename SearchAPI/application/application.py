@@ -1,111 +1,408 @@
 
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
 import json
-import logging
-import os
-import dateparser
+from typing import AsyncIterator
+
+import orjson
 
 import asf_search as asf
-from fastapi import Depends, FastAPI, Request, HTTPException, APIRouter, UploadFile
-from fastapi.responses import Response, JSONResponse
+from fastapi import Depends, FastAPI, Request, HTTPException, APIRouter
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, JSONResponse, StreamingResponse
 
-from SearchAPI import log_router
+from SearchAPI import api_logger, log_router
+from SearchAPI.logger import log_phase, timed_iter
 
-from .asf_env import load_config_maturity
-from .asf_opts import process_baseline_request, process_search_request
-from .health import get_cmr_health
-from .models import BaselineSearchOptsModel, SearchOptsModel, WKTModel
-from .output import as_output
+from .asf_env import head_hits_enabled, load_config_maturity, streaming_enabled
+from .asf_opts import process_baseline_request, process_batch_request, process_search_request
+from .cache import CachedStack, CompletePages, get_response_cache, get_stack_cache, search_cache_key, stack_cache_key
+from .cmr import CMRHits, count_cmr_hits
+from .cmr_client import AsyncCMRClient, blocking_pages, close_cmr_clients, get_cmr_client
+from .compression import add_vary, compress, compress_stream, min_bytes, response_encoding
+from .cursor import cursor_page, cursor_query_key, decode_cursor, encode_cursor, first_cursor
+from .download import close_bulk_download_clients
+from .executor import iterate_blocking, run_blocking
+from .files_to_wkt import files_to_wkt, read_upload
+from .health import get_api_version, get_health_monitor
+from .models import BaselineSearchOptsModel, BatchSearchOptsModel, SearchOptsModel, WKTModel
+from .output import as_output, as_stream, output_metadata
+from . import product_lists
+from . import wkt_cache
 from . import constants
-from shapely import from_wkt
 
 asf.REPORT_ERRORS = False
 router = APIRouter(route_class=log_router.LoggingRoute)
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    wkt_cache.install()
+    # Have a CMR health snapshot ready before the first health check comes in:
+    get_health_monitor().start()
+    yield
+    await get_health_monitor().stop()
+    await close_cmr_clients()
+    await close_bulk_download_clients()
+
+app = FastAPI(lifespan=lifespan)
 
 
 @router.api_route("/services/search/param", methods=["GET", "POST", "HEAD"])
-async def query_params(searchOptions: SearchOptsModel = Depends(process_search_request)):
-    # TODO: Now that we don't have to use streaming responses, this count
-    #       block could probably be moved to 'as_output', especially
-    #       since it's a switch statement now.
+async def query_params(request: Request, searchOptions: SearchOptsModel = Depends(process_search_request)):
+    # TODO: This count block could probably be moved to 'as_output',
+    #       especially since it's a switch statement now.
     output = searchOptions.output
+    pretty = searchOptions.pretty
     opts = searchOptions.opts
-    
+    maturity = searchOptions.merged_args.get('maturity', 'prod')
+    cmr_client = get_cmr_client(maturity)
+
+    # Searches with a cmr_token can see different results, so they're never cached:
+    cache = None if searchOptions.merged_args.get('cmr_token') else get_response_cache()
+    cache_key = search_cache_key(opts, output, maturity, pretty) if cache is not None else None
+    if searchOptions.request_method == 'HEAD':
+        return await _search_head(request, cmr_client, opts, output, cache, cache_key)
+    # ndjson comes a page at a time (List searches are always one page, streamed like any other output):
+    if output.lower() == 'ndjson' and product_lists.list_keyword(opts) is None:
+        return await _search_cursor_page(request, cmr_client, opts, searchOptions.merged_args.get('cursor'), maturity)
+    # Cached (and rendered) bodies are never compressed, so one entry works for every Accept-Encoding:
+    encoding = response_encoding(request, output)
+    if cache is not None:
+        if (cached := cache.get(cache_key)) is not None:
+            response_info = {
+                'content': cached.content,
+                'media_type': cached.media_type,
+                'headers': {**cached.headers, 'X-Cache': 'HIT'}
+            }
+            return Response(status_code=200, **await run_blocking(compress, response_info, encoding, output))
+
     if output.lower() == 'count':
-        return Response(
-            content=str(asf.search_count(opts=opts)),
-            status_code=200,
-            media_type='text/html; charset=utf-8',
-            headers=constants.DEFAULT_HEADERS
-        )
+        count = await _search_count(cmr_client, opts)
+        response_info = {
+            'content': str(count),
+            'media_type': 'text/html; charset=utf-8',
+            # (Same as a HEAD's)
+            'headers': {**constants.DEFAULT_HEADERS, 'CMR-Hits': str(count)}
+        }
+        if cache is not None:
+            cache.set(cache_key, response_info)
+            response_info['headers']['X-Cache'] = 'MISS'
+        return Response(status_code=200, **response_info)
     else:
         try:
-            results = asf.search(opts=opts)
-            response_info = as_output(results, output)
-            return Response(**response_info)
+            if streaming_enabled(request):
+                if cmr_client is not None:
+                    response_info, pages = await _search_as_async_stream(cmr_client, opts, output, pretty, maturity)
+                else:
+                    response_info, pages = await run_blocking(_search_as_stream, opts, output, pretty, maturity)
+                if cache is not None:
+                    # Only cached if every page made it (A search that fails partway raises mid-stream):
+                    response_info['content'] = cache.cache_stream(cache_key, response_info, is_complete=lambda: pages.complete)
+                    response_info['headers']['X-Cache'] = 'MISS'
+                response_info = await run_blocking(compress_stream, response_info, encoding, output)
+                response_info['content'] = iterate_blocking(response_info['content'])
+                return StreamingResponse(**response_info)
+            if cmr_client is not None:
+                response_info = await _search_as_async_output(cmr_client, opts, output, pretty, maturity)
+            else:
+                response_info = await run_blocking(_search_as_output, opts, output, pretty, maturity)
+            if cache is not None:
+                cache.set(cache_key, response_info)
+                response_info['headers']['X-Cache'] = 'MISS'
+            return Response(**await run_blocking(compress, response_info, encoding, output))
 
         except (asf.ASFSearchError, asf.CMRError, ValueError) as exc:
             raise HTTPException(detail=f"Search failed to find results: {exc}", status_code=400) from exc
 
 
 @router.api_route("/services/search/baseline", methods=["GET", "POST", "HEAD"])
-async def query_baseline(searchOptions: BaselineSearchOptsModel = Depends(process_baseline_request)):
+async def query_baseline(request: Request, searchOptions: BaselineSearchOptsModel = Depends(process_baseline_request)):
     opts = searchOptions.opts
     opts.maxResults = None
     output = searchOptions.output
+    pretty = searchOptions.pretty
     reference = searchOptions.reference
     request_method = searchOptions.request_method
-    # Load the reference scene:
-    try:
-        reference_product = asf.granule_search(granule_list=[reference], opts=opts)[0]
-    except (KeyError, IndexError, ValueError) as exc:
-        raise HTTPException(detail=f"Reference scene not found: {reference}", status_code=400) from exc
-    
-    try:
-        if reference_product.get_stack_opts() is None:
-            reference_product = asf.ASFStackableProduct(args={'umm': reference_product.umm, 'meta': reference_product.meta}, session=reference_product.session)
-        if not reference_product.has_baseline() or not reference_product.is_valid_reference():
-            raise asf.exceptions.ASFBaselineError(f"Requested reference scene has no baseline")
-    except (asf.exceptions.ASFBaselineError, ValueError) as exc:
-        raise HTTPException(detail=f"Search failed to find results: {exc}", status_code=400)
-    
+    maturity = searchOptions.merged_args.get('maturity', 'prod')
+    cmr_client = get_cmr_client(maturity)
+
+    # Same as the response cache, stacks found with a cmr_token are never cached:
+    stack_cache = None if searchOptions.merged_args.get('cmr_token') else get_stack_cache()
+    stack_key = stack_cache_key(reference, opts, maturity) if stack_cache is not None else None
+    cached = stack_cache.get(stack_key) if stack_cache is not None else None
+
     if request_method == "HEAD":
         # Need head request separately, so it doesn't do all
-        # the work to figure out the body
-        if output.lower() == 'count':
-            return Response(
-                status_code=200,
-                media_type='text/html; charset=utf-8',
-                headers=constants.DEFAULT_HEADERS
-            )
-        metadata = as_output(asf.ASFSearchResults([]), output)
-        return Response(
-            status_code=200,
-            headers=metadata["headers"],
-            media_type=metadata["media_type"]
-        )
+        # the work to figure out the body (or even look up the reference)
+        return await _stack_head(cmr_client, reference, opts, output, stack_cache, stack_key, cached)
+
+    if cached is not None:
+        reference_product = cached.reference
+    else:
+        reference_product = await _load_reference(cmr_client, reference, opts)
+    headers = {**constants.DEFAULT_HEADERS}
+    if stack_cache is not None:
+        headers['X-Cache'] = 'MISS' if cached is None else 'HIT'
     # Figure out the response params:
     if output.lower() == 'count':
-        stack_opts = reference_product.get_stack_opts()
+        if cached is None:
+            cached = await _stack_count(cmr_client, reference_product)
+            if stack_cache is not None:
+                stack_cache.set(stack_key, cached)
+        headers['CMR-Hits'] = str(cached.count)
         return Response(
-            content=str(asf.search_count(opts=stack_opts)),
+            content=str(cached.count),
             status_code=200,
             media_type='text/html; charset=utf-8',
-            headers=constants.DEFAULT_HEADERS
+            headers=headers
         )
     
     # Finally stream everything back:
     try:
-        response_info = as_output(reference_product.stack(opts=opts), output)
-        return Response(**response_info)
+        if cached is not None and cached.stack is not None:
+            stack = cached.stack
+            headers['CMR-Hits'] = str(cached.count)
+        else:
+            if stack_cache is not None:
+                headers['X-Cache'] = 'MISS'
+            if cmr_client is not None:
+                cmr_hits = CMRHits()
+                stack = await cmr_client.stack(reference_product, opts, cmr_hits=cmr_hits)
+            else:
+                stack, cmr_hits = await run_blocking(_stack, reference_product, opts)
+            if stack_cache is not None:
+                stack_cache.set(stack_key, CachedStack(reference_product, reference_product.get_stack_opts(), stack=stack, count=cmr_hits.hits))
+            headers['CMR-Hits'] = str(cmr_hits.hits)
+        encoding = response_encoding(request, output)
+        if streaming_enabled(request):
+            response_info = await run_blocking(_stack_as_stream, stack, output, pretty, maturity)
+            response_info['headers'].update(headers)
+            response_info = await run_blocking(compress_stream, response_info, encoding, output)
+            response_info['content'] = iterate_blocking(response_info['content'])
+            return StreamingResponse(**response_info)
+        response_info = await run_blocking(log_phase('serialize')(as_output), stack, output, pretty, maturity)
+        response_info['headers'].update(headers)
+        return Response(**await run_blocking(compress, response_info, encoding, output))
 
     except (asf.ASFSearchError, asf.CMRError, ValueError) as exc:
         raise HTTPException(detail=f"Search failed to find results: {exc}", status_code=400) from exc
 
+@router.post("/services/search/batch")
+async def query_batch(batchOptions: BatchSearchOptsModel = Depends(process_batch_request)):
+    """
+    Runs every query in the batch, at most constants.BATCH_CONCURRENCY at a time, and streams each one's
+    response back as a line of NDJSON as soon as it's done (So not in order, that's what 'index' is for):
+        {"index":1,"output":"count","hits":12,"response":12}
+        {"index":0,"output":"jsonlite","hits":3,"response":{"results":[...]}}
+        {"index":2,"error":{"type":"ERROR","report":"...","status":400}}
+    Identical queries only run once, and a query that fails only fails its own line.
+    """
+    return StreamingResponse(
+        _run_batch(batchOptions),
+        media_type='application/x-ndjson',
+        headers=constants.DEFAULT_HEADERS
+    )
+
+async def _run_batch(batchOptions: BatchSearchOptsModel) -> AsyncIterator[bytes]:
+    cmr_client = get_cmr_client(batchOptions.maturity)
+    limit = asyncio.Semaphore(constants.BATCH_CONCURRENCY)
+    # Same cache (and keys) as the param endpoint, so a batch can be answered from single searches and vice versa:
+    queries = [query for query in batchOptions.queries if isinstance(query, SearchOptsModel)]
+    cache = None if any(query.merged_args.get('cmr_token') for query in queries) else get_response_cache()
+
+    # search key -> (the query, the index of every query that's the same search):
+    searches = {}
+    for index, query in enumerate(batchOptions.queries):
+        if isinstance(query, HTTPException):
+            yield _batch_line(index, error=query)
+            continue
+        key = search_cache_key(query.opts, query.output, batchOptions.maturity)
+        searches.setdefault(key, (query, []))[1].append(index)
+
+    async def run(key: str, query: SearchOptsModel) -> dict:
+        async with limit:
+            return await _batch_search(cmr_client, cache, key, query)
+
+    tasks = {asyncio.create_task(run(key, query)): (query, indexes) for key, (query, indexes) in searches.items()}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                query, indexes = tasks[task]
+                try:
+                    response_info = task.result()
+                except Exception as exc:
+                    error = _batch_error(exc)
+                    for index in indexes:
+                        yield _batch_line(index, error=error)
+                    continue
+                for index in indexes:
+                    yield _batch_line(index, output=query.output, response_info=response_info)
+    finally:
+        # The client went away. Don't keep searching for it:
+        for task in pending:
+            task.cancel()
+
+async def _batch_search(cmr_client: AsyncCMRClient, cache, key: str, query: SearchOptsModel) -> dict:
+    if cache is not None and (cached := cache.get(key)) is not None:
+        return {'content': cached.content, 'headers': cached.headers}
+    if query.output.lower() == 'count':
+        count = await _search_count(cmr_client, query.opts)
+        response_info = {
+            'content': str(count),
+            'media_type': 'text/html; charset=utf-8',
+            'headers': {**constants.DEFAULT_HEADERS}
+        }
+    elif cmr_client is not None:
+        response_info = await _search_as_async_output(cmr_client, query.opts, query.output)
+    else:
+        response_info = await run_blocking(_search_as_output, query.opts, query.output)
+    if cache is not None:
+        cache.set(key, response_info)
+    return response_info
+
+def _batch_line(index: int, output: str = None, response_info: dict = None, error=None) -> bytes:
+    if error is not None:
+        if isinstance(error, HTTPException):
+            error = {'type': 'ERROR', 'report': error.detail, 'status': error.status_code}
+        return orjson.dumps({'index': index, 'error': error}) + b'\n'
+    content = response_info['content']
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    line = {'index': index, 'output': output}
+    if output.lower() == 'count':
+        line['hits'] = int(content)
+    elif (hits := response_info['headers'].get('CMR-Hits')) is not None:
+        line['hits'] = int(hits)
+    # The response is already json, so it goes in as-is instead of being parsed and re-encoded:
+    return orjson.dumps(line)[:-1] + b',"response":' + content + b'}\n'
+
+def _batch_error(exc: Exception) -> dict:
+    if isinstance(exc, HTTPException):
+        return {'type': 'ERROR', 'report': exc.detail, 'status': exc.status_code}
+    if isinstance(exc, (asf.ASFSearchError, asf.CMRError, ValueError)):
+        return {'type': 'ERROR', 'report': f"Search failed to find results: {exc}", 'status': 400}
+    api_logger.exception(f"Batch query failed: {repr(exc)}")
+    return {'type': 'ERROR', 'report': 'Internal server error', 'status': 500}
+
+async def _search_cursor_page(request: Request, cmr_client: AsyncCMRClient, opts: asf.ASFSearchOptions, token: str, maturity: str) -> Response:
+    """
+    One page of an ndjson search (see cursor.py): Up to maxResults products, one per line. The total
+    hits are in CMR-Hits, and the cursor for the next page (if there is one) in Next-Cursor.
+    """
+    query = cursor_query_key(opts, maturity)
+    cursor = first_cursor(query) if token is None else decode_cursor(token, query)
+    try:
+        # The hits are counted alongside every page. (A cursor could carry them, but nothing in one can be trusted)
+        if cmr_client is not None:
+            page = cmr_client.cursor_page(opts, cursor, opts.maxResults)
+        else:
+            page = run_blocking(log_phase('cmr')(cursor_page), opts, cursor, opts.maxResults)
+        (products, next_cursor), hits = await asyncio.gather(page, _search_count(cmr_client, opts))
+    except (asf.ASFSearchError, asf.CMRError, ValueError) as exc:
+        raise HTTPException(detail=f"Search failed to find results: {exc}", status_code=400) from exc
+
+    response_info = await run_blocking(log_phase('serialize')(as_output), asf.ASFSearchResults(products), 'ndjson')
+    response_info['headers']['CMR-Hits'] = str(hits)
+    if next_cursor is not None:
+        response_info['headers']['Next-Cursor'] = encode_cursor(next_cursor)
+    return Response(**await run_blocking(compress, response_info, response_encoding(request, 'ndjson'), 'ndjson'))
+
+async def _stack_count(cmr_client: AsyncCMRClient, reference_product: asf.ASFStackableProduct) -> CachedStack:
+    # A stack cache entry with just the count, not the stack itself:
+    stack_opts = reference_product.get_stack_opts()
+    count = await _search_count(cmr_client, stack_opts)
+    return CachedStack(reference_product, stack_opts, stack=None, count=count)
+
+async def _search_count(cmr_client: AsyncCMRClient, opts: asf.ASFSearchOptions) -> int:
+    if cmr_client is not None:
+        return await cmr_client.search_count(opts)
+    return await run_blocking(log_phase('cmr')(asf.search_count), opts=opts)
+
+async def _search_head(request: Request, cmr_client: AsyncCMRClient, opts: asf.ASFSearchOptions, output: str, cache, cache_key: str) -> Response:
+    """
+    HEAD on the param endpoint: the headers a GET would get, from the validated options alone.
+    With SEARCHAPI_HEAD_HITS on, CMR-Hits too, from the response cache or a count-only search
+    (and Content-Length, if it's cached or just the count).
+    """
+    metadata = output_metadata(output)
+    add_vary(metadata, output)
+    headers = metadata['headers']
+    if head_hits_enabled():
+        if cache is not None and (cached := cache.get(cache_key)) is not None:
+            headers.update(cached.headers)
+            headers['X-Cache'] = 'HIT'
+            if output.lower() == 'count':
+                headers['CMR-Hits'] = cached.content.decode('utf-8')
+            # Unless the GET would be compressed, then only the encoding is known:
+            encoding = response_encoding(request, output)
+            if encoding is None or len(cached.content) < min_bytes():
+                headers['Content-Length'] = str(len(cached.content))
+            else:
+                headers['Content-Encoding'] = encoding
+        else:
+            count = await _search_count(cmr_client, opts)
+            headers['CMR-Hits'] = str(count)
+            if output.lower() == 'count':
+                headers['Content-Length'] = str(len(str(count)))
+    return _head_response(metadata)
+
+async def _stack_head(cmr_client: AsyncCMRClient, reference: str, opts: asf.ASFSearchOptions, output: str, stack_cache, stack_key: str, cached: CachedStack) -> Response:
+    """
+    Same as '_search_head', for the baseline endpoint. The hits come from the stack cache,
+    or the reference lookup and a count-only search (which is then cached).
+    """
+    metadata = output_metadata(output)
+    add_vary(metadata, output)
+    headers = metadata['headers']
+    if stack_cache is not None:
+        # What the GET would say. A count-only entry doesn't have the stack itself:
+        headers['X-Cache'] = 'HIT' if cached is not None and (output.lower() == 'count' or cached.stack is not None) else 'MISS'
+    if head_hits_enabled():
+        if cached is None:
+            cached = await _stack_count(cmr_client, await _load_reference(cmr_client, reference, opts))
+            if stack_cache is not None:
+                stack_cache.set(stack_key, cached)
+        headers['CMR-Hits'] = str(cached.count)
+        if output.lower() == 'count':
+            headers['Content-Length'] = str(len(str(cached.count)))
+    return _head_response(metadata)
+
+def _head_response(metadata: dict) -> Response:
+    response = Response(status_code=200, media_type=metadata['media_type'], headers=metadata['headers'])
+    # Starlette fills in the length of the (empty) body. A HEAD's should be the GET's, or not there at all:
+    if 'Content-Length' not in metadata['headers']:
+        del response.headers['content-length']
+    return response
+
+async def _load_reference(cmr_client: AsyncCMRClient, reference: str, opts: asf.ASFSearchOptions) -> asf.ASFStackableProduct:
+    """
+    Looks up the reference scene for a baseline stack. 400's if it's missing, or can't be stacked.
+    """
+    try:
+        if cmr_client is not None:
+            reference_product = (await cmr_client.granule_search([reference], opts))[0]
+        else:
+            reference_product = (await run_blocking(log_phase('cmr')(asf.granule_search), granule_list=[reference], opts=opts))[0]
+    except (KeyError, IndexError, ValueError) as exc:
+        raise HTTPException(detail=f"Reference scene not found: {reference}", status_code=400) from exc
+    
+    try:
+        if reference_product.get_stack_opts() is None:
+            reference_product = asf.ASFStackableProduct(args={'umm': reference_product.umm, 'meta': reference_product.meta}, session=reference_product.session)
+        if not reference_product.has_baseline() or not reference_product.is_valid_reference():
+            raise asf.exceptions.ASFBaselineError(f"Requested reference scene has no baseline")
+    except (asf.exceptions.ASFBaselineError, ValueError) as exc:
+        raise HTTPException(detail=f"Search failed to find results: {exc}", status_code=400)
+    return reference_product
 
 
 @router.get('/services/utils/date', response_class=JSONResponse)
 async def query_date_validation(date: str):
+    # Only this endpoint needs it, so it's loaded on first use:
+    import dateparser  # pylint: disable=import-outside-toplevel
     parsed_date = dateparser.parse(date)
     if parsed_date is None:
         raise HTTPException(detail=f"Could not parse date: {date}", status_code=400)
@@ -126,7 +423,7 @@ async def query_mission_list(platform: str | None = None):
     if platform is not None:
         platform = platform.upper()
 
-    response = { 'result': asf.campaigns(platform) }
+    response = { 'result': await run_blocking(asf.campaigns, platform) }
 
     return JSONResponse(
         content=response,
@@ -147,22 +444,91 @@ async def query_wkt_validation(body: WKTModel, wkt: str=''): # = Depends()): #,
     )
 
 @router.post('/services/utils/files_to_wkt')
-async def file_to_wkt(files: list[UploadFile]):
-    for file in files:
-        file.file.filename = file.filename
-    
-    data = asf.filesToWKT([file.file for file in files]).getWKT()
+async def file_to_wkt(request: Request):
+    # Read by hand (not as 'list[UploadFile]'), so the size limits apply while it's uploading:
+    files = await read_upload(request)
+    try:
+        data = await files_to_wkt(files)
+    finally:
+        for file in files:
+            await file.close()
+    validated = await run_blocking(validate_wkt, data.pop('shape'))
+    validated['repairs'] = data.pop('repairs') + validated['repairs']
 
     return JSONResponse(content={
         ** data,
-        ** validate_wkt(data["parsed wkt"])},
+        ** validated},
         status_code=200,
         headers=constants.DEFAULT_HEADERS
     )
 
+def _search_as_output(opts: asf.ASFSearchOptions, output: str, pretty: bool = False, maturity: str = None) -> dict:
+    # Search and serialize in one go, so it only takes up one executor slot:
+    with count_cmr_hits(opts.session) as cmr_hits, log_phase('cmr'):
+        results = product_lists.search(opts)
+    with log_phase('serialize'):
+        response_info = as_output(results, output, pretty, maturity)
+    # Once maxResults is met, the subqueries after it aren't searched (and haven't reported their hits):
+    if cmr_hits.is_complete(opts):
+        response_info['headers']['CMR-Hits'] = str(cmr_hits.hits)
+    return response_info
+
+def _search_as_stream(opts: asf.ASFSearchOptions, output: str, pretty: bool = False, maturity: str = None) -> tuple:
+    """
+    Returns (response_info, pages). 'pages.complete' is set once the body has every result.
+    """
+    pages = timed_iter(product_lists.search_generator(opts), 'cmr')
+    # Pull the first page before responding, so a failed search still gets a 400.
+    # The rest are fetched from CMR as the response is sent:
+    with count_cmr_hits(opts.session) as cmr_hits:
+        first_page = next(pages, asf.ASFSearchResults([]))
+    pages = CompletePages(itertools.chain([first_page], pages))
+    with log_phase('serialize'):
+        response_info = as_stream(pages, output, pretty, maturity)
+    response_info['content'] = timed_iter(response_info['content'], 'serialize')
+    # Searches split into subqueries haven't seen every hit count yet:
+    if cmr_hits.is_complete(opts):
+        response_info['headers']['CMR-Hits'] = str(cmr_hits.hits)
+    return response_info, pages
+
+async def _search_as_async_output(cmr_client: AsyncCMRClient, opts: asf.ASFSearchOptions, output: str, pretty: bool = False, maturity: str = None) -> dict:
+    # Same as '_search_as_output', but only the serializing takes up an executor slot:
+    cmr_hits = CMRHits()
+    results = await cmr_client.search(opts, cmr_hits=cmr_hits)
+    response_info = await run_blocking(log_phase('serialize')(as_output), results, output, pretty, maturity)
+    if cmr_hits.is_complete(opts):
+        response_info['headers']['CMR-Hits'] = str(cmr_hits.hits)
+    return response_info
+
+async def _search_as_async_stream(cmr_client: AsyncCMRClient, opts: asf.ASFSearchOptions, output: str, pretty: bool = False, maturity: str = None) -> tuple:
+    # Same as '_search_as_stream'. The pages are fetched on the event loop, and handed
+    # to the serializer (running on the executor, once the response starts) as they come in:
+    cmr_hits = CMRHits()
+    pages = cmr_client.search_pages(opts, cmr_hits=cmr_hits)
+    first_page = await anext(pages, asf.ASFSearchResults([]))
+    pages = CompletePages(itertools.chain([first_page], blocking_pages(pages)))
+    response_info = as_stream(pages, output, pretty, maturity)
+    response_info['content'] = timed_iter(response_info['content'], 'serialize')
+    if cmr_hits.is_complete(opts):
+        response_info['headers']['CMR-Hits'] = str(cmr_hits.hits)
+    return response_info, pages
+
+def _stack(reference_product: asf.ASFStackableProduct, opts: asf.ASFSearchOptions) -> tuple:
+    # The stack, and its CMR hits (The stack itself leaves out scenes without baselines):
+    with count_cmr_hits(opts.session) as cmr_hits, log_phase('cmr'):
+        stack = reference_product.stack(opts=opts)
+    return stack, cmr_hits
+
+def _stack_as_stream(stack: asf.ASFSearchResults, output: str, pretty: bool = False, maturity: str = None) -> dict:
+    # The baselines need the whole stack, but it can still be serialized a chunk at a time:
+    with log_phase('serialize'):
+        response_info = as_stream([stack], output, pretty, maturity)
+    response_info['content'] = timed_iter(response_info['content'], 'serialize')
+    return response_info
+
 def validate_wkt(wkt: str):
     try:
-        wrapped, unwrapped, reports = asf.validate_wkt(wkt)
+        wrapped, unwrapped, reports = wkt_cache.validate_wkt(wkt)
         repairs = [{'type': report.report_type, 'report': report.report} for report in reports]
     except Exception as exc:
         raise HTTPException(detail=f"Failed to validate wkt: {exc}", status_code=400) from exc
@@ -177,21 +543,14 @@ def validate_wkt(wkt: str):
 
 @router.get('/', response_class=JSONResponse)
 @router.get('/health', response_class=JSONResponse)
-async def health_check():
-    try:
-        version_path = os.path.join("SearchAPI", "version.json")
-        with open(version_path, 'r', encoding="utf-8") as version_file:
-            api_version = json.load(version_file)
-    except Exception as exc:
-        logging.debug(exc)
-        api_version = {'version': 'unknown'}
-
-    cmr_health = get_cmr_health()
+async def health_check(deep: bool = False):
+    cmr_health = await get_health_monitor().get(deep=deep)
     api_health = {
         'ASFSearchAPI': {
             'ok?': True,
-            'version': api_version['version'],
-            'config': load_config_maturity()
+            'version': get_api_version()['version'],
+            'config': jsonable_encoder(load_config_maturity()),
+            'wkt_cache': wkt_cache.wkt_cache_stats()
         },
         'CMRSearchAPI': cmr_health
     }
@@ -213,7 +572,7 @@ async def handle_error(request: Request, error: HTTPException):
     return JSONResponse(
         content=response,
         status_code=error.status_code,
-        headers=constants.DEFAULT_HEADERS
+        headers={**constants.DEFAULT_HEADERS, **(error.headers or {})}
     )
 
 
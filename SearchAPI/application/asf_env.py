@@ -1,29 +1,107 @@
 import os
 import logging
+import threading
+import time
 import yaml
+from types import MappingProxyType
+from typing import Mapping
 from fastapi import Request
 from urllib import parse
 
 from SearchAPI import api_logger
+from . import constants
 
-def load_config_file() -> dict:
-    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",  "maturities.yml")
-    with open(file_path, "r", encoding='utf-8') as yml_file:
-        config = yaml.safe_load(yml_file)
+CONFIG_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",  "maturities.yml")
+# How often (seconds) to check if maturities.yml changed on disk:
+CONFIG_CHECK_INTERVAL = 5.0
+
+_config_lock = threading.Lock()
+_config_cache = {
+    'config': None,
+    'mtime': None,
+    'last_checked': 0.0,
+}
+
+def _freeze(obj):
+    """
+    Recursively makes the parsed yaml read-only, since every request shares the same copy.
+    """
+    if isinstance(obj, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return tuple(_freeze(v) for v in obj)
+    return obj
+
+def _merge(defaults, overrides):
+    """
+    Recursively lays 'overrides' over 'defaults'. Nested blocks are merged key by key,
+    anything else in 'overrides' replaces the default outright.
+    """
+    if not isinstance(defaults, dict) or not isinstance(overrides, dict):
+        return overrides
+    merged = dict(defaults)
+    for key, value in overrides.items():
+        merged[key] = _merge(defaults.get(key), value)
+    return merged
+
+def _merge_defaults(configs: dict) -> dict:
+    """
+    Every maturity only lists what it changes from 'default', so fill in the rest from there.
+    """
+    defaults = configs.get('default', {})
+    return {maturity: _merge(defaults, config) for maturity, config in configs.items()}
+
+def reload_config() -> Mapping:
+    """
+    Re-parses maturities.yml, and replaces the cached copy.
+    """
+    with _config_lock:
+        mtime = os.stat(CONFIG_FILE_PATH).st_mtime_ns
+        with open(CONFIG_FILE_PATH, "r", encoding='utf-8') as yml_file:
+            config = _freeze(_merge_defaults(yaml.safe_load(yml_file)))
+        _config_cache.update(config=config, mtime=mtime, last_checked=time.monotonic())
+        api_logger.debug(f"Loaded config from {CONFIG_FILE_PATH}")
     return config
 
-def load_config_maturity(maturity: str=None) -> dict:
+def load_config_file() -> Mapping:
     """
-    Load the config for the given maturity. If 'maturity' param is None, use the MATURITY env var.
-    If neither are set, default to 'local' config.
+    Returns the parsed maturities.yml. It's only parsed once, then again if the file's
+    modified time changes (checked at most every CONFIG_CHECK_INTERVAL seconds).
+    """
+    if _config_cache['config'] is None:
+        return reload_config()
+    now = time.monotonic()
+    if now - _config_cache['last_checked'] >= CONFIG_CHECK_INTERVAL:
+        _config_cache['last_checked'] = now
+        try:
+            if os.stat(CONFIG_FILE_PATH).st_mtime_ns != _config_cache['mtime']:
+                return reload_config()
+        except OSError as exc:
+            # Keep serving the last good copy:
+            api_logger.warning(f"Could not check {CONFIG_FILE_PATH} for changes: {exc}")
+    return _config_cache['config']
+
+def get_maturity(maturity: str=None) -> str:
+    """
+    Returns 'maturity' if set, otherwise the MATURITY env var.
+    If neither are set, default to 'local'.
     """
-    all_configs = load_config_file()
     if maturity is None:
         if 'MATURITY' in os.environ.keys():
             maturity = os.environ['MATURITY']
         else:
             api_logger.warning("os.environ['MATURITY'] not set! Defaulting to local config.")
             maturity = 'local'
+    return maturity
+
+def load_config_maturity(maturity: str=None) -> Mapping:
+    """
+    Load the config for the given maturity. If 'maturity' param is None, use the MATURITY env var.
+    If neither are set, default to 'local' config. Anything the maturity doesn't set comes from 'default'.
+    The config is cached and read-only. Don't try to modify it.
+    """
+    all_configs = load_config_file()
+    maturity = get_maturity(maturity)
 
     try:
         config = all_configs[maturity]
@@ -31,3 +109,19 @@ def load_config_maturity(maturity: str=None) -> dict:
         api_logger.error(f"Invalid maturity: '{maturity}' not found in maturities.yml")
         raise
     return config
+
+def streaming_enabled(request: Request) -> bool:
+    """
+    If search results should be streamed back, instead of built in memory first.
+    Mangum (Lambda) can't stream, so it's off there by default. Set the
+    SEARCHAPI_STREAMING env var to 'TRUE' or 'FALSE' to force it either way.
+    """
+    if (streaming := os.environ.get('SEARCHAPI_STREAMING')) is not None:
+        return streaming.upper() == 'TRUE'
+    return 'aws.event' not in request.scope
+
+def head_hits_enabled() -> bool:
+    """
+    If HEAD requests on the search endpoints should fill in the hit count. (see constants.HEAD_HITS)
+    """
+    return os.environ.get('SEARCHAPI_HEAD_HITS', str(constants.HEAD_HITS)).upper() == 'TRUE'
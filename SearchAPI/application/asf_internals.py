@@ -0,0 +1,25 @@
+"""
+The parts of asf_search that aren't its public API, but the search paths here build on.
+
+cmr_client.py, cursor.py, product_lists.py and cmr.py send asf_search's own CMR queries
+themselves (asynchronously, a page at a time, split up differently), so they need the pieces
+asf_search searches with, not only 'asf.search'. Those moved around, or didn't exist yet, before
+asf_search 8.0.0 (the version pinned in requirements.txt), so everything goes through here:
+bumping asf_search means checking this one file, not every module that uses them.
+"""
+from asf_search import INTERNAL
+from asf_search.baseline.stack import get_baseline_from_stack
+from asf_search.CMR import build_subqueries, translate_opts
+from asf_search.exceptions import CMRIncompleteError
+from asf_search.search.search_generator import as_ASFProduct, preprocess_opts, query_cmr
+
+__all__ = [
+    'INTERNAL',
+    'CMRIncompleteError',
+    'as_ASFProduct',
+    'build_subqueries',
+    'get_baseline_from_stack',
+    'preprocess_opts',
+    'query_cmr',
+    'translate_opts',
+]
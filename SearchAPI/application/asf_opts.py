@@ -1,22 +1,30 @@
 
-import collections
 import re
-from typing import Union
+from types import MappingProxyType
+from typing import Callable, Mapping, NamedTuple, Optional, Union
 
 from fastapi import HTTPException, Request
 from pydantic import ValidationError
-from SearchAPI.application.models import BaselineSearchOptsModel, SearchOptsModel
+from SearchAPI.application.models import BaselineSearchOptsModel, BatchSearchOptsModel, SearchOptsModel
 import asf_search as asf
+from asf_search.ASFSearchOptions.validator_map import validator_map
 from .asf_env import load_config_maturity
+from .product_lists import LIST_KEYWORDS, dedupe_names
+from .sessions import get_session
+from . import constants
 
 from SearchAPI import api_logger
+from SearchAPI.logger import log_phase, update_request_context
+
+RANGE_PATTERN = re.compile(r'^(-?\d+(\.\d*)?)-(-?\d+(\.\d*)?)$')
+NUMBER_PATTERN = re.compile(r'^(-?\d+(\.\d*)?)$')
 
 def string_to_range(v: Union[str, list]) -> tuple:
     if isinstance(v, list):
         return v
     try:
         v = v.replace(' ', '')
-        m = re.search(r'^(-?\d+(\.\d*)?)-(-?\d+(\.\d*)?)$', v)
+        m = RANGE_PATTERN.search(v)
         if m is None:
             raise ValueError(f'Invalid range: {v}')
         a = (m.group(1), m.group(3))
@@ -30,12 +38,15 @@ def string_to_range(v: Union[str, list]) -> tuple:
 
 def string_to_list(v: Union[str, list[str]]) -> list:
     # v = v.replace(" ", "")
+    # (JSON bodies can send a single number as-is)
+    if isinstance(v, (int, float)):
+        return [v]
     if isinstance(v, str):
         v = v.split(",")
     return v
 
 def parse_number_or_range(v: Union[str, list]):
-    m = re.search(r'^(-?\d+(\.\d*)?)$', v)
+    m = NUMBER_PATTERN.search(v)
     # If it's a digit:
     if m:
         return v
@@ -45,6 +56,8 @@ def parse_number_or_range(v: Union[str, list]):
 def string_to_num_or_range_list(v: Union[str, list]):
     if isinstance(v, list):
         return v
+    if isinstance(v, (int, float)):
+        return [v]
     
     v_list = string_to_list(v)
     v_list = [parse_number_or_range(i) for i in v_list]
@@ -68,50 +81,44 @@ string_to_obj_map = {
     asf.validators.parse_float_or_range_list:   string_to_num_or_range_list,
 }
 
-class ValidatorMap(collections.UserDict):
+# Legacy SearchAPI keys that have new names in asf-search:
+ALIASED_KEYWORDS = {
+    'collectionname': 'campaign'
+}
+FLIGHT_DIRECTIONS = {
+    'A': 'ASCENDING',
+    'D': 'DESCENDING'
+}
+LOOK_DIRECTIONS = {
+    'R': 'R',
+    'L': 'L'
+}
+# SearchOpts doesn't know how to handle these keys, but other methods need them
+# (We still want to throw on any UNKNOWN keys)
+IGNORE_KEYS_LOWER = frozenset(["output", "pretty", "reference", "maturity", "cmr_keywords", "cmr_token", "cursor"])
+
+class Keyword(NamedTuple):
+    # The key, in the case asf_search expects:
+    key: str
+    # Turns the raw query/body value into what asf_search's validator expects (None if it's used as-is):
+    destringify: Optional[Callable]
+
+def _build_keyword_table() -> Mapping[str, Keyword]:
     """
-    For adding case-insensitive logic to the validator map, and mapping legacy keywords to ASFSearchOptions
-    i.e:
-        >>> v = ValidatorMap()
-        >>> "maxresults" in v # True
-        >>> v["mAxReSuLtS"] # Pointer to validator method
-        >>> v.actual_key_case("mAxReSuLtS") # "maxResults", what asf_search expects
+    Maps every lower-cased asf_search keyword (and legacy alias) to its Keyword. i.e:
+        >>> KEYWORD_TABLE["maxresults"].key # "maxResults", what asf_search expects
+        >>> KEYWORD_TABLE["collectionname"].key # "campaign"
     """
-    ALIASED_KEYWORDS = {
-        'collectionname': 'campaign'
-    }
-    FLIGHT_DIRECTIONS = {
-        'A': 'ASCENDING',
-        'D': 'DESCENDING'
+    table = {
+        key.lower(): Keyword(key=key, destringify=string_to_obj_map.get(validator_method))
+        for key, validator_method in validator_map.items()
     }
-    LOOK_DIRECTIONS = {
-        'R': 'R',
-        'L': 'L'
-    }
-    """
-    legacy SearchAPI keys that have new names in asf-search
-    """
+    for alias, key in ALIASED_KEYWORDS.items():
+        table[alias] = table[key.lower()]
+    return MappingProxyType(table)
 
-    def __init__(self):
-        # This sets self.data:
-        super().__init__(asf.validator_map.validator_map)
-        # value is the normalized key, key is the lower-key
-        self.lower_lookup = {k.lower(): k for k in self.data.keys()}
-    def __contains__(self, k) -> bool:
-        return k.lower() in [*self.lower_lookup.keys(), *self.ALIASED_KEYWORDS.keys()] 
-    def __getitem__(self, k):
-        key = self.ALIASED_KEYWORDS.get(k.lower(), k)
-        api_logger.debug(f"Keyword {key}")
-        corrected_case_key = self.actual_key_case(key)
-        return self.data[corrected_case_key]
-    def actual_key_case(self, k):
-        # This should raise keyerror if not found:
-        return self.lower_lookup[k.lower()]
-    def alias_params(self, params: dict) -> dict:
-            return {
-                self.ALIASED_KEYWORDS.get(k.lower(), k): v
-                for k,v in params.items()
-            }
+# Built once at import, so parsing a request is just a dict lookup per param:
+KEYWORD_TABLE = _build_keyword_table()
 
 async def get_body(request: Request):
     """
@@ -137,41 +144,105 @@ async def process_search_request(request: Request) -> SearchOptsModel:
     then it's a matter of using @model_validator to pre-process stringified lists
     """
 
-    query_params = dict(request.query_params)
-    query_opts = get_asf_opts(dict(request.query_params))
+    with log_phase('parse'):
+        query_params = dict(request.query_params)
+        body = await get_body(request)
 
-    body = await get_body(request)
-    body_opts = get_asf_opts(body)
+        # Body params win over query params. Merged before they're parsed, so a long granule_list
+        # in the body is only validated once (merge_args would validate it all over again):
+        merged_args = {**query_params, **body}
+        query_opts = get_asf_opts(merged_args)
+        update_request_context(maturity=merged_args.get('maturity', 'prod'))
+        searchOpts = build_search_opts(query_opts, merged_args, request.method)
     
-    query_opts.merge_args(**dict(body_opts))
-
-    merged_args = {**query_params, **body}
+    return searchOpts
 
-    if (token := merged_args.get('cmr_token')):
-        session = asf.ASFSession()
-        session.headers.update({'Authorization': 'Bearer {0}'.format(token)})
-        query_opts.session = session
-    
+def build_search_opts(query_opts: asf.ASFSearchOptions, merged_args: dict, request_method: str) -> SearchOptsModel:
+    """
+    Points 'query_opts' at the maturity's CMR (with a pooled session), caps maxResults, and wraps
+    it all up in a SearchOptsModel. Shared by single searches, and every query in a batch.
+    """
     output = merged_args.get('output', 'metalink')
     maturity = merged_args.get('maturity', 'prod')
     config = load_config_maturity(maturity=maturity)
     query_opts.host = config['cmr_base']
 
+    # Every request gets its own session. asf_search keeps per-search state in the session
+    # headers (CMR-Search-After), so sharing one between requests isn't safe.
+    # The connections underneath are pooled per maturity/token though:
+    query_opts.session = get_session(maturity=maturity, token=merged_args.get('cmr_token'))
+
     try:
+        # A name in a list twice would be searched for (and counted) twice:
+        for keyword in LIST_KEYWORDS:
+            if (names := getattr(query_opts, keyword)) is not None and len(deduped := dedupe_names(names)) < len(names):
+                setattr(query_opts, keyword, deduped)
+
         # we are no longer allowing unbounded searches
         if query_opts.granule_list is None and query_opts.product_list is None:
+            # No need to count first. The search just stops early if there's less than that:
             if query_opts.maxResults is None:
-                query_opts.maxResults = asf.search_count(opts=query_opts)
+                query_opts.maxResults = constants.MAX_RESULTS
             elif query_opts.maxResults <= 0:
                 raise ValueError(f'Search keyword "maxResults" must be greater than 0')
-        
-            query_opts.maxResults = min(1500, query_opts.maxResults)
+    
+            query_opts.maxResults = min(constants.MAX_RESULTS, query_opts.maxResults)
 
-        searchOpts = SearchOptsModel(opts=query_opts, output=output, merged_args=merged_args, request_method=request.method)
+        # Pages of an ndjson search (see cursor.py). List searches are only ever one page:
+        if merged_args.get('cursor') is not None:
+            if output.lower() != 'ndjson':
+                raise ValueError('Search keyword "cursor" only works with output=ndjson')
+            if query_opts.granule_list is not None or query_opts.product_list is not None:
+                raise ValueError('Cannot use search keyword "cursor" with granule_list/product_list')
+
+        return SearchOptsModel(
+            opts=query_opts,
+            output=output,
+            pretty=merged_args.get('pretty', False),
+            merged_args=merged_args,
+            request_method=request_method
+        )
     except (ValueError, ValidationError) as exc:
         raise HTTPException(detail=repr(exc), status_code=400) from exc
-    
-    return searchOpts
+
+async def process_batch_request(request: Request) -> BatchSearchOptsModel:
+    """
+    Processes request to batch endpoint. The body is a JSON list of queries (each one the same keywords
+    the param endpoint takes), or {"queries": [...]} along with anything every query should share:
+    output, maturity and cmr_token, or any search keyword. A shared search keyword is merged into every
+    query, unless the query has its own value for it. A query that fails to parse is kept as its error.
+    """
+    with log_phase('parse'):
+        body = await get_body(request)
+        shared = {**dict(request.query_params), **(body if isinstance(body, dict) else {})}
+        queries = shared.pop('queries', None) if isinstance(body, dict) else body
+        if not isinstance(queries, list):
+            raise HTTPException(detail='Expected a JSON list of queries, or {"queries": [...]}', status_code=400)
+        if not 0 < len(queries) <= constants.BATCH_MAX_QUERIES:
+            raise HTTPException(detail=f'A batch takes 1 to {constants.BATCH_MAX_QUERIES} queries, got {len(queries)}', status_code=400)
+
+        # Only the output can differ between queries. They all go to the same CMR, as the same user:
+        shared.setdefault('output', 'jsonlite')
+        maturity = shared.get('maturity', 'prod')
+        if not isinstance(maturity, str):
+            raise HTTPException(detail=f'Invalid maturity: {maturity!r}', status_code=400)
+        update_request_context(maturity=maturity)
+        parsed = []
+        for query in queries:
+            try:
+                if not isinstance(query, dict):
+                    raise HTTPException(detail=f'Expected a query (JSON object of search keywords), got {type(query).__name__}', status_code=400)
+                output = query.get('output', shared['output'])
+                if not isinstance(output, str) or output.lower() not in BatchSearchOptsModel.output_types:
+                    raise HTTPException(detail=f"Output format {output!r} unsupported in a batch. Accepted output types: {BatchSearchOptsModel.output_types}", status_code=400)
+                merged_args = {**shared, 'output': output}
+                # (A query's own maturity/cmr_token are ignored, same as any other key in IGNORE_KEYS_LOWER)
+                query_opts = get_asf_opts({**shared, **query})
+                parsed.append(build_search_opts(query_opts, merged_args, request.method))
+            except HTTPException as exc:
+                parsed.append(exc)
+
+    return BatchSearchOptsModel(queries=parsed, maturity=maturity)
 
 async def process_baseline_request(request: Request) -> BaselineSearchOptsModel:
     """Processes request to baseline endpoint"""
@@ -195,33 +266,19 @@ def get_asf_opts(params: dict) -> asf.ASFSearchOptions:
     except ValueError as exc:
         raise HTTPException(detail=repr(exc), status_code=400) from exc
     
-    ### If your key is in validator map, make it match case sensitivity:
-    validatorMap = ValidatorMap()
-    params = validatorMap.alias_params(params)
-    # You have to rebuild the dict, since you can't change keys in place
-    params = {
-        validatorMap.actual_key_case(k)
-            if k in validatorMap
-            else k:v
-        for k,v in params.items()
-    }
-
-    ### De-stringify the values if we know how:
-    for k,v in params.items():
-        if k in validatorMap:
-            validator_method = validatorMap[k]
-            # If the method is in our map, de-stringify it:
-            try:
-                if validator_method in string_to_obj_map:
-                    params[k] = string_to_obj_map[validator_method](v)
-            except ValueError as exc:
-                raise HTTPException(detail=repr(exc), status_code=400) from exc
-    
-    ### SearchOpts doesn't know how to handle these keys, but other methods need them
-    # (We still want to throw on any UNKNOWN keys)
-    ignore_keys_lower = ["output", "reference", "maturity", "cmr_keywords", "cmr_token"]
-    params = {k: params[k] for k in params.keys() if k.lower() not in ignore_keys_lower}
-
+    ### If your key is in validator map, make it match case sensitivity, and de-stringify the value if we know how:
+    normalized_params = {}
+    for k, v in params.items():
+        if (keyword := KEYWORD_TABLE.get(k.lower())) is not None:
+            k = keyword.key
+            if keyword.destringify is not None:
+                try:
+                    v = keyword.destringify(v)
+                except (TypeError, ValueError) as exc:
+                    raise HTTPException(detail=repr(exc), status_code=400) from exc
+        if k.lower() not in IGNORE_KEYS_LOWER:
+            normalized_params[k] = v
+    params = normalized_params
 
     try:
         if "granule_list" in params or "product_list" in params:
@@ -230,12 +287,12 @@ def get_asf_opts(params: dict) -> asf.ASFSearchOptions:
         
         if (flight_direction := params.get('flightDirection')) is not None:
             if isinstance(flight_direction, str) and len(flight_direction):
-                params['flightDirection'] = ValidatorMap.FLIGHT_DIRECTIONS.get(flight_direction.upper()[0], None)
+                params['flightDirection'] = FLIGHT_DIRECTIONS.get(flight_direction.upper()[0], None)
                 if params['flightDirection'] is None:
                     raise ValueError(f'Invalid value passed to search keyword "flightDirection": "{flight_direction}". Valid directions are "ASCENDING" or "DESCENDING"')
         if (lookDirection := params.get('lookDirection')) is not None:
             if isinstance(lookDirection, str) and len(lookDirection):
-                params['lookDirection'] = ValidatorMap.LOOK_DIRECTIONS.get(lookDirection.upper()[0], None)
+                params['lookDirection'] = LOOK_DIRECTIONS.get(lookDirection.upper()[0], None)
                 if params['lookDirection'] is None:
                     raise ValueError(f'Invalid value passed to search keyword "lookDirection": "{lookDirection}". Valid directions are "R" or "L"')
     except ValueError as exc:
@@ -248,5 +305,6 @@ def get_asf_opts(params: dict) -> asf.ASFSearchOptions:
 
     except (KeyError, ValueError) as exc:
         raise HTTPException(detail=repr(exc), status_code=400) from exc
-    api_logger.debug(f"asf.ASFSearchOptions object constructed: {opts})")
+    # Lazy %-formatting, so opts is only turned into a string if debug logs are actually emitted:
+    api_logger.debug("asf.ASFSearchOptions object constructed: %s", opts)
     return opts
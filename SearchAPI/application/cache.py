@@ -0,0 +1,323 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generator, Iterable, NamedTuple, Optional
+
+import asf_search as asf
+
+from SearchAPI import api_logger
+from . import constants
+
+
+class CachedResponse(NamedTuple):
+    content: bytes
+    media_type: str
+    headers: dict
+
+
+class CachedStack(NamedTuple):
+    reference: asf.ASFProduct
+    stack_opts: asf.ASFSearchOptions
+    # None until the stack itself is asked for (i.e. only its count has been so far):
+    stack: Optional[asf.ASFSearchResults]
+    # CMR hits for the stack search:
+    count: int
+
+
+class CacheBackend:
+    """
+    Where a ResponseCache keeps its entries. Subclass this to plug in another store.
+    Both methods are called from the event loop and from worker threads, so they
+    have to be thread-safe, and quick.
+    """
+    def get(self, key: str) -> Optional[CachedResponse]:
+        raise NotImplementedError()
+
+    def set(self, key: str, value: CachedResponse, ttl: float) -> None:
+        raise NotImplementedError()
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process LRU. Bounded by the total size of the cached bodies.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._size = 0
+        # key -> (CachedResponse, expires at):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: CachedResponse, ttl: float) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._size += len(value.content)
+            while self._size > self.max_bytes and self._entries:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self._size -= len(value.content)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Cache in a SQLite file, so every worker on the host can share it.
+    Bounded by the total size of the cached bodies, oldest entries evicted first.
+    """
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, content BLOB, media_type TEXT, headers TEXT,"
+            " size INTEGER, expires REAL, created REAL)"
+        )
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT content, media_type, headers FROM responses WHERE key = ? AND expires > ?",
+                (key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        content, media_type, headers = row
+        return CachedResponse(content=content, media_type=media_type, headers=json.loads(headers))
+
+    def set(self, key: str, value: CachedResponse, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, value.content, value.media_type, json.dumps(value.headers), len(value.content), now + ttl, now)
+            )
+            self._connection.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+            # Drop the oldest entries, until everything left fits in max_bytes:
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY created DESC) AS total FROM responses)"
+                " WHERE total > ?)",
+                (self.max_bytes,)
+            )
+
+
+class ResponseCache:
+    """
+    Caches rendered search responses. Entries bigger than 'max_entry_bytes' aren't cached.
+    """
+    def __init__(self, backend: CacheBackend, ttl: float, max_entry_bytes: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        try:
+            return self.backend.get(key)
+        except Exception as exc:
+            # The cache is only ever an optimization, don't fail the request over it:
+            api_logger.warning(f"Response cache lookup failed: {repr(exc)}")
+            return None
+
+    def set(self, key: str, response_info: dict) -> None:
+        content = response_info['content']
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        if len(content) > self.max_entry_bytes:
+            return
+        value = CachedResponse(content=content, media_type=response_info['media_type'], headers=dict(response_info['headers']))
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as exc:
+            api_logger.warning(f"Response cache store failed: {repr(exc)}")
+
+    def cache_stream(self, key: str, response_info: dict, is_complete: Callable[[], bool]) -> Generator[bytes, None, None]:
+        """
+        Passes a streamed body through, and caches it once the stream finishes, if 'is_complete()' says
+        it's the whole result (see CompletePages). Stops collecting as soon as it's too big to be cached.
+        """
+        # Take these now, the caller is free to swap out response_info's content/headers after this:
+        return self._tee_stream(key, response_info['content'], {**response_info, 'headers': dict(response_info['headers'])}, is_complete)
+
+    def _tee_stream(self, key: str, content: Iterable[bytes], response_info: dict, is_complete: Callable[[], bool]) -> Generator[bytes, None, None]:
+        chunks = []
+        size = 0
+        for chunk in content:
+            if chunks is not None:
+                size += len(chunk)
+                if size > self.max_entry_bytes:
+                    chunks = None
+                else:
+                    chunks.append(chunk)
+            yield chunk
+        if chunks is None:
+            return
+        if not is_complete():
+            api_logger.warning("Streamed search ended before its last page. Not caching it")
+            return
+        self.set(key, {**response_info, 'content': b''.join(chunks)})
+
+
+class CompletePages:
+    """
+    Passes a search's pages through, for 'ResponseCache.cache_stream': 'complete' is only set
+    once the last page has been read, and the search ended without raising.
+    """
+    def __init__(self, pages: Iterable[asf.ASFSearchResults]):
+        self._pages = pages
+        self.complete = False
+
+    def __iter__(self) -> Generator[asf.ASFSearchResults, None, None]:
+        yield from self._pages
+        self.complete = True
+
+
+class StackCache:
+    """
+    Baseline stacks by reference scene, so paging through one reference in different output
+    formats only goes to CMR once. Holds the products themselves (not rendered responses), so it's
+    in-process only, and bounded by the total number of products held. Least recently used go first.
+    """
+    def __init__(self, max_products: int, ttl: float):
+        self.max_products = max_products
+        self.ttl = ttl
+        self._size = 0
+        # key -> (CachedStack, expires at):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedStack]:
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: CachedStack) -> None:
+        if _stack_size(value) > self.max_products:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._size += _stack_size(value)
+            while self._size > self.max_products and self._entries:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self._size -= _stack_size(value)
+
+def _stack_size(value: CachedStack) -> int:
+    # The reference, plus the stack:
+    return 1 + (len(value.stack) if value.stack is not None else 0)
+
+
+def search_cache_key(opts: asf.ASFSearchOptions, output: str, maturity: str, pretty: bool = False) -> str:
+    """
+    Hash of everything that changes a search response. Two requests that only differ in
+    keyword case, aliases, or param order end up with the same opts, and the same key.
+    """
+    search_params = {k: v for k, v in dict(opts).items() if k != 'session'}
+    canonical = json.dumps(
+        {'opts': search_params, 'output': output.lower(), 'maturity': maturity, 'pretty': pretty},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def stack_cache_key(reference: str, opts: asf.ASFSearchOptions, maturity: str) -> str:
+    """
+    Hash of everything that changes a baseline stack. The output format isn't part of it, on purpose.
+    """
+    search_params = {k: v for k, v in dict(opts).items() if k != 'session'}
+    canonical = json.dumps({'reference': reference, 'opts': search_params, 'maturity': maturity}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def set_response_cache(cache: Optional[ResponseCache]) -> None:
+    """
+    Replaces the response cache, i.e. to plug in a different backend. None turns caching off.
+    """
+    global _response_cache
+    # Falsy, but not None, so it isn't rebuilt from the env vars:
+    _response_cache = cache if cache is not None else False
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Returns the response cache for this worker, or None if caching is turned off.
+    Built on first use from the SEARCHAPI_CACHE ('memory', 'sqlite' or 'none'), SEARCHAPI_CACHE_PATH,
+    SEARCHAPI_CACHE_TTL, SEARCHAPI_CACHE_MAX_BYTES and SEARCHAPI_CACHE_MAX_ENTRY_BYTES env vars.
+    """
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = _cache_from_env()
+    return _response_cache or None
+
+def _cache_from_env():
+    backend_name = os.environ.get('SEARCHAPI_CACHE', constants.CACHE_BACKEND).lower()
+    max_bytes = int(os.environ.get('SEARCHAPI_CACHE_MAX_BYTES', constants.CACHE_MAX_BYTES))
+    match backend_name:
+        case 'memory':
+            backend = MemoryCacheBackend(max_bytes=max_bytes)
+        case 'sqlite':
+            path = os.environ.get('SEARCHAPI_CACHE_PATH', constants.CACHE_SQLITE_PATH)
+            backend = SQLiteCacheBackend(path=path, max_bytes=max_bytes)
+        case 'none':
+            return False
+        case _:
+            raise ValueError(f"Unknown SEARCHAPI_CACHE backend '{backend_name}'. Expected 'memory', 'sqlite' or 'none'")
+    return ResponseCache(
+        backend=backend,
+        ttl=float(os.environ.get('SEARCHAPI_CACHE_TTL', constants.CACHE_TTL)),
+        max_entry_bytes=int(os.environ.get('SEARCHAPI_CACHE_MAX_ENTRY_BYTES', constants.CACHE_MAX_ENTRY_BYTES)),
+    )
+
+
+_stack_cache = None
+_stack_cache_lock = threading.Lock()
+
+def get_stack_cache() -> Optional[StackCache]:
+    """
+    Returns the baseline stack cache for this worker, or None if it's turned off.
+    Built on first use from the SEARCHAPI_STACK_CACHE_TTL and SEARCHAPI_STACK_CACHE_MAX_PRODUCTS env vars.
+    """
+    global _stack_cache
+    if _stack_cache is None:
+        with _stack_cache_lock:
+            if _stack_cache is None:
+                max_products = int(os.environ.get('SEARCHAPI_STACK_CACHE_MAX_PRODUCTS', constants.STACK_CACHE_MAX_PRODUCTS))
+                ttl = float(os.environ.get('SEARCHAPI_STACK_CACHE_TTL', constants.STACK_CACHE_TTL))
+                # Falsy, but not None, so it isn't rebuilt:
+                _stack_cache = StackCache(max_products=max_products, ttl=ttl) if max_products > 0 else False
+    return _stack_cache or None
@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+from typing import Iterator
+
+import requests
+import asf_search as asf
+
+from .asf_internals import build_subqueries
+
+
+class CMRHits:
+    """
+    Response hook for an asf_search session. CMR sends the total number of matches
+    in the 'CMR-Hits' header of every page, so this reads it off the first page of
+    each subquery, instead of needing a separate asf.search_count round-trip.
+    """
+    def __init__(self):
+        # Keyed by the request body, so a retried page isn't counted twice:
+        self._hits_by_query = {}
+        # How many subqueries there'll be, if not what asf_search would split the search into:
+        self._expected_subqueries = None
+
+    def __call__(self, response: requests.Response, *args, **kwargs) -> requests.Response:
+        # Only the first page of a subquery is sent without the search-after header:
+        if 'CMR-Search-After' not in response.request.headers:
+            if (hits := response.headers.get('CMR-Hits')) is not None:
+                self.record(response.request.body, int(hits))
+        return response
+
+    def record(self, query_body: str, hits: int) -> None:
+        """
+        Records the hits for one subquery (For searches that don't go through a session, i.e. cmr_client.py)
+        """
+        self._hits_by_query[query_body] = hits
+
+    def expect(self, subqueries: int) -> None:
+        """
+        For searches split up differently than asf_search does it (i.e. list searches, see product_lists.py)
+        """
+        self._expected_subqueries = subqueries
+
+    @property
+    def subqueries(self) -> int:
+        return len(self._hits_by_query)
+
+    @property
+    def hits(self) -> int:
+        return sum(self._hits_by_query.values())
+
+    def is_complete(self, opts: asf.ASFSearchOptions) -> bool:
+        """
+        If every subquery for 'opts' has reported its hits yet.
+        (Streamed searches only fetch the first page before responding.)
+        """
+        if self._expected_subqueries is not None:
+            return self.subqueries == self._expected_subqueries
+        return self.subqueries == len(build_subqueries(opts))
+
+
+@contextmanager
+def count_cmr_hits(session: requests.Session) -> Iterator[CMRHits]:
+    """
+    Tracks the CMR hits of every search made with 'session' inside the block.
+    """
+    hits = CMRHits()
+    session.hooks['response'].append(hits)
+    try:
+        yield hits
+    finally:
+        session.hooks['response'].remove(hits)
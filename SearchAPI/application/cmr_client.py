@@ -0,0 +1,476 @@
+"""
+An asyncio client for CMR granule searches, built on httpx.
+
+asf_search's search functions block on 'requests' for every CMR page, so each search holds
+an executor thread the whole time it's waiting on CMR. This sends the exact same queries
+(asf_search still builds them), but waits on CMR from the event loop, so one worker can have
+hundreds of searches in flight. Only the CPU work goes to threads: building the queries to the
+executor, and turning each page into ASFProducts to the parse pool (see executor.run_parse).
+"""
+import asyncio
+import itertools
+import json
+from copy import copy
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import asf_search as asf
+from asf_search.exceptions import ASFSearch4xxError, ASFSearch5xxError, ASFSearchError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+from SearchAPI import api_logger
+from SearchAPI.logger import log_phase
+from .asf_env import get_maturity, load_config_maturity
+from .asf_internals import INTERNAL, CMRIncompleteError, as_ASFProduct, build_subqueries, get_baseline_from_stack, preprocess_opts, translate_opts
+from .cmr import CMRHits
+from .cursor import CursorWalk, SearchCursor
+from .executor import run_blocking, run_parse
+from .product_lists import ListSearch, get_list_search, list_keyword
+
+# Same as asf_search, a page with fewer results than it should have is tried this many times, this many seconds apart:
+INCOMPLETE_PAGE_ATTEMPTS = 3
+INCOMPLETE_PAGE_WAIT = 2
+
+# The only headers passed on from the request's asf_search session. (The rest are for 'requests')
+FORWARDED_HEADERS = ('User-Agent', 'Authorization')
+
+
+class AsyncCMRClient:
+    """
+    Searches CMR for one maturity, over one pool of keep-alive connections.
+    Requests with a cmr_token share the pool too, the token is sent with each request.
+    Each method mirrors the asf_search function with the same name, and returns the same ASFProducts.
+    """
+    def __init__(self, max_connections: int, max_keepalive_connections: int, idle_timeout: float, page_concurrency: int, list_chunk_size: int, list_concurrency: int):
+        # CMR requests in flight at once for one search:
+        self.page_concurrency = page_concurrency
+        # Names per CMR query, and chunks searched at once, for granule_list/product_list searches:
+        self.list_chunk_size = list_chunk_size
+        self.list_concurrency = list_concurrency
+        # Only imported once a client's built, so it isn't part of the cold start (see tests/benchmarks/bench_startup.py):
+        import httpx  # pylint: disable=import-outside-toplevel
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=idle_timeout,
+            ),
+            timeout=INTERNAL.CMR_TIMEOUT,
+        )
+        # httpx's connections belong to the event loop that opened them:
+        self.loop = asyncio.get_running_loop()
+
+    async def search_pages(self, opts: asf.ASFSearchOptions, cmr_hits: CMRHits = None) -> AsyncIterator[asf.ASFSearchResults]:
+        """
+        Same as asf.search_generator: yields one page of results at a time, in the same order.
+
+        Up to 'page_concurrency' CMR requests run at once: the next page of a subquery is requested
+        as soon as the current one comes back, and the first pages of the next subqueries (i.e. the
+        chunks of a long granule_list) are fetched while the current subquery is read.
+        granule_list/product_list searches are split up differently, see '_list_pages'.
+
+        Unlike asf_search, a page CMR keeps sending incomplete raises CMRIncompleteError, instead of
+        stopping there: a streamed response would end as if that was every result.
+        """
+        opts = copy(opts)
+        max_results = opts.pop('maxResults', None)
+        if max_results is not None and (getattr(opts, 'granule_list', False) or getattr(opts, 'product_list', False)):
+            raise ValueError('Cannot use maxResults along with product_list/granule_list.')
+
+        if (list_search := get_list_search(opts, self.list_chunk_size)) is not None:
+            async for page in self._list_pages(list_search, cmr_hits):
+                yield page
+            return
+
+        opts, url, queries = await run_blocking(_build_queries, opts)
+        headers = _forwarded_headers(opts.session)
+        limit = asyncio.Semaphore(self.page_concurrency)
+        subqueries = [_PagedQuery(self, url, query_body, headers, opts.session, limit) for query_body in queries]
+        total = 0
+        try:
+            for index, subquery in enumerate(subqueries):
+                for upcoming in subqueries[index:index + self.page_concurrency]:
+                    upcoming.start()
+                subquery_count = 0
+                max_items = None if max_results is None else max_results - total
+                async for items, subquery_max_results in subquery.pages(max_items):
+                    if cmr_hits is not None and subquery_count == 0:
+                        cmr_hits.record(subquery.query_body, subquery_max_results)
+
+                    if max_results is None:
+                        page = asf.ASFSearchResults(items[:min(subquery_max_results - subquery_count, len(items))], opts=opts)
+                    else:
+                        page = asf.ASFSearchResults(items[:min(max_results - total, len(items))], opts=opts)
+                    subquery_count += len(page)
+                    total += len(page)
+                    page.searchComplete = subquery_count == subquery_max_results or total == max_results
+                    yield page
+
+                    if total == max_results:
+                        return
+                    if page.searchComplete:
+                        break
+        finally:
+            for subquery in subqueries:
+                subquery.cancel()
+
+    async def search(self, opts: asf.ASFSearchOptions, cmr_hits: CMRHits = None) -> asf.ASFSearchResults:
+        """
+        Same as asf.search: every page of results, in one list.
+        """
+        results = asf.ASFSearchResults([])
+        async for page in self.search_pages(opts, cmr_hits=cmr_hits):
+            results.extend(page)
+            results.searchComplete = page.searchComplete
+            results.searchOptions = page.searchOptions
+        results.raise_if_incomplete()
+        # List searches are already in the order the names were asked for:
+        if list_keyword(opts) is not None:
+            return results
+        try:
+            results.sort(key=lambda product: product.get_sort_keys(), reverse=True)
+        except TypeError as exc:
+            api_logger.warning(f'Failed to sort final results, leaving results unsorted. Reason: {exc}')
+        return results
+
+    async def _list_pages(self, list_search: ListSearch, cmr_hits: CMRHits = None) -> AsyncIterator[asf.ASFSearchResults]:
+        """
+        'search_pages' for a granule_list/product_list search (see product_lists.py): Up to 'list_concurrency'
+        chunks are searched at once, each one read to the end. A chunk is yielded as one page, in the
+        order the names were asked for, once it and every chunk before it is in.
+        """
+        opts, url, chunk_queries = await run_blocking(_build_chunk_queries, list_search)
+        if cmr_hits is not None:
+            cmr_hits.expect(sum(len(queries) for queries in chunk_queries))
+        headers = _forwarded_headers(opts.session)
+        # Shared by every chunk, so it's 'list_concurrency' CMR requests at once, however the chunks are paged:
+        limit = asyncio.Semaphore(self.list_concurrency)
+
+        async def search_chunk(queries: List[str]) -> List[asf.ASFProduct]:
+            products = []
+            for query_body in queries:
+                subquery = _PagedQuery(self, url, query_body, headers, opts.session, limit)
+                subquery_count = 0
+                try:
+                    async for items, subquery_max_results in subquery.pages():
+                        if cmr_hits is not None and subquery_count == 0:
+                            cmr_hits.record(query_body, subquery_max_results)
+                        items = items[:subquery_max_results - subquery_count]
+                        subquery_count += len(items)
+                        products.extend(items)
+                        if subquery_count >= subquery_max_results:
+                            break
+                finally:
+                    subquery.cancel()
+            return products
+
+        chunks = {}
+        try:
+            for index in range(len(chunk_queries)):
+                for upcoming in range(index, min(index + self.list_concurrency, len(chunk_queries))):
+                    if upcoming not in chunks:
+                        chunks[upcoming] = asyncio.create_task(search_chunk(chunk_queries[upcoming]))
+                products = await chunks.pop(index)
+                page = asf.ASFSearchResults(list_search.in_requested_order(products), opts=list_search.opts)
+                page.searchComplete = True
+                yield page
+        finally:
+            for chunk in chunks.values():
+                if not chunk.done():
+                    chunk.cancel()
+                elif not chunk.cancelled():
+                    # Nobody is going to read it. Mark any error as seen, so asyncio doesn't log it:
+                    chunk.exception()
+
+    async def cursor_page(self, opts: asf.ASFSearchOptions, cursor: SearchCursor, size: int) -> Tuple[List[asf.ASFProduct], Optional[SearchCursor]]:
+        """
+        One page of a cursor-paginated search (see cursor.py): up to 'size' products from where 'cursor'
+        left off, and the cursor for the next page (None if that was the last). The CMR pages are chained
+        by their search-after, so they're fetched one after another.
+        """
+        opts = copy(opts)
+        opts.pop('maxResults', None)
+        opts, url, queries = await run_blocking(_build_queries, opts)
+        headers = _forwarded_headers(opts.session)
+
+        walk = CursorWalk(cursor, size, len(queries))
+        while (request := walk.next_request()) is not None:
+            subquery, search_after = request
+            page_headers = headers if search_after is None else {**headers, 'CMR-Search-After': search_after}
+            for attempt in itertools.count(1):
+                response = await self._get_page(url, queries[subquery], page_headers)
+                items, hits = await run_parse(_parse_page, response.content, opts.session)
+                if walk.is_complete_page(items, hits):
+                    break
+                if attempt == INCOMPLETE_PAGE_ATTEMPTS:
+                    raise CMRIncompleteError(
+                        'CMR returned page of incomplete results. '
+                        f'Expected {min(INTERNAL.CMR_PAGE_SIZE, hits - walk.cursor.offset)} results, got {len(items)}'
+                    )
+                await asyncio.sleep(INCOMPLETE_PAGE_WAIT)
+            walk.add_page(items, hits, response.headers.get('CMR-Search-After'))
+        return walk.products, walk.next_cursor()
+
+    async def granule_search(self, granule_list: List[str], opts: asf.ASFSearchOptions) -> asf.ASFSearchResults:
+        opts = copy(opts)
+        opts.merge_args(granule_list=granule_list)
+        return await self.search(opts)
+
+    async def search_count(self, opts: asf.ASFSearchOptions) -> int:
+        """
+        Same as asf.search_count: asks CMR for zero results per subquery, and adds up the hits.
+        """
+        opts, url, queries = await run_blocking(_build_queries, copy(opts), page_size=0)
+        headers = _forwarded_headers(opts.session)
+        limit = asyncio.Semaphore(self.page_concurrency)
+
+        async def count_hits(query_body: str) -> int:
+            async with limit:
+                response = await self._get_page(url, query_body, headers)
+            return response.json()['hits']
+        return sum(await asyncio.gather(*(count_hits(query_body) for query_body in queries)))
+
+    async def stack(self, reference: asf.ASFProduct, opts: asf.ASFSearchOptions, cmr_hits: Optional[CMRHits] = None) -> asf.ASFSearchResults:
+        """
+        Same as 'reference.stack(opts)': the reference's baseline stack, with the baselines filled in.
+        """
+        opts = copy(opts)
+        opts.merge_args(**dict(reference.get_stack_opts()))
+        stack = await self.search(opts, cmr_hits)
+        return await run_blocking(_with_baselines, reference, stack)
+
+    @retry(
+        reraise=True,
+        retry=retry_if_exception_type(ASFSearch5xxError),
+        wait=wait_exponential(multiplier=1, min=3, max=10),
+        stop=stop_after_attempt(3),
+    )
+    async def _get_page(self, url: str, query_body: str, headers: dict) -> 'httpx.Response':
+        import httpx  # pylint: disable=import-outside-toplevel
+        try:
+            with log_phase('cmr'):
+                response = await self._client.post(url, content=query_body, headers={
+                    **headers,
+                    'Content-Type': 'application/x-www-form-urlencoded',
+                })
+        except httpx.TimeoutException as exc:
+            raise ASFSearchError(f'Connection Error (Timeout): CMR took too long to respond. ({url=}, timeout={INTERNAL.CMR_TIMEOUT})') from exc
+        except httpx.TransportError as exc:
+            raise ASFSearchError(f'Connection Error: Could not reach CMR. ({url=}, {exc})') from exc
+
+        if response.is_error:
+            message = f'HTTP {response.status_code}: {_cmr_errors(response)}'
+            if response.is_client_error:
+                raise ASFSearch4xxError(message)
+            raise ASFSearch5xxError(message)
+        return response
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+class _PagedQuery:
+    """
+    Fetches the pages of one subquery, in order. CMR chains them (each page's CMR-Search-After header
+    is needed to ask for the next), so they can't be fetched side by side. Instead, the next page is
+    requested as soon as the current one's response is in, and downloads while the current page
+    is turned into products (and serialized, if the response is streamed).
+    """
+    def __init__(self, client: AsyncCMRClient, url: str, query_body: str, headers: dict, session: asf.ASFSession, limit: asyncio.Semaphore):
+        self.client = client
+        self.url = url
+        self.query_body = query_body
+        self.headers = headers
+        self.session = session
+        self.limit = limit
+        # The request for the next page, and the search-after it was sent with:
+        self._next: Optional[asyncio.Task] = None
+        self._next_after: Optional[str] = None
+        self._started = False
+
+    def start(self) -> None:
+        if not self._started:
+            self._started = True
+            self._request(None)
+
+    def _request(self, search_after: Optional[str]) -> None:
+        headers = self.headers if search_after is None else {**self.headers, 'CMR-Search-After': search_after}
+
+        async def get_page() -> 'httpx.Response':
+            async with self.limit:
+                return await self.client._get_page(self.url, self.query_body, headers)
+        self._next = asyncio.create_task(get_page())
+        self._next_after = search_after
+
+    async def pages(self, max_items: int = None) -> AsyncIterator[Tuple[List[asf.ASFProduct], int]]:
+        """
+        Yields (products, hits) for each page, until CMR runs out. Stops prefetching once
+        the pages already requested should cover 'hits' (or 'max_items').
+        """
+        self.start()
+        fetched = 0
+        while self._next is not None:
+            task, search_after = self._next, self._next_after
+            self._next = None
+            for attempt in itertools.count(1):
+                response = await task
+                next_after = response.headers.get('CMR-Search-After')
+                wanted = int(response.headers.get('CMR-Hits', 0))
+                if max_items is not None:
+                    wanted = min(wanted, max_items)
+                if next_after is not None and fetched + INTERNAL.CMR_PAGE_SIZE < wanted:
+                    self._request(next_after)
+
+                items, hits = await run_parse(_parse_page, response.content, self.session)
+                # Sometimes CMR returns results with the wrong page size. Ask for the page again, same as asf_search:
+                if len(items) == INTERNAL.CMR_PAGE_SIZE or len(items) + fetched >= hits:
+                    break
+                self.cancel()
+                if attempt == INCOMPLETE_PAGE_ATTEMPTS:
+                    raise CMRIncompleteError(
+                        'CMR returned page of incomplete results. '
+                        f'Expected {min(INTERNAL.CMR_PAGE_SIZE, hits - fetched)} results, got {len(items)}'
+                    )
+                await asyncio.sleep(INCOMPLETE_PAGE_WAIT)
+                self._request(search_after)
+                task = self._next
+                self._next = None
+
+            fetched += len(items)
+            yield items, hits
+            # Whoever's reading wants more than was expected. Get it now:
+            if self._next is None and next_after is not None:
+                self._request(next_after)
+
+    def cancel(self) -> None:
+        if self._next is None:
+            return
+        if self._next.done():
+            # Nobody is going to read it. Mark any error as seen, so asyncio doesn't log it:
+            if not self._next.cancelled():
+                self._next.exception()
+        else:
+            self._next.cancel()
+        self._next = None
+
+
+def _build_queries(opts: asf.ASFSearchOptions, page_size: int = None) -> Tuple[asf.ASFSearchOptions, str, List[str]]:
+    """
+    Same prep asf_search does before searching. Returns the preprocessed opts, the
+    CMR url, and the form body for each subquery.
+    """
+    preprocess_opts(opts)
+    url = '/'.join(s.strip('/') for s in [f'https://{opts.host}', INTERNAL.CMR_GRANULE_PATH])
+    queries = []
+    for query in build_subqueries(opts):
+        translated_opts = translate_opts(query)
+        if page_size is not None:
+            translated_opts[translated_opts.index(('page_size', INTERNAL.CMR_PAGE_SIZE))] = ('page_size', page_size)
+        queries.append(urlencode(translated_opts, doseq=True))
+    return opts, url, queries
+
+def _build_chunk_queries(list_search: ListSearch) -> Tuple[asf.ASFSearchOptions, str, List[List[str]]]:
+    """
+    '_build_queries' for every chunk of a list search. Returns the subquery bodies grouped by chunk.
+    """
+    chunk_queries = []
+    for chunk in list_search.chunks:
+        opts, url, queries = _build_queries(list_search.chunk_opts(chunk))
+        chunk_queries.append(queries)
+    return opts, url, chunk_queries
+
+@log_phase('cmr')
+def _parse_page(content: bytes, session: asf.ASFSession) -> Tuple[List[asf.ASFProduct], int]:
+    page = json.loads(content)
+    return [as_ASFProduct(item, session=session) for item in page['items']], page['hits']
+
+def _with_baselines(reference: asf.ASFProduct, stack: asf.ASFSearchResults) -> asf.ASFSearchResults:
+    # The end of asf_search's 'stack_from_product':
+    is_complete = stack.searchComplete
+    stack, warnings = get_baseline_from_stack(reference=reference, stack=stack)
+    stack.searchComplete = is_complete
+    stack.sort(key=lambda product: product.properties['temporalBaseline'])
+    for warning in warnings:
+        api_logger.warning(f'{warning}')
+    return stack
+
+def _forwarded_headers(session: asf.ASFSession) -> dict:
+    return {key: session.headers[key] for key in FORWARDED_HEADERS if key in session.headers}
+
+def _cmr_errors(response: 'httpx.Response'):
+    try:
+        return response.json()['errors']
+    except (ValueError, KeyError, TypeError):
+        return response.text
+
+
+def blocking_pages(pages: AsyncIterator[asf.ASFSearchResults], prefetch: int = 1) -> Iterator[asf.ASFSearchResults]:
+    """
+    Lets a blocking serializer (i.e. 'as_stream', on the executor) read pages from 'search_pages'.
+    Call from the event loop. The next 'prefetch' pages are fetched in the background while
+    the current one is serialized, so the serializer's thread is rarely left waiting on CMR.
+    Whatever 'pages' needs done to produce a page can't go to the executor (see executor.run_parse):
+    the serializer blocks one of its threads until the page shows up.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=prefetch)
+    done = object()
+
+    async def fetch():
+        try:
+            async for page in pages:
+                await queue.put(page)
+        except Exception as exc:  # pylint: disable=broad-except
+            # Raised in the serializer, i.e. so a failed page ends the stream:
+            await queue.put(exc)
+            return
+        await queue.put(done)
+    fetcher = loop.create_task(fetch())
+
+    def read():
+        try:
+            while (page := asyncio.run_coroutine_threadsafe(queue.get(), loop).result()) is not done:
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            # If the client disconnected, stop fetching pages nobody will read:
+            if not fetcher.done() and not loop.is_closed():
+                loop.call_soon_threadsafe(fetcher.cancel)
+    return read()
+
+
+_clients = {}
+
+def get_cmr_client(maturity: str = None) -> Optional[AsyncCMRClient]:
+    """
+    Returns the AsyncCMRClient for 'maturity' (Defaults to the MATURITY env var), or None if
+    its 'cmr_client' block in maturities.yml turns it off (Use asf_search's blocking search instead).
+    Only call from the event loop.
+    """
+    maturity = get_maturity(maturity)
+    config = load_config_maturity(maturity)['cmr_client']
+    if not config['use_async']:
+        return None
+    list_config = load_config_maturity(maturity)['list_search']
+    client = _clients.get(maturity)
+    # A client can't be used from another event loop than the one that made it (i.e. tests, Mangum re-creating its loop):
+    if client is None or client.loop is not asyncio.get_running_loop():
+        client = AsyncCMRClient(
+            max_connections=config['max_connections'],
+            max_keepalive_connections=config['max_keepalive_connections'],
+            idle_timeout=config['idle_timeout'],
+            page_concurrency=config['page_concurrency'],
+            list_chunk_size=list_config['chunk_size'],
+            list_concurrency=list_config['concurrency'],
+        )
+        _clients[maturity] = client
+        api_logger.debug(f"Created async CMR client for maturity '{maturity}': {dict(config)}, list_search: {dict(list_config)}")
+    return client
+
+async def close_cmr_clients() -> None:
+    loop = asyncio.get_running_loop()
+    while _clients:
+        _, client = _clients.popitem()
+        if client.loop is loop:
+            await client.aclose()
@@ -0,0 +1,197 @@
+"""
+The columnar outputs: 'parquet' (GeoParquet) and 'arrow' (Arrow IPC stream).
+
+Built straight from each product's properties (the same ones csv/jsonlite read), as typed columns,
+so a dataframe doesn't have to guess at types from csv text. The footprint is WKB, in 'geometry'.
+The schema is fixed (COLUMNS), so every response has the same columns whatever the dataset. Anything
+else a product has (i.e. 's3Urls', 'insarStackId', other datasets' extras) goes in 'otherProperties',
+as a JSON object, so nothing csv/jsonlite would have is lost.
+Products are written 'COLUMNAR_BATCH_SIZE' at a time, one parquet row group (or arrow record batch)
+each, and every one is sent on as soon as it's written.
+Only imported when one of these outputs is asked for, pyarrow is a big import.
+"""
+import json
+from typing import Callable, Generator, Iterable, List, Optional
+
+import asf_search as asf
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from shapely.geometry import shape
+
+from . import constants
+
+
+def _str(value) -> Optional[str]:
+    return None if value is None else str(value)
+
+def _int(value) -> Optional[int]:
+    # Some datasets send numbers as strings ('287'), and some don't have one at all ('NA'):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _str_list(value) -> Optional[List[str]]:
+    if value is None:
+        return None
+    return [str(item) for item in value] if isinstance(value, list) else [str(value)]
+
+TIMESTAMP = pa.timestamp('us', tz='UTC')
+
+# (property, arrow type, what turns the property into that type). Timestamps are parsed by arrow, see '_timestamps':
+COLUMNS = (
+    ('sceneName', pa.string(), _str),
+    ('fileID', pa.string(), _str),
+    ('platform', pa.string(), _str),
+    ('sensor', pa.string(), _str),
+    ('beamModeType', pa.string(), _str),
+    ('polarization', pa.string(), _str),
+    ('flightDirection', pa.string(), _str),
+    ('processingLevel', pa.string(), _str),
+    ('granuleType', pa.string(), _str),
+    ('groupID', pa.string(), _str),
+    ('orbit', pa.int64(), _int),
+    ('pathNumber', pa.int32(), _int),
+    ('frameNumber', pa.int32(), _int),
+    ('startTime', TIMESTAMP, _str),
+    ('stopTime', TIMESTAMP, _str),
+    ('processingDate', TIMESTAMP, _str),
+    ('centerLat', pa.float64(), _float),
+    ('centerLon', pa.float64(), _float),
+    ('faradayRotation', pa.float64(), _float),
+    ('offNadirAngle', pa.float64(), _float),
+    ('temporalBaseline', pa.int32(), _int),
+    ('perpendicularBaseline', pa.float64(), _float),
+    ('bytes', pa.int64(), _int),
+    ('md5sum', pa.string(), _str),
+    ('url', pa.string(), _str),
+    ('fileName', pa.string(), _str),
+    ('browse', pa.list_(pa.string()), _str_list),
+    ('pgeVersion', pa.string(), _str),
+)
+COLUMN_NAMES = frozenset(name for name, _, _ in COLUMNS)
+
+# GeoParquet (1.0.0) metadata, so geopandas and friends know 'geometry' is the footprint:
+GEO_METADATA = {
+    'version': '1.0.0',
+    'primary_column': 'geometry',
+    'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': ['Polygon', 'MultiPolygon'], 'crs': None}},
+}
+
+SCHEMA = pa.schema(
+    [pa.field(name, arrow_type) for name, arrow_type, _ in COLUMNS]
+    + [pa.field('otherProperties', pa.string()), pa.field('geometry', pa.binary())],
+    metadata={b'geo': json.dumps(GEO_METADATA).encode('utf-8')},
+)
+
+
+def record_batch(products: List[asf.ASFProduct]) -> pa.RecordBatch:
+    """
+    One column at a time, straight from the products' properties.
+    """
+    properties = [product.properties for product in products]
+    columns = []
+    for name, arrow_type, convert in COLUMNS:
+        values = [convert(props.get(name)) for props in properties]
+        if arrow_type == TIMESTAMP:
+            columns.append(_timestamps(values))
+        else:
+            columns.append(pa.array(values, type=arrow_type))
+    columns.append(pa.array([_other_properties(props) for props in properties], type=pa.string()))
+    footprints = [shape(product.geometry) if product.geometry else None for product in products]
+    columns.append(pa.array(shapely.to_wkb(footprints), type=pa.binary()))
+    return pa.RecordBatch.from_arrays(columns, schema=SCHEMA)
+
+def _other_properties(properties: dict) -> Optional[str]:
+    other = {name: value for name, value in properties.items() if name not in COLUMN_NAMES}
+    return json.dumps(other, default=str) if other else None
+
+def _timestamps(values: List[Optional[str]]) -> pa.Array:
+    try:
+        return pa.array(values, type=pa.string()).cast(TIMESTAMP)
+    except pa.ArrowInvalid:
+        # Something in there isn't ISO 8601 with a zone. Sort it out one at a time:
+        return pa.array([_timestamp(value) for value in values], type=TIMESTAMP)
+
+def _timestamp(value: Optional[str]):
+    for candidate in (value, f'{value}Z'):
+        try:
+            return pa.scalar(candidate, type=pa.string()).cast(TIMESTAMP)
+        except (pa.ArrowInvalid, TypeError):
+            continue
+    return None
+
+def _batches(pages: Iterable[asf.ASFSearchResults], batch_size: int) -> Generator[pa.RecordBatch, None, None]:
+    # Re-batched from CMR's pages, so the row groups aren't as small as one page:
+    products = []
+    for page in pages:
+        products.extend(page)
+        while len(products) >= batch_size:
+            yield record_batch(products[:batch_size])
+            products = products[batch_size:]
+    if products:
+        yield record_batch(products)
+
+
+class _Drain:
+    """
+    A write-only file for pyarrow's writers, where whatever's been written so far can be taken out.
+    """
+    def __init__(self):
+        self._buffer = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._buffer.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b''.join(self._buffer)
+        self._buffer = []
+        return data
+
+
+def _write_stream(open_writer: Callable, pages: Iterable[asf.ASFSearchResults], batch_size: int) -> Generator[bytes, None, None]:
+    drain = _Drain()
+    writer = open_writer(drain)
+    for batch in _batches(pages, batch_size):
+        writer.write_batch(batch)
+        if data := drain.take():
+            yield data
+    writer.close()
+    yield drain.take()
+
+def parquet_stream(pages: Iterable[asf.ASFSearchResults], batch_size: int = constants.COLUMNAR_BATCH_SIZE) -> Generator[bytes, None, None]:
+    """
+    The products in 'pages' as a parquet file, one row group per 'batch_size' products.
+    """
+    def open_writer(sink):
+        return pq.ParquetWriter(sink, SCHEMA, compression='zstd')
+    yield from _write_stream(open_writer, pages, batch_size)
+
+def arrow_stream(pages: Iterable[asf.ASFSearchResults], batch_size: int = constants.COLUMNAR_BATCH_SIZE) -> Generator[bytes, None, None]:
+    """
+    The products in 'pages' as an Arrow IPC stream, one record batch per 'batch_size' products.
+    """
+    def open_writer(sink):
+        return pa.ipc.new_stream(sink, SCHEMA)
+    yield from _write_stream(open_writer, pages, batch_size)
@@ -0,0 +1,179 @@
+"""
+Content-Encoding for the search and baseline responses, picked from the request's Accept-Encoding.
+
+gzip is always there. br (brotli) and zstd are used if their packages ('brotli', 'zstandard') are
+installed, and preferred over gzip when the client takes them. Bodies smaller than
+COMPRESSION_MIN_BYTES are sent as-is, and each output has its own levels (see constants.COMPRESSION_LEVELS),
+outputs without any (count, parquet) are never compressed.
+Streamed bodies are compressed a chunk at a time, and flushed after each one, so the client still
+gets every chunk as soon as it's rendered.
+"""
+import importlib.util
+import os
+import zlib
+from typing import Generator, Iterable, Optional
+
+from fastapi import Request
+
+from . import constants
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        # wbits=31: the gzip container, not raw zlib:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, level: int):
+        import brotli  # pylint: disable=import-outside-toplevel
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self, level: int):
+        import zstandard  # pylint: disable=import-outside-toplevel
+        self._zstandard = zstandard
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(self._zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(self._zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# What we can send, best first. Used to break ties between encodings the client likes the same.
+# The brotli and zstandard packages are only imported by the first response that uses them:
+ENCODERS = {
+    name: encoder for name, encoder, available in (
+        ('zstd', _Zstd, importlib.util.find_spec('zstandard') is not None),
+        ('br', _Brotli, importlib.util.find_spec('brotli') is not None),
+        ('gzip', _Gzip, True),
+    ) if available
+}
+
+
+def compression_enabled() -> bool:
+    """
+    If responses should be compressed at all. (see constants.COMPRESSION)
+    """
+    return os.environ.get('SEARCHAPI_COMPRESSION', str(constants.COMPRESSION)).upper() == 'TRUE'
+
+def min_bytes() -> int:
+    return int(os.environ.get('SEARCHAPI_COMPRESSION_MIN_BYTES', constants.COMPRESSION_MIN_BYTES))
+
+def is_compressible(output: str) -> bool:
+    return compression_enabled() and output.lower() in constants.COMPRESSION_LEVELS
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    The encoding to send, out of an Accept-Encoding header. None for no encoding (identity).
+    Takes q-values and '*' into account. 'q=0' means never.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            weights[name] = quality
+
+    wildcard = weights.get('*', 0.0)
+    best, best_weight = None, 0.0
+    for name in ENCODERS:
+        weight = weights.get(name, wildcard)
+        # Strictly greater, so ties go to whichever comes first in ENCODERS:
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+def response_encoding(request: Request, output: str) -> Optional[str]:
+    """
+    The encoding a response in 'output' should go out in, for this request. None to send it as-is.
+    """
+    if not is_compressible(output):
+        return None
+    return negotiate(request.headers.get('accept-encoding'))
+
+def add_vary(response_info: dict, output: str) -> None:
+    # Caches in front of us need to know the body depends on Accept-Encoding,
+    # whether or not this one ended up compressed:
+    if is_compressible(output):
+        response_info['headers']['Vary'] = 'Accept-Encoding'
+
+def _encoder(encoding: str, output: str):
+    return ENCODERS[encoding](constants.COMPRESSION_LEVELS[output.lower()][encoding])
+
+def _encoded(response_info: dict, encoding: str, content) -> dict:
+    return {
+        **response_info,
+        'content': content,
+        'headers': {**response_info['headers'], 'Content-Encoding': encoding},
+    }
+
+
+def compress(response_info: dict, encoding: Optional[str], output: str) -> dict:
+    """
+    'response_info' with its (bytes) content compressed in 'encoding'. Or as it is, if there's
+    no encoding, or it's too small to bother. Blocking, run it on the executor.
+    """
+    add_vary(response_info, output)
+    content = response_info['content']
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    if encoding is None or len(content) < min_bytes():
+        return response_info
+    encoder = _encoder(encoding, output)
+    return _encoded(response_info, encoding, encoder.compress(content) + encoder.finish())
+
+def compress_stream(response_info: dict, encoding: Optional[str], output: str) -> dict:
+    """
+    Same as 'compress', for a streamed body. Blocking: Pulls chunks until there's at least
+    COMPRESSION_MIN_BYTES (the streams' chunks are bigger than that, so usually just the first one).
+    If the whole body is smaller, it's sent as-is. Otherwise, the rest is compressed as it streams.
+    """
+    add_vary(response_info, output)
+    if encoding is None:
+        return response_info
+
+    content = iter(response_info['content'])
+    head = []
+    size = 0
+    threshold = min_bytes()
+    for chunk in content:
+        head.append(chunk)
+        size += len(chunk)
+        if size >= threshold:
+            break
+    else:
+        return {**response_info, 'content': iter(head)}
+    return _encoded(response_info, encoding, _compressed_stream(_encoder(encoding, output), head, content))
+
+def _compressed_stream(encoder, head: list, content: Iterable[bytes]) -> Generator[bytes, None, None]:
+    yield encoder.compress(b''.join(head))
+    for chunk in content:
+        if data := encoder.compress(chunk):
+            yield data
+    yield encoder.finish()
@@ -1,4 +1,88 @@
 DEFAULT_HEADERS={
-    'Access-Control-Expose-Headers': 'Content-Disposition',
+    'Access-Control-Expose-Headers': 'Content-Disposition, CMR-Hits, X-Cache, Next-Cursor',
     'Access-Control-Allow-Origin': '*'
 }
+
+# The most results a single search can return:
+MAX_RESULTS=1500
+
+# Blocking work (CMR queries, serializing) per worker. Override with
+# the SEARCHAPI_EXECUTOR_WORKERS / SEARCHAPI_EXECUTOR_QUEUE_DEPTH env vars:
+EXECUTOR_WORKERS=16
+EXECUTOR_QUEUE_DEPTH=64
+# Seconds to tell clients to wait, when the executor is full:
+EXECUTOR_RETRY_AFTER=5
+# Threads that turn CMR pages into products, kept apart from the executor (see executor.run_parse).
+# Override with the SEARCHAPI_PARSE_WORKERS env var:
+PARSE_WORKERS=4
+
+# Minimum size (in characters) of each chunk in a streamed response:
+STREAM_CHUNK_SIZE=64*1024
+# Products per parquet row group / arrow record batch (see columnar.py). Each one is sent on once it's written:
+COLUMNAR_BATCH_SIZE=500
+
+# Content-Encoding (gzip, or br/zstd if 'brotli'/'zstandard' are installed) for the search and baseline
+# responses, see compression.py. Bodies under COMPRESSION_MIN_BYTES go out as-is. Override with the
+# SEARCHAPI_COMPRESSION ('TRUE' or 'FALSE') / SEARCHAPI_COMPRESSION_MIN_BYTES env vars:
+COMPRESSION=True
+COMPRESSION_MIN_BYTES=1024
+# Levels per output. Streams are compressed as they're rendered, so these stay at the fast end.
+# The xml outputs are mostly repeated markup, and squeeze down about as well at lower levels.
+# arrow is binary, higher levels barely help it. Outputs missing here (count, parquet) are never compressed:
+_TEXT_LEVELS={'gzip': 6, 'br': 5, 'zstd': 3}
+_XML_LEVELS={'gzip': 4, 'br': 4, 'zstd': 3}
+COMPRESSION_LEVELS={
+    'csv': _TEXT_LEVELS,
+    'json': _TEXT_LEVELS,
+    'jsonlite': _TEXT_LEVELS,
+    'jsonlite2': _TEXT_LEVELS,
+    'geojson': _TEXT_LEVELS,
+    'ndjson': _TEXT_LEVELS,
+    'kml': _XML_LEVELS,
+    'metalink': _XML_LEVELS,
+    # Small, and cached (see download.py), so it can afford more:
+    'download': {'gzip': 9, 'br': 9, 'zstd': 9},
+    'arrow': {'gzip': 1, 'br': 3, 'zstd': 1},
+}
+
+# Search response cache. Override with the SEARCHAPI_CACHE* env vars (see cache.py):
+CACHE_BACKEND='memory'
+CACHE_SQLITE_PATH='/tmp/searchapi-cache.sqlite'
+CACHE_TTL=300
+CACHE_MAX_BYTES=256*1024*1024
+CACHE_MAX_ENTRY_BYTES=32*1024*1024
+
+# Baseline stacks, cached by reference scene (see cache.StackCache). Bounded by the products held,
+# at roughly 20KB each. Override with SEARCHAPI_STACK_CACHE_TTL / SEARCHAPI_STACK_CACHE_MAX_PRODUCTS (0 turns it off):
+STACK_CACHE_TTL=900
+STACK_CACHE_MAX_PRODUCTS=10000
+
+# Download scripts, cached by their url list (see download.py). Shared by every maturity on a worker.
+# Override the size with SEARCHAPI_DOWNLOAD_SCRIPT_CACHE_MAX_BYTES:
+DOWNLOAD_SCRIPT_CACHE_TTL=3600
+DOWNLOAD_SCRIPT_CACHE_MAX_BYTES=64*1024*1024
+
+# Validated/repaired AOIs kept, by their (normalized) WKT. A big multipolygon can take up a few hundred KB
+# once repaired. Override with SEARCHAPI_WKT_CACHE_SIZE:
+WKT_CACHE_SIZE=256
+
+# Uploads to /services/utils/files_to_wkt. Checked while the upload streams in:
+FILES_TO_WKT_MAX_FILES=20
+FILES_TO_WKT_MAX_FILE_BYTES=10*1024*1024
+FILES_TO_WKT_MAX_TOTAL_BYTES=25*1024*1024
+# Shapes with more vertices than this are simplified before they're validated:
+FILES_TO_WKT_MAX_VERTICES=10000
+
+# /services/search/batch: the most queries one batch can have, and how many of them run at once:
+BATCH_MAX_QUERIES=500
+BATCH_CONCURRENCY=8
+
+# If HEAD requests on the search endpoints also get CMR-Hits (and Content-Length, when it's known
+# without rendering anything), from the cache or a count-only search. Otherwise they never touch CMR.
+# Override with the SEARCHAPI_HEAD_HITS env var ('TRUE' or 'FALSE'):
+HEAD_HITS=False
+
+# Seconds between background CMR health probes, and the most a '/health?deep=true'
+# waits on a live one. Override with SEARCHAPI_HEALTH_INTERVAL / SEARCHAPI_HEALTH_TIMEOUT:
+HEALTH_CHECK_INTERVAL=30
+HEALTH_CHECK_TIMEOUT=5
@@ -0,0 +1,162 @@
+"""
+Cursor pagination, for walking through more results than one search can return (output=ndjson).
+
+Each page is up to 'maxResults' products, along with a cursor for the next page (the Next-Cursor
+header). Send it back as 'cursor', with the same search params, to pick up where the page left off.
+A cursor is CMR's search-after for the next CMR page to read (plus how many of that page were already
+sent), so no page is searched twice, and the server never holds more than one page.
+Cursors aren't signed, so nothing in one is trusted beyond where to pick up in the same search:
+it's checked field by field, and the hit count is asked for again on every page.
+"""
+import base64
+import binascii
+import copy
+import hashlib
+import json
+from typing import List, NamedTuple, Optional, Tuple
+
+import asf_search as asf
+import orjson
+from fastapi import HTTPException
+
+from .asf_internals import INTERNAL, build_subqueries, preprocess_opts, query_cmr, translate_opts
+
+# Bumped if the fields change, so old cursors are turned away instead of misread:
+CURSOR_VERSION = 2
+
+
+class SearchCursor(NamedTuple):
+    # Which search the cursor belongs to (see 'cursor_query_key'):
+    query: str
+    # The subquery (see asf_search's 'build_subqueries') the next page starts in:
+    subquery: int
+    # CMR-Search-After for the CMR page the next page starts in. None for the subquery's first:
+    search_after: Optional[str]
+    # Products of the subquery before that CMR page, and how many of that page were already sent:
+    offset: int
+    skip: int
+
+
+def cursor_query_key(opts: asf.ASFSearchOptions, maturity: str) -> str:
+    """
+    Short hash of the search 'opts' makes, so a cursor can't be used with a different one.
+    The page size (maxResults) can change between pages.
+    """
+    search_params = {k: v for k, v in dict(opts).items() if k not in ('session', 'maxResults')}
+    canonical = json.dumps({'opts': search_params, 'maturity': maturity}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+def first_cursor(query: str) -> SearchCursor:
+    return SearchCursor(query=query, subquery=0, search_after=None, offset=0, skip=0)
+
+def encode_cursor(cursor: SearchCursor) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([CURSOR_VERSION, *cursor])).rstrip(b'=').decode('ascii')
+
+def decode_cursor(token: str, query: str) -> SearchCursor:
+    """
+    The SearchCursor in 'token'. 400's if it's not one, or it's for another search than 'query'.
+    """
+    try:
+        version, *fields = orjson.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, orjson.JSONDecodeError, TypeError, ValueError) as exc:
+        raise HTTPException(detail=f'Invalid cursor: "{token}"', status_code=400) from exc
+    if isinstance(version, int) and version != CURSOR_VERSION:
+        raise HTTPException(detail='Cursor is from an older version of the API, start the search over', status_code=400)
+    # Anyone can send anything as a cursor. Check every field, before any of it's used:
+    if version != CURSOR_VERSION or len(fields) != len(SearchCursor._fields) or not _is_valid(cursor := SearchCursor(*fields)):
+        raise HTTPException(detail=f'Invalid cursor: "{token}"', status_code=400)
+    if cursor.query != query:
+        raise HTTPException(detail='Cursor is for a different search. Send the same search params as the first page', status_code=400)
+    return cursor
+
+def _is_valid(cursor: SearchCursor) -> bool:
+    def is_count(value) -> bool:
+        # (bool is an int too)
+        return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+    return (
+        isinstance(cursor.query, str)
+        and is_count(cursor.subquery)
+        # Goes to CMR as a header:
+        and (cursor.search_after is None or (isinstance(cursor.search_after, str) and cursor.search_after.isascii() and cursor.search_after.isprintable()))
+        and is_count(cursor.offset)
+        # Never past the CMR page it's in:
+        and is_count(cursor.skip) and cursor.skip < INTERNAL.CMR_PAGE_SIZE
+    )
+
+
+class CursorWalk:
+    """
+    Works out which CMR pages one cursor page needs, as they come in. CMR pages are always
+    CMR_PAGE_SIZE, so the search-after of one (and how much of it was sent) is a position
+    that the next request can pick back up from.
+    """
+    def __init__(self, cursor: SearchCursor, size: int, subqueries: int):
+        self.cursor = cursor
+        self.size = size
+        self.subqueries = subqueries
+        self.products: List[asf.ASFProduct] = []
+        self._full = False
+
+    def next_request(self) -> Optional[Tuple[int, Optional[str]]]:
+        """
+        (subquery, search-after) of the next CMR page to fetch, or None if the page is done.
+        """
+        if self._full or self.cursor.subquery >= self.subqueries:
+            return None
+        return self.cursor.subquery, self.cursor.search_after
+
+    def is_complete_page(self, items: list, hits: int) -> bool:
+        # Sometimes CMR returns results with the wrong page size (Same check as asf_search):
+        return len(items) == INTERNAL.CMR_PAGE_SIZE or self.cursor.offset + len(items) >= hits
+
+    def add_page(self, items: list, hits: int, next_search_after: Optional[str]) -> None:
+        cursor = self.cursor
+        unsent = items[cursor.skip:]
+        room = self.size - len(self.products)
+        if len(unsent) > room:
+            # The next page starts part way into this one:
+            self.products.extend(unsent[:room])
+            self.cursor = cursor._replace(skip=cursor.skip + room)
+            self._full = True
+            return
+
+        self.products.extend(unsent)
+        if next_search_after is not None and cursor.offset + len(items) < hits:
+            self.cursor = cursor._replace(search_after=next_search_after, offset=cursor.offset + len(items), skip=0)
+        else:
+            self.cursor = cursor._replace(subquery=cursor.subquery + 1, search_after=None, offset=0, skip=0)
+        self._full = len(self.products) == self.size
+
+    def next_cursor(self) -> Optional[SearchCursor]:
+        """
+        Where the next page starts, or None if this was the last one.
+        """
+        if self.cursor.subquery >= self.subqueries:
+            return None
+        return self.cursor
+
+
+def cursor_page(opts: asf.ASFSearchOptions, cursor: SearchCursor, size: int) -> Tuple[List[asf.ASFProduct], Optional[SearchCursor]]:
+    """
+    Blocking version of 'AsyncCMRClient.cursor_page', for when that's turned off (use_async: False).
+    """
+    opts = copy.copy(opts)
+    opts.pop('maxResults', None)
+    preprocess_opts(opts)
+    url = '/'.join(s.strip('/') for s in [f'https://{opts.host}', INTERNAL.CMR_GRANULE_PATH])
+    queries = [translate_opts(query) for query in build_subqueries(opts)]
+    session = opts.session
+
+    walk = CursorWalk(cursor, size, len(queries))
+    while (request := walk.next_request()) is not None:
+        subquery, search_after = request
+        # Same as asf_search, the search-after goes in the session's headers (Every request has its own session):
+        if search_after is not None:
+            session.headers['CMR-Search-After'] = search_after
+        try:
+            # (Retries pages with the wrong page size)
+            items, hits, next_search_after = query_cmr(session, url, queries[subquery], walk.cursor.offset)
+        finally:
+            session.headers.pop('CMR-Search-After', None)
+        walk.add_page(items, hits, next_search_after)
+    return walk.products, walk.next_cursor()
@@ -0,0 +1,145 @@
+"""
+Builds the 'download' output: the python script that downloads every file in the results.
+
+The bulk-download API builds it from the list of urls. That's an extra round-trip on every
+download request, so:
+ - The POST goes out on a small event loop of the client's own (one thread per worker), so the
+   connections are pooled across requests, whichever thread or loop is serializing.
+ - It gets 'timeout' seconds. Past that (or if the API errors), the script is rendered here instead.
+ - Scripts are cached by their url list, so paging through the same results only asks once.
+   The API is always asked with SCRIPT_FILENAME_PLACEHOLDER as the filename, and each response's
+   own filename is filled in afterwards, so one cached script works for every request.
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import threading
+from typing import Iterable, Iterator, List, Mapping
+
+import asf_search as asf
+
+from SearchAPI import api_logger
+from SearchAPI.logger import log_phase
+from .asf_env import get_maturity, load_config_maturity
+from .cache import CachedResponse, MemoryCacheBackend
+from .script_template import DEFAULT_FILENAME, render_script
+from . import constants
+
+# Stands in for the filename in scripts from the bulk-download API (it writes it into the usage text):
+SCRIPT_FILENAME_PLACEHOLDER = 'searchapi-download-script-filename.py'
+
+
+class BulkDownloadClient:
+    def __init__(self, url: str, timeout: float, max_connections: int, max_keepalive_connections: int, idle_timeout: float, script_cache: MemoryCacheBackend = None):
+        self.url = url
+        self.timeout = timeout
+        self.script_cache = script_cache
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="searchapi-bulk-download", daemon=True)
+        self._thread.start()
+        # Only imported once a client's built, so it isn't part of the cold start (see tests/benchmarks/bench_startup.py):
+        import httpx  # pylint: disable=import-outside-toplevel
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=idle_timeout,
+            ),
+        )
+
+    def script(self, urls: Iterable[str], filename: str = None) -> str:
+        """
+        The download script for 'urls'. Blocking, call from a worker thread (i.e. while serializing).
+        """
+        urls = list(urls)
+        filename = filename or DEFAULT_FILENAME
+        # Each maturity has its own API, but they share the cache:
+        key = script_cache_key(self.url, urls)
+        if self.script_cache is not None and (cached := self.script_cache.get(key)) is not None:
+            return _with_filename(cached.content.decode('utf-8'), filename)
+
+        import httpx  # pylint: disable=import-outside-toplevel
+        future = asyncio.run_coroutine_threadsafe(self._post(urls, SCRIPT_FILENAME_PLACEHOLDER), self._loop)
+        try:
+            with log_phase('bulk_download'):
+                script = future.result(timeout=self.timeout)
+        except (concurrent.futures.TimeoutError, httpx.HTTPError) as exc:
+            future.cancel()
+            api_logger.warning(f"Bulk-download API didn't build the script ({repr(exc)}). Rendering it locally instead")
+            return render_script(urls, filename)
+
+        if self.script_cache is not None:
+            self.script_cache.set(key, CachedResponse(content=script.encode('utf-8'), media_type='text/x-python', headers={}), ttl=constants.DOWNLOAD_SCRIPT_CACHE_TTL)
+        return _with_filename(script, filename)
+
+    async def _post(self, urls: List[str], filename: str = None) -> str:
+        # Optional filename, so it lines up with our headers:
+        script_data = {'products': ','.join(urls)}
+        if filename:
+            script_data['filename'] = filename
+        response = await self._client.post(self.url, data=script_data)
+        response.raise_for_status()
+        return response.text
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(timeout=self.timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=self.timeout)
+
+
+def download_urls(pages: Iterable[asf.ASFSearchResults]) -> Iterator[str]:
+    """
+    Every file url in 'pages', read as the pages come in.
+    """
+    file_type = asf.FileDownloadType.DEFAULT_FILE
+    for page in pages:
+        for product in page:
+            yield from product.get_urls(fileType=file_type)
+
+def script_cache_key(api_url: str, urls: List[str]) -> str:
+    digest = hashlib.sha256(api_url.encode('utf-8') + b'\n')
+    for url in urls:
+        digest.update(url.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+def _with_filename(script: str, filename: str) -> str:
+    return script.replace(SCRIPT_FILENAME_PLACEHOLDER, filename)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+_script_cache = None
+
+def get_bulk_download_client(maturity: str = None) -> BulkDownloadClient:
+    """
+    Returns the BulkDownloadClient for 'maturity' (Defaults to the MATURITY env var), set up from
+    its 'bulk_download' block in maturities.yml. Every maturity shares one script cache, sized with
+    the SEARCHAPI_DOWNLOAD_SCRIPT_CACHE_MAX_BYTES env var.
+    """
+    global _script_cache
+    maturity = get_maturity(maturity)
+    if (client := _clients.get(maturity)) is None:
+        with _clients_lock:
+            if (client := _clients.get(maturity)) is None:
+                config = load_config_maturity(maturity)
+                client_config: Mapping = config['bulk_download']
+                if _script_cache is None:
+                    max_bytes = int(os.environ.get('SEARCHAPI_DOWNLOAD_SCRIPT_CACHE_MAX_BYTES', constants.DOWNLOAD_SCRIPT_CACHE_MAX_BYTES))
+                    _script_cache = MemoryCacheBackend(max_bytes=max_bytes)
+                client = BulkDownloadClient(url=config['bulk_download_api'], script_cache=_script_cache, **client_config)
+                _clients[maturity] = client
+                api_logger.debug(f"Created bulk-download client for maturity '{maturity}': {dict(client_config)}")
+    return client
+
+async def close_bulk_download_clients() -> None:
+    """
+    Closes every client, side by side. Closing one blocks (up to its 'timeout') while its own loop
+    shuts down, so that's done on threads, not the event loop calling this.
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    await asyncio.gather(*(asyncio.to_thread(client.close) for client in clients))
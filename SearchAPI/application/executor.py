@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterable
+
+from fastapi import HTTPException
+
+from SearchAPI import api_logger
+from . import constants
+
+
+class BoundedExecutor:
+    """
+    Runs blocking calls (asf_search/CMR, serializers, etc) on a worker thread-pool,
+    so they don't freeze the event loop for every other request.
+
+    At most 'max_workers' calls run at once, and at most 'queue_depth' more can wait
+    for a free thread. Anything past that is rejected with a 503, instead of piling up.
+    A streamed response counts as one call for as long as it streams (see 'iterate').
+    """
+    def __init__(self, max_workers: int, queue_depth: int):
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="searchapi-worker")
+        self._slots = threading.BoundedSemaphore(max_workers + queue_depth)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        self._take_slot()
+        try:
+            # Copy the context, so contextvars (i.e. logging info) follow the call into the thread:
+            context = contextvars.copy_context()
+            future = self._pool.submit(context.run, func, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Only free the slot once the thread is actually done. If the client disconnects,
+        # the work keeps running, and should keep counting against the limit:
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    def iterate(self, iterator: Iterable) -> AsyncIterator:
+        """
+        Pulls each item of a blocking iterator on the thread-pool, i.e. for streamed responses.
+        The stream takes a slot now, and holds it until it ends (or is dropped): its serializer holds a
+        thread most of that time, waiting on the next page. So a 503 is raised here, while it still can be,
+        not once the response has started.
+        """
+        self._take_slot()
+        return _SlotStream(self._pool, iter(iterator), self._slots.release)
+
+    def _take_slot(self) -> None:
+        if not self._slots.acquire(blocking=False):
+            api_logger.warning(f"Executor full ({self.max_workers} workers, {self.queue_depth} queued). Rejecting request.")
+            raise HTTPException(
+                detail="Server is too busy to handle this request. Please try again later.",
+                status_code=503,
+                headers={'Retry-After': str(constants.EXECUTOR_RETRY_AFTER)}
+            )
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+
+class _SlotStream:
+    """
+    'BoundedExecutor.iterate's stream. Gives its slot back once, however it ends: run out, raised,
+    closed, cancelled (i.e. the client disconnected), or dropped without ever being started.
+    """
+    def __init__(self, pool: ThreadPoolExecutor, iterator: Iterable, release: Callable):
+        self._pool = pool
+        self._iterator = iterator
+        self._release = release
+        self._context = contextvars.copy_context()
+        self._done = object()
+        self._released = False
+
+    def __aiter__(self) -> '_SlotStream':
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._released:
+            raise StopAsyncIteration
+        try:
+            item = await asyncio.wrap_future(self._pool.submit(self._context.run, next, self._iterator, self._done))
+        except BaseException:
+            self.release()
+            raise
+        if item is self._done:
+            self.release()
+            raise StopAsyncIteration
+        return item
+
+    async def aclose(self) -> None:
+        self.release()
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._release()
+
+    def __del__(self):
+        self.release()
+
+
+_executor = None
+_parse_pool = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> BoundedExecutor:
+    """
+    Returns the executor for this worker, creating it on first use.
+    Size is set with the SEARCHAPI_EXECUTOR_WORKERS and SEARCHAPI_EXECUTOR_QUEUE_DEPTH env vars.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = int(os.environ.get("SEARCHAPI_EXECUTOR_WORKERS", constants.EXECUTOR_WORKERS))
+                queue_depth = int(os.environ.get("SEARCHAPI_EXECUTOR_QUEUE_DEPTH", constants.EXECUTOR_QUEUE_DEPTH))
+                if max_workers <= 0 or queue_depth < 0:
+                    raise ValueError(f"Invalid executor size: {max_workers=}, {queue_depth=}")
+                _executor = BoundedExecutor(max_workers=max_workers, queue_depth=queue_depth)
+    return _executor
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """
+    Runs a blocking function on this worker's executor, and waits for the result.
+    Raises a 503 HTTPException if the executor's queue is full.
+    """
+    return await get_executor().run(func, *args, **kwargs)
+
+def get_parse_pool() -> ThreadPoolExecutor:
+    """
+    Returns the pool 'run_parse' runs on for this worker, creating it on first use.
+    Size is set with the SEARCHAPI_PARSE_WORKERS env var.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        with _executor_lock:
+            if _parse_pool is None:
+                max_workers = int(os.environ.get("SEARCHAPI_PARSE_WORKERS", constants.PARSE_WORKERS))
+                if max_workers <= 0:
+                    raise ValueError(f"Invalid parse pool size: {max_workers=}")
+                _parse_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="searchapi-parse")
+    return _parse_pool
+
+async def run_parse(func: Callable, *args, **kwargs) -> Any:
+    """
+    Runs a blocking function on a small pool of its own, NOT the executor. For work that a thread on the
+    executor can be left waiting on: A streamed response's serializer (on the executor) waits for the next
+    CMR page to be turned into products. If that ran on the executor too, then once every thread there
+    was a serializer waiting on a page, nothing would be left to parse one, and they'd wait forever.
+    Never rejected: each search only has a page or two waiting on it at a time.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.wrap_future(get_parse_pool().submit(context.run, func, *args, **kwargs))
+
+def iterate_blocking(iterator: Iterable) -> AsyncIterator:
+    """
+    Wraps a blocking iterator (i.e. an 'as_stream' body) so each item is pulled on this worker's executor.
+    Raises a 503 HTTPException if the executor's queue is full. Call before the response starts.
+    """
+    return get_executor().iterate(iterator)
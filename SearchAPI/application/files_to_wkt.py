@@ -0,0 +1,165 @@
+"""
+/services/utils/files_to_wkt: turns uploaded shapefile zips, KMLs, geojson etc into one AOI.
+
+ - The upload is size-checked while it streams in (per file, and in total), so an oversized one
+   is turned away before it's spooled to disk, instead of after.
+ - Every file is parsed on the executor, side by side, and timed.
+ - The combined shape is simplified down to a vertex budget before it's validated, since
+   repairing a coastline with a million vertices would hold a worker for ages.
+"""
+import asyncio
+import math
+import time
+from typing import List
+
+import asf_search as asf
+from fastapi import HTTPException, Request
+# Not fastapi's UploadFile, the parser makes starlette's:
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from SearchAPI.logger import log_phase
+from .executor import run_blocking
+from . import constants
+
+
+# Most times a shape is simplified, looking for the tolerance that fits it in the vertex budget:
+SIMPLIFY_STEPS = 16
+
+
+class UploadTooLarge(MultiPartException):
+    pass
+
+
+class BoundedMultiPartParser(MultiPartParser):
+    """
+    Starlette's multipart parser, that stops reading as soon as a single part is over
+    'max_file_bytes', or the whole body is over 'max_total_bytes'.
+    """
+    def __init__(self, *args, max_file_bytes: int, max_total_bytes: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self._part_bytes = 0
+        self._total_bytes = 0
+
+    def on_part_begin(self) -> None:
+        super().on_part_begin()
+        self._part_bytes = 0
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self._part_bytes += end - start
+        self._total_bytes += end - start
+        if self._part_bytes > self.max_file_bytes:
+            raise UploadTooLarge(f"File is over the {self.max_file_bytes // 2**20}MB limit")
+        if self._total_bytes > self.max_total_bytes:
+            raise UploadTooLarge(f"Upload is over the {self.max_total_bytes // 2**20}MB limit")
+        super().on_part_data(data, start, end)
+
+
+async def read_upload(request: Request) -> List[UploadFile]:
+    """
+    The files uploaded with 'request' (multipart/form-data, any field name), size limited (see constants.FILES_TO_WKT_*).
+    """
+    content_length = request.headers.get('Content-Length')
+    if content_length is not None and content_length.isdigit() and int(content_length) > constants.FILES_TO_WKT_MAX_TOTAL_BYTES:
+        raise HTTPException(detail=f"Upload is over the {constants.FILES_TO_WKT_MAX_TOTAL_BYTES // 2**20}MB limit", status_code=413)
+    if not request.headers.get('Content-Type', '').startswith('multipart/form-data'):
+        raise HTTPException(detail="Files have to be uploaded as multipart/form-data", status_code=400)
+
+    parser = BoundedMultiPartParser(
+        request.headers,
+        request.stream(),
+        max_files=constants.FILES_TO_WKT_MAX_FILES,
+        max_file_bytes=constants.FILES_TO_WKT_MAX_FILE_BYTES,
+        max_total_bytes=constants.FILES_TO_WKT_MAX_TOTAL_BYTES,
+    )
+    try:
+        form = await parser.parse()
+    except UploadTooLarge as exc:
+        raise HTTPException(detail=exc.message, status_code=413) from exc
+    except MultiPartException as exc:
+        raise HTTPException(detail=exc.message, status_code=400) from exc
+
+    files = [value for _, value in form.multi_items() if isinstance(value, UploadFile)]
+    if not files:
+        raise HTTPException(detail="No files were uploaded", status_code=400)
+    return files
+
+async def files_to_wkt(files: List[UploadFile]) -> dict:
+    """
+    Parses every file (side by side, on the executor), and combines them into one shape.
+    Returns the combined 'parsed wkt', how long each file took, and the shape to validate
+    (simplified if it was over constants.FILES_TO_WKT_MAX_VERTICES) along with what was done to it.
+    """
+    parsed = await asyncio.gather(*(run_blocking(_parse_file, file) for file in files))
+    errors = [f"{result['name']}: {result['error']}" for result in parsed if 'error' in result]
+    if errors:
+        raise HTTPException(detail=f"Failed to parse files: {'; '.join(errors)}", status_code=400)
+
+    return await run_blocking(_combine, parsed)
+
+@log_phase('parse')
+def _parse_file(file: UploadFile) -> dict:
+    from shapely import wkt as shapely_wkt  # pylint: disable=import-outside-toplevel
+    start = time.perf_counter()
+    # asf_search goes by the file's extension:
+    file.file.filename = file.filename
+    try:
+        data = asf.filesToWKT([file.file]).getWKT()
+        if 'parsed wkt' not in data:
+            return {'name': file.filename, 'error': repr(data.get('errors', data))}
+        shape = shapely_wkt.loads(data['parsed wkt'])
+    except Exception as exc:
+        return {'name': file.filename, 'error': repr(exc)}
+    return {
+        'name': file.filename,
+        'size': file.size,
+        'shape': shape,
+        'parse_ms': round((time.perf_counter() - start) * 1000, 3),
+    }
+
+@log_phase('parse')
+def _combine(parsed: List[dict]) -> dict:
+    import shapely  # pylint: disable=import-outside-toplevel
+    shape = parsed[0]['shape'] if len(parsed) == 1 else shapely.unary_union([result['shape'] for result in parsed])
+    simplified, repairs = simplify_to_budget(shape, constants.FILES_TO_WKT_MAX_VERTICES)
+    return {
+        'parsed wkt': shape.wkt,
+        'files': [{key: value for key, value in result.items() if key != 'shape'} for result in parsed],
+        'shape': simplified,
+        'repairs': repairs,
+    }
+
+def simplify_to_budget(shape: 'BaseGeometry', max_vertices: int) -> tuple:
+    """
+    'shape', simplified just enough to have at most 'max_vertices' (or as close as it gets).
+    Returns (shape, [repair report]), the report in the same format as 'validate_wkt's.
+    """
+    import shapely  # pylint: disable=import-outside-toplevel
+    vertices = shapely.get_num_coordinates(shape)
+    if vertices <= max_vertices:
+        return shape, []
+    minx, miny, maxx, maxy = shape.bounds
+    extent = max(maxx - minx, maxy - miny) or 1.0
+    # The vertex count drops off fast as the tolerance goes up, so search for it on a log scale. Anything
+    # between half the budget and the budget is close enough. Every ring keeps at least 4 points though,
+    # so lots of tiny polygons might never get under it. Then it's as simple as it gets.
+    # The search uses plain Douglas-Peucker (~15x faster on big shapes), only the final pass preserves topology:
+    low, high = math.log10(extent) - 12, math.log10(extent)
+    best_tolerance = extent
+    for _ in range(SIMPLIFY_STEPS):
+        tolerance = 10 ** ((low + high) / 2)
+        count = shapely.get_num_coordinates(shape.simplify(tolerance, preserve_topology=False))
+        if count > max_vertices:
+            low = math.log10(tolerance)
+            continue
+        high = math.log10(tolerance)
+        best_tolerance = tolerance
+        if count >= max_vertices // 2:
+            break
+    best = shape.simplify(best_tolerance, preserve_topology=True)
+    return best, [{
+        'type': 'SIMPLIFY',
+        'report': f"Simplified from {vertices} to {shapely.get_num_coordinates(best)} vertices (tolerance {best_tolerance:.6g})",
+    }]
@@ -1,8 +1,15 @@
-import requests
-import logging
+import asyncio
+import functools
 import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
 
 from .asf_env import load_config_maturity
+from .sessions import get_session
+from . import constants
 from tenacity import retry, stop_after_attempt, wait_fixed
 
 def get_cmr_health():
@@ -20,11 +27,132 @@ def get_cmr_health():
                 'raw': repr(exc)
             }
         }
-        
+
     return cmr_health_response
 
 @retry(stop=stop_after_attempt(3), wait=wait_fixed(3), reraise=True)
 def _query_cmr_health(cmr_base: str, health_endpoint: str):
-    r = requests.get(f'https://{cmr_base}{health_endpoint}', timeout=10)
+    r = get_session().get(f'https://{cmr_base}{health_endpoint}', timeout=10)
     r.raise_for_status()
     return {'host': cmr_base, 'health': r.json()}
+
+@functools.lru_cache(maxsize=None)
+def get_api_version() -> dict:
+    """
+    Contents of SearchAPI/version.json. It only changes on deploy, so it's read once.
+    """
+    try:
+        version_path = os.path.join("SearchAPI", "version.json")
+        with open(version_path, 'r', encoding="utf-8") as version_file:
+            return json.load(version_file)
+    except Exception as exc:
+        logging.debug(exc)
+        return {'version': 'unknown'}
+
+
+class CMRHealthMonitor:
+    """
+    Probes CMR in the background every 'interval' seconds, and keeps the last result,
+    so /health never has to wait on CMR (A probe can take 30+ seconds with retries when CMR is degraded).
+    Only one probe runs at a time; anyone asking for a fresh one while it runs shares it.
+    """
+    def __init__(self, interval: float, timeout: float):
+        self.interval = interval
+        self.timeout = timeout
+        self._result: Optional[dict] = None
+        # (monotonic, wall clock) time the last probe finished:
+        self._checked_at = None
+        self._probe: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+        Starts the background refresher on the running event loop, if it isn't already running.
+        """
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh_forever())
+
+    async def stop(self) -> None:
+        for task in (self._refresher, self._probe):
+            if task is not None and not task.done():
+                task.cancel()
+        self._refresher = self._probe = None
+
+    async def _refresh_forever(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logging.warning(f"CMR health refresh failed: {repr(exc)}")
+            await asyncio.sleep(self.interval)
+
+    def refresh(self) -> asyncio.Task:
+        """
+        Starts a live probe (or joins the one already running). Await the result for the new snapshot.
+        """
+        if self._probe is None or self._probe.done():
+            self._probe = asyncio.get_running_loop().create_task(self._run_probe())
+        return self._probe
+
+    async def _run_probe(self) -> dict:
+        # Uses the default thread-pool, not the search executor, so a busy API
+        # doesn't reject its own health probes:
+        result = await asyncio.to_thread(get_cmr_health)
+        self._result = result
+        self._checked_at = (time.monotonic(), datetime.now(timezone.utc))
+        return self.snapshot()
+
+    def snapshot(self) -> dict:
+        """
+        The last probe result, with when it was taken and how old it is.
+        """
+        if self._checked_at is None:
+            return {'error': {'display': 'CMR health has not been checked yet.', 'raw': None}, 'checked_at': None, 'age': None}
+        checked_monotonic, checked_wall = self._checked_at
+        return {
+            **self._result,
+            'checked_at': checked_wall.isoformat(),
+            'age': round(time.monotonic() - checked_monotonic, 3),
+        }
+
+    async def get(self, deep: bool = False) -> dict:
+        """
+        The cached snapshot. If 'deep', or nothing's been probed yet, waits for a live probe,
+        at most 'timeout' seconds (The probe keeps going in the background after that).
+        """
+        self.start()
+        age = None if self._checked_at is None else time.monotonic() - self._checked_at[0]
+        if not deep and age is not None:
+            # i.e. the refresher was paused, like in a frozen Lambda. Serve the stale one, but catch up:
+            if age > 2 * self.interval:
+                self.refresh()
+            return self.snapshot()
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.refresh()), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return {
+                **self.snapshot(),
+                'error': {
+                    'display': 'ASF is experiencing errors loading data.  Please try again later.',
+                    'raw': f'CMR health probe timed out after {self.timeout} seconds'
+                }
+            }
+
+
+_health_monitor = None
+
+def get_health_monitor() -> CMRHealthMonitor:
+    """
+    Returns this worker's CMRHealthMonitor. Configured with the
+    SEARCHAPI_HEALTH_INTERVAL and SEARCHAPI_HEALTH_TIMEOUT env vars.
+    """
+    global _health_monitor
+    if _health_monitor is None:
+        _health_monitor = CMRHealthMonitor(
+            interval=float(os.environ.get('SEARCHAPI_HEALTH_INTERVAL', constants.HEALTH_CHECK_INTERVAL)),
+            timeout=float(os.environ.get('SEARCHAPI_HEALTH_TIMEOUT', constants.HEALTH_CHECK_TIMEOUT)),
+        )
+    return _health_monitor
@@ -1,7 +1,8 @@
 
 from pydantic import BaseModel, Field, InstanceOf, field_validator
-from typing import ClassVar, Optional
+from typing import ClassVar, Optional, Union
 from asf_search import ASFSearchOptions
+from fastapi import HTTPException
 
 class SearchOptsModel(BaseModel):
     """
@@ -9,14 +10,16 @@ class SearchOptsModel(BaseModel):
     opts (ASFSearchOptions): Generated from the params passed via query_params and the request body/json 
     request_method (str): The request method type
     output (str): the output type
+    pretty (bool): indent json outputs, instead of sending them compact
     merged_args (dict): The merged query and body/json params (used for opts ASFSearchOptions doesn't keep track of like maturity, reference, etc)
     """
     opts: InstanceOf[ASFSearchOptions]
     request_method: str # ["GET", "POST", "HEAD"]
     output: Optional[str] = 'metalink'
+    pretty: bool = False
     merged_args: dict = {}
 
-    output_types: ClassVar[list[str]] = ['metalink', 'csv', 'geojson', 'json', 'jsonlite', 'jsonlite2', 'kml', 'count', 'download']
+    output_types: ClassVar[list[str]] = ['metalink', 'csv', 'geojson', 'json', 'jsonlite', 'jsonlite2', 'kml', 'count', 'download', 'ndjson', 'parquet', 'arrow']
 
     @field_validator("output")
     def validate_output_format(cls, v):
@@ -32,5 +35,18 @@ class BaselineSearchOptsModel(SearchOptsModel):
     reference: str
 
 
+class BatchSearchOptsModel(BaseModel):
+    """
+    Batch search request model
+    queries (list): A SearchOptsModel per query, in the order they were sent. Or the HTTPException
+        it failed to parse with, so one bad query only fails itself
+    maturity (str): Every query in a batch goes to the same CMR
+    """
+    queries: list[Union[InstanceOf[SearchOptsModel], InstanceOf[HTTPException]]]
+    maturity: str = 'prod'
+
+    output_types: ClassVar[list[str]] = ['count', 'json', 'jsonlite', 'jsonlite2', 'geojson']
+
+
 class WKTModel(BaseModel):
     wkt: str = Field(default='')
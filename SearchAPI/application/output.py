@@ -1,111 +1,192 @@
-import requests
-import json
+import orjson
 import asf_search as asf
-from asf_search import ASFSearchResults, ASFSearchOptions, granule_search
-from typing import Generator
-from fastapi.responses import StreamingResponse
+from asf_search.export import results_to_csv, results_to_kml, results_to_metalink
+from asf_search.export.jsonlite import JSONLiteStreamArray
+from asf_search.export.jsonlite2 import JSONLite2StreamArray
+from typing import Generator, Iterable, Union
 from fastapi import HTTPException
 from datetime import datetime
 from . import constants
-from . import asf_env
+from .download import download_urls, get_bulk_download_client
 
-from SearchAPI import api_logger
+def as_output(results: asf.ASFSearchResults, output: str, pretty: bool = False, maturity: str = None) -> dict:
+    """
+    Renders the entire response body in memory (as bytes). Used where the response can't be
+    streamed (i.e. Lambda/Mangum), and for the response metadata on HEAD requests.
+    """
+    response_info = as_stream([results], output, pretty=pretty, maturity=maturity)
+    response_info['content'] = b''.join(response_info['content'])
+    return response_info
 
-def as_output(results: asf.ASFSearchResults, output: str) -> dict:
-    output_format = output.lower()
-    if output_format == "json":
-        output_format = "jsonlite"
+# Each output's media type, and the extension of the file it's sent as:
+OUTPUT_TYPES = {
+    'jsonlite': ('application/json; charset=utf-8', 'json'),
+    'jsonlite2': ('application/json; charset=utf-8', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'geojson': ('application/geo+json; charset=utf-8', 'geojson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'kml': ('application/vnd.google-earth.kml+xml; charset=utf-8', 'kml'),
+    'metalink': ('application/metalink+xml; charset=utf-8', 'metalink'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'download': ('text/x-python', 'py'),
+}
+
+def as_stream(pages: Iterable[asf.ASFSearchResults], output: str, pretty: bool = False, maturity: str = None) -> dict:
+    """
+    Same as 'as_output', but 'content' is a generator that renders one chunk (of bytes) at a time.
+    'pages' can be a list of ASFSearchResults, or a generator from asf.search_generator,
+    so CMR pages are only fetched as the response is sent.
+    The json formats are compact, unless 'pretty' is set. 'maturity' is the search's, for the
+    outputs that call out to another service (download goes to that maturity's bulk-download API).
+    """
+    output_format = _output_format(output)
+    # Only make the name once, so the script's own name is the same as the header's:
+    filename = make_filename(OUTPUT_TYPES['download'][1]) if output_format == 'download' else None
+    # (Throws on an unknown output, before anything's rendered)
+    response_info = _file_metadata(output_format, filename=filename)
+
+    # Generator functions only run once iterated, so the pages aren't
+    # touched until the response starts streaming:
+    pages = _as_generator(pages)
 
     # Use a switch statement, so you only load the type of output you need:
     match output_format:
         case 'jsonlite':
-            return {
-                'content': ''.join(results.jsonlite()),
-                'media_type': 'application/json; charset=utf-8',
-                'headers': {
-                    **constants.DEFAULT_HEADERS,
-                    'Content-Disposition': f"attachment; filename={make_filename('json')}",
-                }
-            }
+            content = _chunked(_json_stream(JSONLiteStreamArray, pages, pretty=pretty))
         case 'jsonlite2':
-            return {
-                'content': ''.join(results.jsonlite2()),
-                'media_type': 'application/json; charset=utf-8',
-                'headers': {
-                    **constants.DEFAULT_HEADERS,
-                    'Content-Disposition': f"attachment; filename={make_filename('json')}",
-                }
-            }
+            content = _chunked(_json_stream(JSONLite2StreamArray, pages, pretty=pretty))
+        case 'ndjson':
+            content = _chunked(_ndjson_stream(pages))
         case 'geojson':
-            return {
-                'content': json.dumps(results.geojson(), indent=4),
-                'media_type': 'application/geo+json; charset=utf-8',
-                'headers': {
-                    **constants.DEFAULT_HEADERS,
-                    'Content-Disposition': f"attachment; filename={make_filename('geojson')}",
-                }
-            }
+            content = _chunked(_geojson_stream(pages, pretty=pretty))
         case 'csv':
-            return {
-                'content': ''.join(results.csv()),
-                'media_type': 'text/csv; charset=utf-8',
-                'headers': {
-                    **constants.DEFAULT_HEADERS,
-                    'Content-Disposition': f"attachment; filename={make_filename('csv')}",
-                }
-            }
+            content = _chunked(results_to_csv(pages))
         case 'kml':
-            return {
-                'content': ''.join(results.kml()),
-                'media_type': 'application/vnd.google-earth.kml+xml; charset=utf-8',
-                'headers': {
-                    **constants.DEFAULT_HEADERS,
-                    'Content-Disposition': f"attachment; filename={make_filename('kml')}",
-                }
-            }
+            content = _chunked(results_to_kml(pages))
         case 'metalink':
-            return {
-                'content': ''.join(results.metalink()),
-                'media_type': 'application/metalink+xml; charset=utf-8',
-                'headers': {
-                    **constants.DEFAULT_HEADERS,
-                    'Content-Disposition': f"attachment; filename={make_filename('metalink')}",
-                }
-            }
+            content = _chunked(results_to_metalink(pages))
+        case 'parquet':
+            # (pyarrow is only imported if it's needed)
+            from .columnar import parquet_stream  # pylint: disable=import-outside-toplevel
+            content = parquet_stream(pages)
+        case 'arrow':
+            from .columnar import arrow_stream  # pylint: disable=import-outside-toplevel
+            content = arrow_stream(pages)
         case 'download':
-            # Only call this once to guarantee the names always are the same:
-            filename = make_filename('py')
-            return {
-                'content': get_download(results, filename=filename),
-                'media_type': 'text/x-python',
-                'headers': {
-                    **constants.DEFAULT_HEADERS,
-                    'Content-Disposition': f"attachment; filename={filename}",
-                }
-            }
-        # The default case. Throw if you get this far:
-        case _:
-            raise HTTPException(
-                detail=f"Unknown output '{output_format}' was requested.",
-                status_code=400
-            )
-
-def get_download(results: asf.ASFSearchResults, filename=None):
-    # Load basic consts:
-    script_url = asf_env.load_config_maturity()['bulk_download_api']
-    file_type = asf.FileDownloadType.DEFAULT_FILE
-    # Build the url list:
-    url_list = []
-    for product in results:
-        url_list.extend(product.get_urls(fileType=file_type))
-    
-    # Setup the data you're posting with. Optional filename so it lines up with our headers:
-    script_data = { 'products': ','.join(url_list) }
-    if filename:
-        script_data['filename'] = filename
-    # Finally make the request:
-    script_request = requests.post( script_url, data=script_data, timeout=30 )
-    return script_request.text
+            content = _chunked(_download_stream(pages, filename=filename, maturity=maturity))
+    return {'content': content, **response_info}
+
+def output_metadata(output: str) -> dict:
+    """
+    The media type and headers a response in 'output' is sent with, without rendering (or searching) anything.
+    For HEAD requests. 400's on an unknown output, same as a search would.
+    """
+    output_format = _output_format(output)
+    if output_format == 'count':
+        return {'media_type': 'text/html; charset=utf-8', 'headers': {**constants.DEFAULT_HEADERS}}
+    return _file_metadata(output_format)
+
+def _output_format(output: str) -> str:
+    output_format = output.lower()
+    if output_format == "json":
+        output_format = "jsonlite"
+    return output_format
+
+def _file_metadata(output_format: str, filename: str = None) -> dict:
+    if (output_type := OUTPUT_TYPES.get(output_format)) is None:
+        raise HTTPException(
+            detail=f"Unknown output '{output_format}' was requested.",
+            status_code=400
+        )
+    media_type, extension = output_type
+    return {
+        'media_type': media_type,
+        'headers': {
+            **constants.DEFAULT_HEADERS,
+            'Content-Disposition': f"attachment; filename={filename or make_filename(extension)}",
+        }
+    }
+
+def _as_generator(pages: Iterable[asf.ASFSearchResults]) -> Generator[asf.ASFSearchResults, None, None]:
+    # asf_search's exporters only treat *generators* as a list of pages:
+    yield from pages
+
+def _json_stream(streamer_class: type, pages: Iterable[asf.ASFSearchResults], pretty: bool = False) -> Generator[bytes, None, None]:
+    """
+    Same as asf_search's 'results_to_jsonlite' (keys sorted the same way), but works on a generator
+    of pages, and each product is encoded straight to bytes by orjson.
+    """
+    items = streamer_class(_as_generator(pages)).streamDicts()
+    yield from _json_array(b'results', items, sort_keys=True, pretty=pretty)
+
+def _ndjson_stream(pages: Iterable[asf.ASFSearchResults]) -> Generator[bytes, None, None]:
+    # One jsonlite product per line. Always compact, that's the point of the format:
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE
+    for item in JSONLiteStreamArray(_as_generator(pages)).streamDicts():
+        yield orjson.dumps(item, option=option)
+
+def _geojson_stream(pages: Iterable[asf.ASFSearchResults], pretty: bool = False) -> Generator[bytes, None, None]:
+    features = (product.geojson() for page in pages for product in page)
+    head = b'"type": "FeatureCollection"' if pretty else b'"type":"FeatureCollection"'
+    yield from _json_array(b'features', features, pretty=pretty, head=head)
+
+def _json_array(key: bytes, items: Iterable[dict], sort_keys: bool = False, pretty: bool = False, head: bytes = None) -> Generator[bytes, None, None]:
+    """
+    Writes '{<head>, "<key>": [<items>]}' one item at a time. Compact, or laid
+    out the same as the stdlib's 'json.dumps(..., indent=2)' if 'pretty' is set.
+    """
+    option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+    if pretty:
+        option |= orjson.OPT_INDENT_2
+        yield b'{\n  ' + (head + b',\n  ' if head else b'') + b'"' + key + b'": ['
+    else:
+        yield b'{' + (head + b',' if head else b'') + b'"' + key + b'":['
+
+    # The items sit two levels deep:
+    indent = b'\n    '
+    empty = True
+    for item in items:
+        encoded = orjson.dumps(item, option=option)
+        if pretty:
+            encoded = indent + encoded.replace(b'\n', indent)
+        yield encoded if empty else b',' + encoded
+        empty = False
+
+    if not pretty:
+        yield b']}'
+    else:
+        yield b']\n}' if empty else b'\n  ]\n}'
+
+def _download_stream(pages: Iterable[asf.ASFSearchResults], filename: str, maturity: str = None) -> Generator[str, None, None]:
+    # The script needs every url up front, so this can't be streamed any finer than one piece:
+    yield get_bulk_download_client(maturity).script(download_urls(pages), filename=filename)
+
+def _chunked(fragments: Iterable[Union[str, bytes]], chunk_size: int = constants.STREAM_CHUNK_SIZE) -> Generator[bytes, None, None]:
+    """
+    The exporters yield tiny fragments (down to a single json token). Group
+    them into bigger chunks, so each send isn't just a few bytes.
+    Every chunk comes out as bytes, whether the fragments are str (asf_search's exporters) or bytes (orjson).
+    """
+    buffer = []
+    buffer_size = 0
+    for fragment in fragments:
+        buffer.append(fragment)
+        buffer_size += len(fragment)
+        if buffer_size >= chunk_size:
+            yield _join(buffer)
+            buffer = []
+            buffer_size = 0
+    if buffer:
+        yield _join(buffer)
+
+def _join(fragments: list) -> bytes:
+    if isinstance(fragments[0], str):
+        return ''.join(fragments).encode('utf-8')
+    return b''.join(fragments)
+
+def get_download(results: Iterable[asf.ASFProduct], filename=None, maturity: str = None):
+    return get_bulk_download_client(maturity).script(download_urls([results]), filename=filename)
 
 def make_filename(suffix):
     return f'asf-results-{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.{suffix}'
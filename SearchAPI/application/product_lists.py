@@ -0,0 +1,132 @@
+"""
+granule_list/product_list searches, split into chunks of names that are searched side by side.
+
+asf_search splits a long list into subqueries of 250 names too, but reads them one after the
+other, and sorts the results by date once they're all in. Here:
+ - A name asked for more than once is only searched for once (see 'build_search_opts').
+ - The list is split into 'chunk_size' names per CMR query, and 'concurrency' of those chunks
+   are searched at once (the 'list_search' block in maturities.yml, see AsyncCMRClient.search_pages).
+ - Results come back in the order their names were asked for, each product only once. So
+   every chunk can be sent on as soon as it (and every chunk before it) is in.
+"""
+from copy import copy
+from typing import Iterable, Iterator, List, Optional
+
+import asf_search as asf
+
+from SearchAPI import api_logger
+from .asf_internals import INTERNAL, CMRIncompleteError
+from .cmr import count_cmr_hits
+
+LIST_KEYWORDS = ('granule_list', 'product_list')
+# What a product can be matched back to its name by. (granule_list names can be either):
+NAME_PROPERTIES = ('sceneName', 'fileID')
+
+
+def dedupe_names(names: Iterable[str]) -> List[str]:
+    # Keeps the first time each name shows up, so the order doesn't change:
+    return list(dict.fromkeys(names))
+
+def list_keyword(opts: asf.ASFSearchOptions) -> Optional[str]:
+    """
+    'granule_list' or 'product_list', if that's what 'opts' searches by (Otherwise None).
+    """
+    for keyword in LIST_KEYWORDS:
+        if getattr(opts, keyword, None):
+            return keyword
+    return None
+
+
+class ListSearch:
+    """
+    The chunks of one list search, and what puts the products that come back for them in order.
+    """
+    def __init__(self, opts: asf.ASFSearchOptions, keyword: str, chunk_size: int = INTERNAL.CMR_PAGE_SIZE):
+        self.opts = opts
+        self.keyword = keyword
+        self.names = dedupe_names(getattr(opts, keyword))
+        self._positions = {name: position for position, name in enumerate(self.names)}
+        # asf_search splits anything longer than one CMR page again anyway:
+        chunk_size = max(1, min(chunk_size, INTERNAL.CMR_PAGE_SIZE))
+        self.chunks = [self.names[start:start + chunk_size] for start in range(0, len(self.names), chunk_size)]
+        self._seen = set()
+
+    def chunk_opts(self, chunk: List[str]) -> asf.ASFSearchOptions:
+        opts = copy(self.opts)
+        # Not 'merge_args', that warns about overwriting the full list. Only the chunk is validated:
+        setattr(opts, self.keyword, chunk)
+        return opts
+
+    def in_requested_order(self, products: Iterable[asf.ASFProduct]) -> List[asf.ASFProduct]:
+        """
+        'products' in the order their names were asked for, minus any already returned.
+        Call once per chunk, in chunk order.
+        """
+        unseen = []
+        for product in products:
+            file_id = product.properties.get('fileID')
+            if file_id not in self._seen:
+                self._seen.add(file_id)
+                unseen.append(product)
+        # Stable, so products that share a name stay in CMR's order:
+        unseen.sort(key=self._position)
+        return unseen
+
+    def _position(self, product: asf.ASFProduct) -> int:
+        for key in NAME_PROPERTIES:
+            if (position := self._positions.get(product.properties.get(key))) is not None:
+                return position
+        return len(self.names)
+
+
+def get_list_search(opts: asf.ASFSearchOptions, chunk_size: int = INTERNAL.CMR_PAGE_SIZE) -> Optional[ListSearch]:
+    """
+    The ListSearch for 'opts', or None if it doesn't search by granule_list/product_list.
+    """
+    if (keyword := list_keyword(opts)) is None:
+        return None
+    return ListSearch(opts, keyword, chunk_size)
+
+def search_generator(opts: asf.ASFSearchOptions) -> Iterator[asf.ASFSearchResults]:
+    """
+    Same as asf.search_generator, but list searches are split up like the async client does it. For when
+    that's turned off (use_async: False), so the chunks are searched one after another, one page per chunk.
+    Like the async client, raises CMRIncompleteError if CMR keeps sending an incomplete page.
+    """
+    if (list_search := get_list_search(opts)) is None:
+        yield from _complete_pages(opts)
+        return
+    for chunk in list_search.chunks:
+        products = [product for page in _complete_pages(list_search.chunk_opts(chunk)) for product in page]
+        page = asf.ASFSearchResults(list_search.in_requested_order(products), opts=opts)
+        page.searchComplete = True
+        yield page
+
+def search(opts: asf.ASFSearchOptions) -> asf.ASFSearchResults:
+    """
+    Same as asf.search, see 'search_generator'.
+    """
+    results = asf.ASFSearchResults([], opts=opts)
+    for page in search_generator(opts):
+        results.extend(page)
+    results.searchComplete = True
+    # List searches are already in the order the names were asked for:
+    if list_keyword(opts) is not None:
+        return results
+    try:
+        results.sort(key=lambda product: product.get_sort_keys(), reverse=True)
+    except TypeError as exc:
+        api_logger.warning(f'Failed to sort final results, leaving results unsorted. Reason: {exc}')
+    return results
+
+def _complete_pages(opts: asf.ASFSearchOptions) -> Iterator[asf.ASFSearchResults]:
+    # asf_search stops at a page CMR keeps sending incomplete, as if that was every result
+    # (and asf.search only notices if it was the last subquery). What it did send adds up
+    # to less than CMR's hits then:
+    total = 0
+    with count_cmr_hits(opts.session) as cmr_hits:
+        for page in asf.search_generator(opts=opts):
+            total += len(page)
+            yield page
+    if total != opts.maxResults and total < cmr_hits.hits:
+        raise CMRIncompleteError(f'CMR returned incomplete results. Expected {cmr_hits.hits} results, got {total}')
@@ -0,0 +1,110 @@
+"""
+The download script, for when the bulk-download API can't build one in time (see download.py).
+Only needs the standard library on the user's end, same as the one the API sends.
+"""
+from datetime import datetime
+from string import Template
+from typing import List
+
+# When the script isn't given a name of its own:
+DEFAULT_FILENAME = 'download-script.py'
+
+SCRIPT_TEMPLATE = Template('''#!/usr/bin/env python3
+"""
+ASF bulk download script, generated by the ASF Search API on $generated.
+
+Downloads the $count files listed below. Needs an Earthdata Login account
+(https://urs.earthdata.nasa.gov), read from ~/.netrc if it's in there, asked for otherwise.
+
+Usage:
+    python $filename [--dir DIRECTORY]
+
+Files that are already downloaded are skipped, so it's safe to re-run.
+"""
+import argparse
+import getpass
+import netrc
+import os
+import sys
+import urllib.error
+import urllib.request
+from http.cookiejar import CookieJar
+
+URS_HOST = "urs.earthdata.nasa.gov"
+CHUNK_SIZE = 1024 * 1024
+
+URLS = [
+$urls
+]
+
+
+def earthdata_credentials():
+    try:
+        auth = netrc.netrc().authenticators(URS_HOST)
+        if auth is not None:
+            return auth[0], auth[2]
+    except (OSError, netrc.NetrcParseError):
+        pass
+    username = input("Earthdata Login username: ")
+    return username, getpass.getpass("Earthdata Login password: ")
+
+
+def build_opener(username, password):
+    # Earthdata Login redirects to URS for basic auth, then back with a session cookie:
+    passwords = urllib.request.HTTPPasswordMgrWithDefaultRealm()
+    passwords.add_password(None, "https://" + URS_HOST, username, password)
+    return urllib.request.build_opener(
+        urllib.request.HTTPBasicAuthHandler(passwords),
+        urllib.request.HTTPCookieProcessor(CookieJar()),
+    )
+
+
+def download(opener, url, directory):
+    path = os.path.join(directory, os.path.basename(url.split("?")[0]))
+    with opener.open(url) as response:
+        size = int(response.headers.get("Content-Length", -1))
+        if size >= 0 and os.path.exists(path) and os.path.getsize(path) == size:
+            print(f"Already have {path}, skipping")
+            return
+        partial = path + ".part"
+        with open(partial, "wb") as out_file:
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                out_file.write(chunk)
+    os.replace(partial, path)
+    print(f"Downloaded {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=".", help="Where to save the files (Default: the current directory)")
+    args = parser.parse_args()
+    os.makedirs(args.dir, exist_ok=True)
+
+    opener = build_opener(*earthdata_credentials())
+    failed = []
+    for number, url in enumerate(URLS, start=1):
+        print(f"({number}/{len(URLS)}) {url}")
+        try:
+            download(opener, url, args.dir)
+        except (urllib.error.URLError, OSError) as exc:
+            print(f"Failed: {exc}", file=sys.stderr)
+            failed.append(url)
+    if failed:
+        print(f"{len(failed)} of {len(URLS)} downloads failed:", *failed, sep="\\n", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+''')
+
+def render_script(urls: List[str], filename: str = None) -> str:
+    return SCRIPT_TEMPLATE.substitute(
+        generated=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        count=len(urls),
+        filename=filename or DEFAULT_FILENAME,
+        urls='\n'.join(f'    {url!r},' for url in urls),
+    )
@@ -0,0 +1,123 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Mapping
+
+import asf_search as asf
+from requests.adapters import HTTPAdapter
+
+from SearchAPI import api_logger
+from .asf_env import get_maturity, load_config_maturity
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    A keep-alive connection pool, meant to be shared by many sessions.
+    If it sits unused longer than 'idle_timeout', the idle connections are dropped
+    instead of re-used, since the other end has most likely closed them by then.
+    """
+    def __init__(self, idle_timeout: float, **kwargs):
+        self.idle_timeout = idle_timeout
+        self.last_used = time.monotonic()
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        now = time.monotonic()
+        if now - self.last_used > self.idle_timeout:
+            self.poolmanager.clear()
+        self.last_used = now
+        return super().send(request, **kwargs)
+
+
+class SessionPool:
+    """
+    The connection pools for one maturity. Anonymous requests all share one pool,
+    requests with a cmr_token share a pool with other requests using the same token.
+    Token pools are kept in an LRU, bounded by 'token_sessions', and dropped after 'token_ttl' seconds.
+    """
+    def __init__(self, pool_connections: int, pool_maxsize: int, idle_timeout: float, token_sessions: int, token_ttl: float):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self.token_sessions = token_sessions
+        self.token_ttl = token_ttl
+        self._adapter = self._new_adapter()
+        # token hash -> (adapter, expires at):
+        self._token_adapters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _new_adapter(self) -> PooledAdapter:
+        return PooledAdapter(
+            idle_timeout=self.idle_timeout,
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+
+    def _get_token_adapter(self, token: str) -> PooledAdapter:
+        # Don't keep the raw tokens around in memory:
+        key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            if (cached := self._token_adapters.get(key)) is not None:
+                adapter, expires = cached
+                if expires > now:
+                    self._token_adapters.move_to_end(key)
+                    return adapter
+                del self._token_adapters[key]
+                adapter.close()
+
+            adapter = self._new_adapter()
+            self._token_adapters[key] = (adapter, now + self.token_ttl)
+            while len(self._token_adapters) > self.token_sessions:
+                _, (evicted, _) = self._token_adapters.popitem(last=False)
+                evicted.close()
+        return adapter
+
+    def session(self, token: str = None) -> asf.ASFSession:
+        """
+        Returns a new session, that sends everything through the shared pools.
+        The session itself is never shared, since asf_search keeps per-search
+        state in its headers. Only the connections underneath it are.
+        """
+        session = asf.ASFSession()
+        if token:
+            session.headers.update({'Authorization': 'Bearer {0}'.format(token)})
+            adapter = self._get_token_adapter(token)
+        else:
+            adapter = self._adapter
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self) -> None:
+        with self._lock:
+            self._adapter.close()
+            for adapter, _ in self._token_adapters.values():
+                adapter.close()
+            self._token_adapters.clear()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_session_pool(maturity: str = None) -> SessionPool:
+    """
+    Returns the SessionPool for 'maturity' (Defaults to the MATURITY env var), sized
+    from the 'session_pool' block of maturities.yml.
+    """
+    maturity = get_maturity(maturity)
+    if (pool := _pools.get(maturity)) is None:
+        with _pools_lock:
+            if (pool := _pools.get(maturity)) is None:
+                pool_config: Mapping = load_config_maturity(maturity)['session_pool']
+                pool = SessionPool(**pool_config)
+                _pools[maturity] = pool
+                api_logger.debug(f"Created session pool for maturity '{maturity}': {dict(pool_config)}")
+    return pool
+
+def get_session(maturity: str = None, token: str = None) -> asf.ASFSession:
+    """
+    Returns a new session for one request, using the pooled connections for 'maturity'.
+    """
+    return get_session_pool(maturity).session(token=token)
@@ -0,0 +1,83 @@
+"""
+Memoized WKT validation/repair. The front-end validates the same AOI over and over as it's
+drawn, then searches with it, and a big (multi)polygon takes a while to repair and simplify.
+Shared by /services/utils/wkt, files_to_wkt, and the 'intersectsWith' repair every search
+does while it's preprocessed (see 'install').
+"""
+import importlib
+import os
+from functools import lru_cache
+from typing import List, Tuple, Union
+
+import asf_search as asf
+from asf_search.WKT import RepairEntry
+
+from SearchAPI import api_logger
+from . import constants
+
+CACHE_SIZE = int(os.environ.get('SEARCHAPI_WKT_CACHE_SIZE', constants.WKT_CACHE_SIZE))
+
+
+def normalize_wkt(wkt: str) -> str:
+    """
+    Same WKT, without the differences that don't change the shape (case, spacing), so they share a cache entry.
+    i.e. 'point( 1  2 )' -> 'POINT(1 2)'
+    """
+    # str methods, not regex. These strings can be hundreds of KB:
+    wkt = ' '.join(wkt.upper().split())
+    for separator in '(),':
+        wkt = wkt.replace(' ' + separator, separator).replace(separator + ' ', separator)
+    return wkt
+
+def validate_wkt(aoi: Union[str, 'BaseGeometry']) -> Tuple['BaseGeometry', 'BaseGeometry', List[RepairEntry]]:
+    """
+    Drop-in for 'asf.validate_wkt': Returns (wrapped, unwrapped, repairs).
+    The geometries are shared between callers. Shapely geometries are immutable, so that's safe.
+    """
+    from shapely.geometry.base import BaseGeometry  # pylint: disable=import-outside-toplevel
+    if isinstance(aoi, BaseGeometry):
+        aoi = aoi.wkt
+    wrapped, unwrapped, repairs = _validate_exact(aoi)
+    return wrapped, unwrapped, list(repairs)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _validate_exact(wkt: str) -> Tuple['BaseGeometry', 'BaseGeometry', tuple]:
+    # Most repeats are the exact same string. Those don't need normalizing first:
+    return _validate_normalized(normalize_wkt(wkt))
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _validate_normalized(wkt: str) -> Tuple['BaseGeometry', 'BaseGeometry', tuple]:
+    # Invalid WKT raises, and exceptions aren't cached. Those get re-validated every time:
+    wrapped, unwrapped, repairs = asf.validate_wkt(wkt)
+    return wrapped, unwrapped, tuple(repairs)
+
+def wkt_cache_stats() -> dict:
+    """
+    Hits/misses since the worker started, for the health check.
+    """
+    exact, normalized = _validate_exact.cache_info(), _validate_normalized.cache_info()
+    # Only a miss on both actually validates:
+    hits = exact.hits + normalized.hits
+    lookups = exact.hits + exact.misses
+    return {
+        'hits': hits,
+        'misses': normalized.misses,
+        'hit_rate': hits / lookups if lookups else None,
+        'size': normalized.currsize,
+        'max_size': normalized.maxsize,
+    }
+
+def install() -> bool:
+    """
+    Makes asf_search's search preprocessing (the 'intersectsWith' repair) go through this cache too.
+    It imports 'validate_wkt' by name, so that's the reference swapped out. Called on startup (the
+    app's lifespan, or main.py for Lambda), not on import. Returns if it could be swapped.
+    """
+    # Not 'from asf_search.search import search_generator', that's the function with the same name:
+    search_generator = importlib.import_module('asf_search.search.search_generator')
+    if not hasattr(search_generator, 'validate_wkt'):
+        # i.e. a newer asf_search validates somewhere else. Searches still work, their AOIs just aren't cached:
+        api_logger.warning("asf_search.search.search_generator has no 'validate_wkt' to swap out, search AOIs won't go through the WKT cache")
+        return False
+    search_generator.validate_wkt = validate_wkt
+    return True
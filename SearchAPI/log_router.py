@@ -1,12 +1,13 @@
 
-from typing import Callable
+from typing import AsyncIterator, Callable
 import time
-import logging
 
 from fastapi import Response, Request
+from fastapi.responses import StreamingResponse
 from fastapi.routing import APIRoute
 
 from . import api_logger
+from .logger import get_request_phases, start_request_context
 
 
 class LoggingRoute(APIRoute):
@@ -16,19 +17,6 @@ class LoggingRoute(APIRoute):
     This one is for logging request info for every endpoint.
     """
 
-    old_factory = logging.getLogRecordFactory()
-    aws_request_id = ""
-
-    def record_factory(self, *args, **kwargs):
-        """
-        Add extra info to the logger when each request hits the API.
-
-        From: https://stackoverflow.com/a/57820456
-        """
-        record = self.old_factory(*args, **kwargs)
-        record.aws_request_id = self.aws_request_id
-        return record
-
     def get_route_handler(self) -> Callable:
         """
         This is called before/after every request. Mostly used
@@ -39,24 +27,26 @@ class LoggingRoute(APIRoute):
         original_route_handler = super().get_route_handler()
 
         async def custom_route_handler(request: Request) -> Response:
-            # Grab the AWS UUID and set it for every log:
+            # Grab the AWS UUID (if there is one) and set it for every log in this request:
             context = request.scope.get("aws.context")
-            if context is not None:
-                self.aws_request_id = context.aws_request_id
-            logging.setLogRecordFactory(self.record_factory)
+            start_request_context(
+                aws_request_id=context.aws_request_id if context is not None else "",
+                endpoint=request.scope['path'],
+            )
             # Time the request itself:
-            before = time.time()
+            before = time.perf_counter()
             try:
                 response: Response = await original_route_handler(request)
             finally:
                 # What to ALWAYS log:
-                duration = time.time() - before
+                duration = time.perf_counter() - before
                 api_logger.info(
                     "Query finished running.",
                     extra={
                         "QueryTime": duration,
                         "QueryParams": dict(request.query_params),
                         "Endpoint": request.scope['path'],
+                        "Phases": get_request_phases(),
                     }
                 )
             # What to log if the query was successful:
@@ -66,8 +56,28 @@ class LoggingRoute(APIRoute):
                     "media_type": response.media_type,
                 }
             )
+            # Most of the work for a streamed response happens after this returns:
+            if isinstance(response, StreamingResponse):
+                response.body_iterator = self.log_stream(response.body_iterator, before)
             # An example on adding headers. IDK if we actually need this one:
             response.headers["X-Response-Time"] = str(duration)
             return response
 
         return custom_route_handler
+
+    @staticmethod
+    async def log_stream(body_iterator: AsyncIterator, before: float) -> AsyncIterator:
+        """
+        Passes a streamed body through, and logs how long it took (and where the time went) once it's done.
+        """
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            api_logger.info(
+                "Response finished streaming.",
+                extra={
+                    "StreamTime": time.perf_counter() - before,
+                    "Phases": get_request_phases(),
+                }
+            )
@@ -1,9 +1,128 @@
 
+import asyncio
+import atexit
 import logging
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import IO, Iterable, Iterator, Optional
 from pythonjsonlogger import jsonlogger
 
 
+# Info about the request currently being handled, for every log made while handling it.
+# A ContextVar follows each request through its own task (and into executor threads),
+# so concurrent requests can't see each other's info:
+_request_context: ContextVar[Optional[dict]] = ContextVar("request_context", default=None)
+
+# What's on every log record, even ones made outside of a request:
+REQUEST_CONTEXT_FIELDS = {
+    "aws_request_id": "",
+    "endpoint": "",
+    "maturity": "",
+}
+
+def start_request_context(**fields) -> dict:
+    """
+    Starts a new context for the current request. Call at the very start of handling it.
+    """
+    context = {
+        **REQUEST_CONTEXT_FIELDS,
+        **fields,
+        # phase name -> total seconds spent in it:
+        "phases": {},
+        # thread id (or asyncio task) -> [phase name, when it (last) started], for the phase running on it:
+        "_active_phases": {},
+        "_lock": threading.Lock(),
+    }
+    _request_context.set(context)
+    return context
+
+def update_request_context(**fields) -> None:
+    """
+    Adds info to the current request's context, once it's known (i.e. maturity, after parsing the request).
+    """
+    if (context := _request_context.get()) is not None:
+        context.update(fields)
+
+def get_request_phases() -> dict:
+    if (context := _request_context.get()) is None:
+        return {}
+    with context["_lock"]:
+        return dict(context["phases"])
+
+@contextmanager
+def log_phase(name: str) -> Iterator[None]:
+    """
+    Times the block as part of phase 'name' (i.e. "parse", "cmr", "serialize") for the current request.
+    Phases don't double count: time spent in a nested phase only goes towards that nested phase.
+    (Work running side by side, on other threads or tasks, counts its own time)
+    """
+    if (context := _request_context.get()) is None:
+        yield
+        return
+    thread_id = _phase_owner()
+    active = context["_active_phases"]
+    outer = active.get(thread_id)
+    start = time.perf_counter()
+    if outer is not None:
+        _add_phase_time(context, outer[0], start - outer[1])
+    current = active[thread_id] = [name, start]
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _add_phase_time(context, name, end - current[1])
+        if outer is not None:
+            outer[1] = end
+            active[thread_id] = outer
+        else:
+            del active[thread_id]
+
+def _phase_owner():
+    # Tasks on the event loop all share its thread, so they're kept apart by task instead:
+    try:
+        if (task := asyncio.current_task()) is not None:
+            return task
+    except RuntimeError:
+        # No event loop running on this thread:
+        pass
+    return threading.get_ident()
+
+def _add_phase_time(context: dict, name: str, seconds: float) -> None:
+    with context["_lock"]:
+        context["phases"][name] = context["phases"].get(name, 0.0) + seconds
+
+def timed_iter(iterable: Iterable, phase: str) -> Iterator:
+    """
+    Counts the time spent producing each item of 'iterable' towards 'phase'.
+    (For generators, where a 'with log_phase' would also count the time spent by whoever's consuming it)
+    """
+    iterator = iter(iterable)
+    done = object()
+    while True:
+        with log_phase(phase):
+            item = next(iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Adds the current request's context to each record. Installed once, on our handler,
+    so it covers every logger that goes through it (including asf_search's).
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _request_context.get() or REQUEST_CONTEXT_FIELDS
+        for field in REQUEST_CONTEXT_FIELDS:
+            setattr(record, field, context[field])
+        return True
+
+
 class ConsoleStreamFormatter(logging.Formatter):
     """
     Custom Logger formatter, used when running this app locally
@@ -36,7 +155,12 @@ class ConsoleStreamFormatter(logging.Formatter):
         logging.CRITICAL:   Colors.ERROR + Colors.BOLD + LOGGER_FORMAT + Colors.END
     }
 
-    def format(self, record: logging.LogRecord) -> logging.Formatter:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Built once, not per record:
+        self._formatters = {level: logging.Formatter(log_fmt) for level, log_fmt in self.FORMATS.items()}
+
+    def format(self, record: logging.LogRecord) -> str:
         # If it's bytes, turn it to a string:
         if isinstance(record.msg, bytes):
             record.msg = record.msg.decode("utf-8")
@@ -46,11 +170,13 @@ class ConsoleStreamFormatter(logging.Formatter):
             record.msg = "<multi-line>:\n\t" + "\n\t".join(msg_list)
 
         # Add color to each of the logging formats:
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
+        formatter = self._formatters.get(record.levelno)
+        if formatter is None:
+            # Custom log level:
+            formatter = self._formatters[record.levelno] = logging.Formatter(self.FORMATS.get(record.levelno))
         return formatter.format(record)
 
-class AwsStreamFormatter(logging.Formatter):
+class AwsStreamFormatter(jsonlogger.JsonFormatter):
     """
     Custom Logger formatter, used when running this app in AWS
     """
@@ -62,6 +188,8 @@ class AwsStreamFormatter(logging.Formatter):
         "%(levelname)s",
         "%(message)s",
         "%(aws_request_id)s",
+        "%(endpoint)s",
+        "%(maturity)s",
     ])
 
     LOGGER_RENAME_FIELDS = {
@@ -70,30 +198,59 @@ class AwsStreamFormatter(logging.Formatter):
         "levelname": "log_level",
     }
 
-    def format(self, record: logging.LogRecord) -> logging.Formatter:
-        formatter = jsonlogger.JsonFormatter(
-            self.LOGGER_FORMAT,
-            rename_fields=self.LOGGER_RENAME_FIELDS
-        )
-        return formatter.format(record)
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("rename_fields", self.LOGGER_RENAME_FIELDS)
+        super().__init__(self.LOGGER_FORMAT, *args, **kwargs)
+
+def build_handler(formatter: logging.Formatter, stream: Optional[IO] = None, queued: bool = False) -> logging.Handler:
+    """
+    Builds the handler everything logs through.
+
+    If 'queued', the calling thread only puts records on a queue, and a background
+    listener thread formats and writes them. (The listener is at 'handler.listener')
+    Records still waiting when the process is killed outright (i.e. a Lambda timeout) are lost.
+    """
+    stream_handle = logging.StreamHandler(stream)
+    stream_handle.setFormatter(formatter)
+    if not queued:
+        stream_handle.addFilter(RequestContextFilter())
+        return stream_handle
+
+    log_queue = queue.SimpleQueue()
+    queue_handle = QueueHandler(log_queue)
+    # Has to run on the calling thread, where the request's context is:
+    queue_handle.addFilter(RequestContextFilter())
+    listener = QueueListener(log_queue, stream_handle, respect_handler_level=True)
+    listener.start()
+    queue_handle.listener = listener
+    # Flush whatever's left on a normal shutdown:
+    atexit.register(_stop_listener, listener)
+    return queue_handle
+
+def _stop_listener(listener: QueueListener) -> None:
+    # QueueListener.stop() can't be called twice:
+    if listener._thread is not None:
+        listener.stop()
 
 def get_logger(name: str, level: int=logging.DEBUG) -> logging.Logger:
     """
-    Builds and returns our custom logger for each sub-module
+    Builds and returns our custom logger for each sub-module.
+    Set the SEARCHAPI_LOG_QUEUE env var to "TRUE" to write logs from a background thread.
     """
     ## Clear the built in 'StreamHandler', to avoid duplicate messages:
     root_logger = logging.getLogger()
     root_logger.handlers.clear()
 
     ## Setup what the format should look like, depending on if in AWS or local:
-    stream_handle = logging.StreamHandler()
     # Default to false if not set:
     if os.environ.get('LOCAL_RUN', "FALSE").upper() == "TRUE":
         # You're running locally!
-        stream_handle.setFormatter(ConsoleStreamFormatter())
+        formatter = ConsoleStreamFormatter()
     else:
         # You're running in Lambda!
-        stream_handle.setFormatter(AwsStreamFormatter())
+        formatter = AwsStreamFormatter()
+    queued = os.environ.get('SEARCHAPI_LOG_QUEUE', "FALSE").upper() == "TRUE"
+    stream_handle = build_handler(formatter, queued=queued)
 
     ## Build the logger itself:
     logger = logging.getLogger(name)
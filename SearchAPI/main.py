@@ -5,18 +5,24 @@ Make changes to the API itself in SearchAPI/application.py
 
 import os
 from mangum import Mangum
-import uvicorn
 
 # Running as a script (python3 main.py) requires one
 # Running as a module (python3 -m SearchAPI.main) requires the other
 # I give up. We can get rid of this once we know which method we're using:
 try:
     from application.application import app
+    from application import wkt_cache
 except (ModuleNotFoundError, ImportError):
     from .application.application import app
+    from .application import wkt_cache
 
-# Lambda handle - for any 'serverless'-like environment:
-lambda_handler = Mangum(app)
+# Lambda handle - for any 'serverless'-like environment.
+# (Mangum would run the app's startup/shutdown around every single invocation,
+#  stopping background work like the CMR health refresher each time. The health
+#  monitor starts itself on the first /health instead):
+lambda_handler = Mangum(app, lifespan="off")
+# (So what the lifespan would set up on startup is done here, once per cold start)
+wkt_cache.install()
 
 # Beanstalk handle:
 def run_server() -> None:
@@ -27,6 +33,8 @@ def run_server() -> None:
         raise RuntimeError("ERROR: Both env vars 'OPEN_TO_IP' and 'OPEN_TO_PORT' need to be set!")
     open_to_ip = os.environ["OPEN_TO_IP"]
     open_to_port = int(os.environ["OPEN_TO_PORT"])
+    # Only needed when running as a server, don't make Lambda cold-starts pay for it:
+    import uvicorn  # pylint: disable=import-outside-toplevel
     uvicorn.run(app, host=open_to_ip, port=open_to_port)
 
 if __name__ == "__main__":
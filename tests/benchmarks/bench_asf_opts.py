@@ -0,0 +1,48 @@
+"""
+Micro-benchmark for parsing search keywords (SearchAPI.application.asf_opts.get_asf_opts).
+
+Run with:
+    python -m tests.benchmarks.bench_asf_opts [--number 2000]
+"""
+import argparse
+import logging
+import timeit
+from urllib.parse import parse_qsl
+
+from SearchAPI.application.asf_opts import get_asf_opts
+
+# Representative query strings, from what hits /services/search/param the most:
+QUERY_STRINGS = {
+    "platform": "platform=S1&maxResults=250&output=jsonlite",
+    "aoi+dates": (
+        "platform=SENTINEL-1&processingLevel=SLC&beamMode=IW"
+        "&intersectsWith=POLYGON((-148.52 64.63,-150.41 64.64,-149.65 63.58,-147.73 63.49,-148.52 64.63))"
+        "&start=2021-01-01T00:00:00Z&end=2021-06-01T00:00:00Z&output=geojson"
+    ),
+    "ranges+lists": (
+        "platform=ALOS,ERS-1,ERS-2&relativeOrbit=100-120,150&frame=1-2000"
+        "&offNadirAngle=21.5,34.3&flightDirection=A&lookDirection=R&output=csv"
+    ),
+    "mixed-case+legacy": "PLATFORM=UAVSAR&collectionName=ABoVE&MAXRESULTS=10&Output=kml",
+    "granule_list": "granule_list=" + ",".join(f"S1A_IW_SLC__1SDV_2021010{i}T000000_2021010{i}T000027_036000_043000_0000" for i in range(10)),
+}
+
+def run(number: int) -> dict:
+    timings = {}
+    for name, query_string in QUERY_STRINGS.items():
+        params = dict(parse_qsl(query_string))
+        seconds = timeit.timeit(lambda: get_asf_opts(params), number=number)
+        timings[name] = seconds / number * 1e6
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000, help="Calls per query string")
+    args = parser.parse_args()
+    # Don't benchmark the log handlers:
+    logging.disable(logging.CRITICAL)
+    for name, micro_seconds in run(args.number).items():
+        print(f"{name:>20}: {micro_seconds:8.1f} us/call")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark for the columnar outputs (parquet, arrow) against csv: time to encode a response, the size
+of it, and the time a client takes to load it into a table (csv parsed with type inference, the
+way the analytics notebooks do it, and with the stdlib's csv module).
+
+Products are built from the recorded CMR granules in tests/loadtest/fixtures, so no network is needed.
+There's only a handful of those, repeated, so parquet compresses them far better than it would real results.
+
+Run with:
+    python -m tests.benchmarks.bench_columnar [--products 20000] [--runs 3]
+"""
+import argparse
+import csv
+import io
+import logging
+import statistics
+import time
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from SearchAPI.application.output import as_output
+from tests.benchmarks.bench_serializers import load_products
+
+
+def stdlib_csv(body: bytes) -> list:
+    return list(csv.DictReader(io.StringIO(body.decode("utf-8"))))
+
+LOADERS = {
+    "csv": {
+        "pyarrow.csv": lambda body: pa_csv.read_csv(io.BytesIO(body)),
+        "csv.DictReader": stdlib_csv,
+    },
+    "parquet": {
+        "pyarrow.parquet": lambda body: pq.read_table(io.BytesIO(body)),
+    },
+    "arrow": {
+        "pyarrow.ipc": lambda body: pa.ipc.open_stream(body).read_all(),
+    },
+}
+
+def median_ms(func, runs: int) -> tuple:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20000, help="Products in the result set")
+    parser.add_argument("--runs", type=int, default=3, help="Runs to take the median time of")
+    args = parser.parse_args()
+    # Don't benchmark the log handlers:
+    logging.disable(logging.CRITICAL)
+
+    results = load_products(args.products)
+    print(f"{args.products} products:")
+    print(f"{'output':>8} {'encode ms':>10} {'body MB':>8} {'loader':>16} {'load ms':>9}")
+    for output, loaders in LOADERS.items():
+        encode_ms, response_info = median_ms(lambda output=output: as_output(results, output), args.runs)
+        body = response_info["content"]
+        for name, load in loaders.items():
+            load_ms, _ = median_ms(lambda load=load: load(body), args.runs)
+            print(f"{output:>8} {encode_ms:10.1f} {len(body) / 2**20:8.2f} {name:>16} {load_ms:9.1f}")
+
+if __name__ == "__main__":
+    main()
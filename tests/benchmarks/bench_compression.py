@@ -0,0 +1,62 @@
+"""
+Benchmark for response compression (compression.py): per output and encoding, the body size
+and the time to compress it, both at the level in constants.COMPRESSION_LEVELS and at --levels,
+whole (as on Lambda) and streamed a chunk at a time.
+
+Products are built from the recorded CMR granules in tests/loadtest/fixtures, so no network is needed.
+There's only a handful of those, repeated, so every output compresses far better than real results would.
+Compare the levels against each other, not the ratios against production.
+
+Run with:
+    python -m tests.benchmarks.bench_compression [--products 1500] [--runs 3] [--levels 1 6 9]
+"""
+import argparse
+import logging
+import statistics
+import time
+from unittest import mock
+
+from SearchAPI.application import compression, constants
+from SearchAPI.application.output import as_output, as_stream
+from tests.benchmarks.bench_serializers import load_products
+
+
+def median_ms(func, runs: int) -> tuple:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, result
+
+def compressed_size(response_info: dict, encoding: str, output: str, stream: bool) -> int:
+    if stream:
+        return sum(len(chunk) for chunk in compression.compress_stream(response_info, encoding, output)['content'])
+    return len(compression.compress(response_info, encoding, output)['content'])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1500, help="Products in the result set")
+    parser.add_argument("--runs", type=int, default=3, help="Runs to take the median time of")
+    parser.add_argument("--levels", type=int, nargs="*", default=[1, 6, 9], help="Levels to compare against the configured ones")
+    args = parser.parse_args()
+    # Don't benchmark the log handlers:
+    logging.disable(logging.CRITICAL)
+
+    results = load_products(args.products)
+    print(f"{args.products} products, encodings: {', '.join(compression.ENCODERS)}")
+    print(f"{'output':>9} {'body MB':>8} {'enc':>5} {'level':>9} {'ratio':>7} {'whole ms':>9} {'stream ms':>10}")
+    for output, configured in constants.COMPRESSION_LEVELS.items():
+        body = as_output(results, output)
+        chunks = list(as_stream([results], output)['content'])
+        for encoding in compression.ENCODERS:
+            for level in dict.fromkeys([configured[encoding], *args.levels]):
+                label = f"{level}{'*' if level == configured[encoding] else ''}"
+                with mock.patch.dict(constants.COMPRESSION_LEVELS, {output: {**configured, encoding: level}}):
+                    whole_ms, size = median_ms(lambda: compressed_size(dict(body, headers={}), encoding, output, False), args.runs)
+                    stream_ms, _ = median_ms(lambda: compressed_size(dict(body, content=chunks, headers={}), encoding, output, True), args.runs)
+                print(f"{output:>9} {len(body['content']) / 2**20:8.2f} {encoding:>5} {label:>9} {len(body['content']) / size:7.1f} {whole_ms:9.1f} {stream_ms:10.1f}")
+    print("(* is the configured level)")
+
+if __name__ == "__main__":
+    main()
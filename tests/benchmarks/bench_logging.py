@@ -0,0 +1,57 @@
+"""
+Benchmark for the log formatters/handlers in SearchAPI.logger, in records/sec.
+'queued' is how fast the request thread gets to move on (the writing happens on the
+listener thread), 'queued+flush' includes waiting for the listener to write everything.
+
+Run with:
+    python -m tests.benchmarks.bench_logging [--number 20000]
+"""
+import argparse
+import logging
+import os
+import time
+
+from SearchAPI.logger import AwsStreamFormatter, ConsoleStreamFormatter, build_handler
+
+FORMATTERS = {
+    "aws": AwsStreamFormatter,
+    "console": ConsoleStreamFormatter,
+}
+
+def run(number: int) -> dict:
+    rates = {}
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        for name, formatter in FORMATTERS.items():
+            for queued in (False, True):
+                handler = build_handler(formatter(), stream=devnull, queued=queued)
+                logger = logging.getLogger(f"bench_logging.{name}.{queued}")
+                logger.propagate = False
+                logger.setLevel(logging.DEBUG)
+                logger.addHandler(handler)
+
+                before = time.perf_counter()
+                for i in range(number):
+                    # About what the route logs on every request:
+                    logger.info("Query finished running.", extra={"QueryTime": 0.25, "QueryParams": {"platform": "S1", "maxResults": str(i)}})
+                logged = time.perf_counter()
+                if queued:
+                    # Waits for the listener to drain the queue:
+                    handler.listener.stop()
+                finished = time.perf_counter()
+
+                logger.removeHandler(handler)
+                label = f"{name}{'/queued' if queued else ''}"
+                rates[label] = number / (logged - before)
+                if queued:
+                    rates[f"{label}+flush"] = number / (finished - before)
+    return rates
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="Records per formatter")
+    args = parser.parse_args()
+    for name, rate in run(args.number).items():
+        print(f"{name:>22}: {rate:10.0f} records/sec")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark for the json outputs (jsonlite, jsonlite2, geojson): CPU time and peak memory to render
+a full 1500-product response with the orjson serializers in output.py, against the stdlib json
+encoder they replaced.
+
+Products are built from the recorded CMR granules in tests/loadtest/fixtures, so no network is needed.
+
+Run with:
+    python -m tests.benchmarks.bench_serializers [--products 1500] [--runs 5] [--pretty]
+"""
+import argparse
+import copy
+import itertools
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+
+import asf_search as asf
+from asf_search.export.jsonlite import JSONLiteStreamArray
+from asf_search.export.jsonlite2 import JSONLite2StreamArray
+from asf_search.search.search_generator import as_ASFProduct
+
+from SearchAPI.application.output import as_output
+from tests.loadtest.cmr_stand_in import FIXTURES_PATH
+
+
+def load_products(count: int) -> asf.ASFSearchResults:
+    with open(FIXTURES_PATH, "r", encoding="utf-8") as fixtures_file:
+        granules = json.load(fixtures_file)
+    session = asf.ASFSession()
+    return asf.ASFSearchResults([
+        as_ASFProduct(copy.deepcopy(granule), session=session)
+        for granule in itertools.islice(itertools.cycle(granules), count)
+    ])
+
+def _as_generator(pages):
+    yield from pages
+
+# What output.py did before switching to orjson (stdlib encoder, str fragments):
+def stdlib_json(streamer_class: type, results: asf.ASFSearchResults, pretty: bool) -> bytes:
+    encoder_kwargs = {"indent": 2} if pretty else {"separators": (",", ":")}
+    encoder = json.JSONEncoder(sort_keys=True, **encoder_kwargs)
+    return "".join(encoder.iterencode({"results": streamer_class(_as_generator([results]))})).encode("utf-8")
+
+def stdlib_geojson(results: asf.ASFSearchResults, pretty: bool) -> bytes:
+    features = ", ".join(json.dumps(product.geojson(), indent=2 if pretty else None) for product in results)
+    return ('{"type": "FeatureCollection", "features": [' + features + "]}").encode("utf-8")
+
+SERIALIZERS = {
+    "jsonlite": {
+        "stdlib": lambda results, pretty: stdlib_json(JSONLiteStreamArray, results, pretty),
+        "orjson": lambda results, pretty: as_output(results, "jsonlite", pretty=pretty)["content"],
+    },
+    "jsonlite2": {
+        "stdlib": lambda results, pretty: stdlib_json(JSONLite2StreamArray, results, pretty),
+        "orjson": lambda results, pretty: as_output(results, "jsonlite2", pretty=pretty)["content"],
+    },
+    "geojson": {
+        "stdlib": stdlib_geojson,
+        "orjson": lambda results, pretty: as_output(results, "geojson", pretty=pretty)["content"],
+    },
+}
+
+def measure(serialize, results: asf.ASFSearchResults, pretty: bool, runs: int) -> dict:
+    cpu_times = []
+    for _ in range(runs):
+        before = time.process_time()
+        body = serialize(results, pretty)
+        cpu_times.append(time.process_time() - before)
+    # Separate run for memory, tracemalloc slows everything down:
+    tracemalloc.start()
+    serialize(results, pretty)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_ms": statistics.median(cpu_times) * 1000, "peak_mb": peak / 2**20, "size_mb": len(body) / 2**20}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1500, help="Products in the result set (MAX_RESULTS by default)")
+    parser.add_argument("--runs", type=int, default=5, help="Runs to take the median CPU time of")
+    parser.add_argument("--pretty", action="store_true", help="Benchmark the indented output instead of the compact one")
+    args = parser.parse_args()
+    # Don't benchmark the log handlers:
+    logging.disable(logging.CRITICAL)
+
+    results = load_products(args.products)
+    print(f"{args.products} products, {'pretty' if args.pretty else 'compact'}:")
+    print(f"{'output':>10} {'serializer':>10} {'CPU ms':>9} {'peak MB':>8} {'body MB':>8}")
+    for output, serializers in SERIALIZERS.items():
+        for name, serialize in serializers.items():
+            result = measure(serialize, results, args.pretty, args.runs)
+            print(f"{output:>10} {name:>10} {result['cpu_ms']:9.1f} {result['peak_mb']:8.1f} {result['size_mb']:8.2f}")
+
+if __name__ == "__main__":
+    main()
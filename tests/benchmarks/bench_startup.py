@@ -0,0 +1,133 @@
+"""
+Startup (cold-start) benchmark: how long importing the Lambda handler takes,
+measured with 'python -X importtime' in fresh interpreters.
+
+Prints the median import time of SearchAPI.main (minus an empty interpreter's startup),
+and the packages that take the longest to import. Exits non-zero if the import goes over
+'--budget-ms', or if our code imports any of LAZY_MODULES at startup, so it can gate CI.
+(tests/unit/test_startup.py runs the same check with the unit tests.)
+
+Run with:
+    python -m tests.benchmarks.bench_startup [--runs 5] [--budget-ms 2500]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+TARGET = "SearchAPI.main"
+
+# Only loaded on first use, by the code that needs them. Importing any of these at startup is a regression.
+# Some of them are still loaded at startup by our dependencies: asf_search imports shapely, and
+# requests (through urllib3) imports brotli. Those are reported, but only our own imports fail the check:
+LAZY_MODULES = (
+    "uvicorn",
+    "httpx",
+    "brotli",
+    "zstandard",
+    "pyarrow",
+    "shapely",
+)
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+def import_times(statement: str) -> list:
+    """
+    Runs 'statement' in a fresh interpreter, returns (self us, cumulative us, depth, module) per import.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in process.stderr.splitlines():
+        # i.e. "import time:       422 |     113127 |   uvicorn"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        imports.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return imports
+
+def total_ms(imports: list) -> float:
+    return sum(cumulative for _, cumulative, depth, _ in imports if depth == 0) / 1000
+
+def importers(imports: list) -> dict:
+    """
+    The module that first imported each of LAZY_MODULES, if any did.
+    importtime lists each module after everything it imports, so its importers are the ones after it, a level up.
+    (Skipping the lazy module's own submodules, i.e. 'import shapely.geometry' imports 'shapely' first)
+    """
+    found = {}
+    for index, (_, _, depth, name) in enumerate(imports):
+        if name not in LAZY_MODULES or name in found:
+            continue
+        found[name] = None
+        for _, _, parent_depth, parent in imports[index + 1:]:
+            if parent_depth >= depth:
+                continue
+            depth = parent_depth
+            if parent.split(".")[0] != name:
+                found[name] = parent
+                break
+    return found
+
+def eager_imports(result: dict) -> list:
+    """
+    The LAZY_MODULES our own code imported at startup.
+    """
+    return sorted(
+        module for module, importer in result["importers"].items()
+        if importer is None or importer.split(".")[0] in ("SearchAPI", "tests")
+    )
+
+def run(runs: int) -> dict:
+    baseline = statistics.median(total_ms(import_times("pass")) for _ in range(runs))
+    totals = []
+    by_package = defaultdict(list)
+    for _ in range(runs):
+        imports = import_times(f"import {TARGET}")
+        totals.append(total_ms(imports) - baseline)
+        package_self = defaultdict(int)
+        for self_us, _, _, name in imports:
+            package_self[name.split(".")[0]] += self_us
+        for package, self_us in package_self.items():
+            by_package[package].append(self_us / 1000)
+    return {
+        "import_ms": statistics.median(totals),
+        "packages_ms": {package: statistics.median(times) for package, times in by_package.items()},
+        "modules": {name for *_, name in imports},
+        "importers": importers(imports),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to take the median of")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if importing the handler takes longer than this")
+    parser.add_argument("--top", type=int, default=15, help="How many of the slowest packages to show")
+    args = parser.parse_args()
+
+    result = run(args.runs)
+    print(f"import {TARGET}: {result['import_ms']:.0f} ms (median of {args.runs})")
+    slowest = sorted(result["packages_ms"].items(), key=lambda item: item[1], reverse=True)[:args.top]
+    for package, milliseconds in slowest:
+        print(f"{package:>30}: {milliseconds:8.1f} ms")
+
+    failed = False
+    for module, importer in sorted(result["importers"].items()):
+        print(f"{module} imported at startup by {importer or TARGET}")
+    if eager := eager_imports(result):
+        print(f"FAIL: imported at startup, but should be lazy: {', '.join(eager)}")
+        failed = True
+    if args.budget_ms is not None and result["import_ms"] > args.budget_ms:
+        print(f"FAIL: over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark for the WKT validation cache (SearchAPI.application.wkt_cache): repeat validations of the same
+large AOI, against asf_search's 'validate_wkt' doing the repair/simplify from scratch every time.
+
+The AOIs are multipolygons of rough circles, with '--vertices' points each (plus one crossing the
+antimeridian, so it gets wrapped). Every other repeat is re-spaced/lower-cased, the way the same shape
+comes in from different clients, so it only hits the cache through the normalizing.
+
+Run with:
+    python -m tests.benchmarks.bench_wkt [--vertices 2000] [--polygons 4] [--repeats 50]
+"""
+import argparse
+import logging
+import math
+import time
+
+import asf_search as asf
+
+from SearchAPI.application import wkt_cache
+
+
+def circle(lon: float, lat: float, radius: float, vertices: int) -> str:
+    points = [
+        (lon + radius * math.cos(2 * math.pi * i / vertices), lat + radius * math.sin(2 * math.pi * i / vertices))
+        for i in range(vertices)
+    ]
+    points.append(points[0])
+    return "((" + ",".join(f"{x:.6f} {y:.6f}" for x, y in points) + "))"
+
+def multipolygon(polygons: int, vertices: int) -> str:
+    # Spread out so they don't overlap, with the last one over the antimeridian:
+    centers = [(-150 + 10 * i, 60 - 5 * i) for i in range(polygons - 1)] + [(179.5, 10)]
+    return "MULTIPOLYGON(" + ",".join(circle(lon, lat, 2, vertices) for lon, lat in centers) + ")"
+
+def respaced(wkt: str) -> str:
+    return wkt.lower().replace(",", " , ").replace("(", "( ")
+
+def time_calls(validate, wkts: list) -> float:
+    start = time.perf_counter()
+    for wkt in wkts:
+        validate(wkt)
+    return (time.perf_counter() - start) / len(wkts) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vertices", type=int, default=2000, help="Vertices per polygon")
+    parser.add_argument("--polygons", type=int, default=4, help="Polygons in the multipolygon")
+    parser.add_argument("--repeats", type=int, default=50, help="Times the same AOI is validated")
+    args = parser.parse_args()
+    # Don't benchmark asf_search's repair warnings:
+    logging.disable(logging.CRITICAL)
+
+    aoi = multipolygon(args.polygons, args.vertices)
+    repeats = [aoi if i % 2 == 0 else respaced(aoi) for i in range(args.repeats)]
+    print(f"MULTIPOLYGON, {args.polygons} x {args.vertices} vertices ({len(aoi) / 1024:.0f} KB of WKT), {args.repeats} repeats:")
+
+    uncached_ms = time_calls(asf.validate_wkt, repeats)
+    first_ms = time_calls(wkt_cache.validate_wkt, [aoi])
+    cached_ms = time_calls(wkt_cache.validate_wkt, repeats)
+    print(f"{'asf.validate_wkt (every call)':>34} {uncached_ms:10.3f} ms/call")
+    print(f"{'wkt_cache.validate_wkt (miss)':>34} {first_ms:10.3f} ms/call")
+    print(f"{'wkt_cache.validate_wkt (repeats)':>34} {cached_ms:10.3f} ms/call  ({uncached_ms / cached_ms:.0f}x)")
+    print(f"cache: {wkt_cache.wkt_cache_stats()}")
+
+if __name__ == "__main__":
+    main()
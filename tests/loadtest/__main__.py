@@ -0,0 +1,78 @@
+"""
+Offline load test: runs the API (in-process, or under uvicorn) against a local CMR stand-in,
+hits it with concurrent clients, and reports p50/p95/p99 latency, throughput and memory
+per endpoint and output format. No AWS or network access needed.
+
+Run with:
+    python -m tests.loadtest [--workload replay] [--concurrency 16] [--requests 500] [--rps 50]
+
+i.e. to compare against a deployed stack's numbers, give the stand-in a realistic CMR round-trip:
+    python -m tests.loadtest --mode uvicorn --cmr-latency-ms 300 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+from .cmr_stand_in import CMRStandIn, serve_cmr
+from .runner import app_client, format_report, run_load, summarize
+from .workloads import DEFAULT_QUERIES, REPLAY_PATH, from_combinations, from_replay
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess", help="How to run the API")
+    parser.add_argument("--workload", choices=["combinations", "replay"], default="combinations",
+                        help="'combinations' of workloads.DEFAULT_QUERIES, or a 'replay' of recorded requests")
+    parser.add_argument("--replay", default=REPLAY_PATH, help="JSON-lines file for '--workload replay'")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--requests", type=int, default=None, help="How many requests to send (Default: the workload, 3 times over)")
+    parser.add_argument("--rps", type=float, default=None, help="Requests/sec to start. (Default: as fast as the clients can go)")
+    parser.add_argument("--cmr-hits", type=int, default=1000, help="How many granules every stand-in CMR search matches")
+    parser.add_argument("--cmr-latency-ms", type=float, default=0, help="Delay before the stand-in answers each CMR request")
+    parser.add_argument("--cache", choices=["none", "memory", "sqlite"], default="none",
+                        help="Response cache backend. 'none' turns the baseline stack cache off too. (Default 'none', so every request goes to the stand-in)")
+    parser.add_argument("--logs", action="store_true", help="Keep the API's INFO/DEBUG logs on")
+    parser.add_argument("--json", default=None, help="Also write the report to this file, as JSON")
+    args = parser.parse_args()
+
+    # Has to be set before the app's first request builds its cache:
+    os.environ["SEARCHAPI_CACHE"] = args.cache
+    if args.cache == "none":
+        os.environ["SEARCHAPI_STACK_CACHE_MAX_PRODUCTS"] = "0"
+    if not args.logs:
+        logging.disable(logging.INFO)
+    # pylint: disable=import-outside-toplevel
+    from SearchAPI.application.application import app
+    from SearchAPI.application.asf_env import load_config_file
+
+    if args.workload == "replay":
+        workload = from_replay(args.replay)
+    else:
+        workload = from_combinations(DEFAULT_QUERIES)
+    total = args.requests if args.requests is not None else len(workload) * 3
+
+    stand_in = CMRStandIn(hits=args.cmr_hits, latency=args.cmr_latency_ms / 1000)
+    cmr_hosts = {config["cmr_base"] for config in load_config_file().values()}
+
+    async def run():
+        async with app_client(app, mode=args.mode) as client:
+            before = time.perf_counter()
+            results = await run_load(client, workload, concurrency=args.concurrency, total=total, rps=args.rps)
+            return results, time.perf_counter() - before
+
+    with serve_cmr(stand_in, hosts=cmr_hosts):
+        results, wall_seconds = asyncio.run(run())
+
+    rows = summarize(results, wall_seconds)
+    print(format_report(rows))
+    print(f"\n{len(results)} requests in {wall_seconds:.1f}s ({args.mode}, concurrency {args.concurrency}), "
+          f"{stand_in.requests} stand-in CMR requests")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as report_file:
+            json.dump({"args": vars(args), "wall_seconds": wall_seconds, "rows": rows}, report_file, indent=2)
+
+if __name__ == "__main__":
+    main()
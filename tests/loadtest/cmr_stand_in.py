@@ -0,0 +1,186 @@
+"""
+A local stand-in for CMR, so the API can be load-tested offline.
+
+Every granule search is answered from the recorded UMM-JSON granules in 'fixtures/umm_granules.json'
+(taken from asf_search's own test resources), paged the way CMR pages them: 'CMR-Hits' on every
+page, and a 'CMR-Search-After' header until the last one.
+
+Granule names/URs, collection ids and exact attribute values (beam mode, path, etc) are filtered on,
+so the reference lookup for a baseline stack finds the real reference scene, and its stack only has
+scenes with baselines. Other searches are padded out to 'hits' granules.
+"""
+import asyncio
+import copy
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "umm_granules.json")
+
+# CMR's own default:
+DEFAULT_PAGE_SIZE = 10
+
+
+class CMRStandIn:
+    """
+    'hits' is how many granules every search matches (cycling through the fixtures to fill them),
+    'latency' is how many seconds to wait before answering each request, like a real round-trip.
+    Pages starting at or past 'short_pages_after' come back a granule short, like CMR does when it's struggling.
+    """
+    def __init__(self, hits: int = 1000, latency: float = 0.0, fixtures_path: str = FIXTURES_PATH, short_pages_after: int = None):
+        self.hits = hits
+        self.latency = latency
+        self.short_pages_after = short_pages_after
+        with open(fixtures_path, "r", encoding="utf-8") as fixtures_file:
+            self.granules = json.load(fixtures_file)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def respond(self, method: str, url: str, headers: dict, body) -> Tuple[int, dict, bytes]:
+        """
+        Answers one request to CMR. Returns (status code, headers, body).
+        """
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._answer(url, headers, body)
+
+    async def respond_async(self, method: str, url: str, headers: dict, body) -> Tuple[int, dict, bytes]:
+        """
+        Same as 'respond', but waits out the latency without blocking the event loop.
+        """
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._answer(url, headers, body)
+
+    def _answer(self, url: str, headers: dict, body) -> Tuple[int, dict, bytes]:
+        parts = urlsplit(url)
+        if parts.path.endswith("/health"):
+            return 200, {"Content-Type": "application/json"}, json.dumps({"echo": {"ok?": True}, "ingest": {"ok?": True}}).encode()
+        if not parts.path.endswith(".umm_json"):
+            return 404, {"Content-Type": "application/json"}, json.dumps({"errors": [f"No fixtures for {parts.path}"]}).encode()
+
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        params = parse_qs(parts.query)
+        for key, values in parse_qs(body or "").items():
+            params.setdefault(key, []).extend(values)
+        return self._search(params, search_after=headers.get("CMR-Search-After"))
+
+    def _search(self, params: dict, search_after: str = None) -> Tuple[int, dict, bytes]:
+        matches, hits = self._matches(params)
+        page_size = int(params.get("page_size", [DEFAULT_PAGE_SIZE])[0])
+        offset = int(search_after or 0)
+        count = max(0, min(page_size, hits - offset))
+        items = [copy.deepcopy(matches[(offset + i) % len(matches)]) for i in range(count)] if matches else []
+        if self.short_pages_after is not None and offset >= self.short_pages_after:
+            items = items[:-1]
+
+        headers = {"Content-Type": "application/vnd.nasa.cmr.umm_results+json", "CMR-Hits": str(hits)}
+        if offset + count < hits:
+            headers["CMR-Search-After"] = str(offset + count)
+        return 200, headers, json.dumps({"hits": hits, "took": 1, "items": items}).encode()
+
+    def _matches(self, params: dict) -> Tuple[list, int]:
+        names = set(params.get("readable_granule_name[]", []) + params.get("granule_ur[]", []))
+        collections = set(params.get("echo_collection_id[]", []))
+        attributes = [attribute.split(",") for attribute in params.get("attribute[]", [])]
+        matches = [
+            granule for granule in self.granules
+            if (not names or names.intersection(_granule_names(granule)))
+            and (not collections or _in_collections(granule, collections))
+            and all(_has_attribute(granule, attribute) for attribute in attributes)
+        ]
+        # A search by name only finds those granules. Anything else is padded out to 'hits':
+        if names or not matches:
+            return matches, len(matches)
+        return matches, self.hits
+
+
+def _granule_names(granule: dict) -> Iterable[str]:
+    umm = granule["umm"]
+    yield umm["GranuleUR"]
+    for identifier in umm.get("DataGranule", {}).get("Identifiers", []):
+        yield identifier["Identifier"]
+
+
+def _in_collections(granule: dict, collections: set) -> bool:
+    # The fixtures only know the collection of some granules. Let the others through:
+    collection = granule["meta"].get("collection-concept-id")
+    return collection is None or collection in collections
+
+def _has_attribute(granule: dict, attribute: list) -> bool:
+    # Only exact matches ("type,NAME,value"), ranges etc. aren't filtered on:
+    if len(attribute) != 3:
+        return True
+    _, name, value = attribute
+    for additional_attribute in granule["umm"].get("AdditionalAttributes", []):
+        if additional_attribute["Name"] == name:
+            return value in additional_attribute.get("Values", [])
+    return False
+
+
+class CMRStandInAdapter(BaseAdapter):
+    """
+    A requests transport adapter that answers from a CMRStandIn, instead of going over the network.
+    """
+    def __init__(self, stand_in: CMRStandIn):
+        super().__init__()
+        self.stand_in = stand_in
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        status, headers, content = self.stand_in.respond(request.method, request.url, request.headers, request.body)
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = content
+        response.request = request
+        response.url = request.url
+        response.encoding = "utf-8"
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+@contextmanager
+def serve_cmr(stand_in: CMRStandIn, hosts: Iterable[str]) -> Iterator[CMRStandIn]:
+    """
+    Sends every request to 'hosts' to 'stand_in' for as long as the block runs, however the
+    session/adapter/client was built (The API's pooled sessions mount their own adapters, and
+    the async CMR client has its own httpx transport). Requests to any other host go out like normal.
+    """
+    hosts = set(hosts)
+    adapter = CMRStandInAdapter(stand_in)
+    original_send = HTTPAdapter.send
+    original_handle_async_request = httpx.AsyncHTTPTransport.handle_async_request
+
+    def send(self, request, **kwargs):
+        if urlsplit(request.url).hostname in hosts:
+            return adapter.send(request, **kwargs)
+        return original_send(self, request, **kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host not in hosts:
+            return await original_handle_async_request(self, request)
+        status, headers, content = await stand_in.respond_async(request.method, str(request.url), request.headers, await request.aread())
+        return httpx.Response(status, headers=headers, content=content, request=request)
+
+    HTTPAdapter.send = send
+    httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+    try:
+        yield stand_in
+    finally:
+        HTTPAdapter.send = original_send
+        httpx.AsyncHTTPTransport.handle_async_request = original_handle_async_request
@@ -0,0 +1,176 @@
+"""
+Drives concurrent requests at the API, and reports latency/throughput/memory per endpoint and output format.
+"""
+import asyncio
+import os
+import resource
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, NamedTuple, Optional
+
+import httpx
+
+from .workloads import Request
+
+# Endpoints where the output format changes what the API does:
+SEARCH_ENDPOINTS = ("/services/search/param", "/services/search/baseline")
+
+
+class Result(NamedTuple):
+    group: str
+    # 0 if the request never got a response:
+    status: int
+    seconds: float
+    size: int
+    # Resident memory of this process, right after the request finished:
+    rss: int
+
+
+def request_group(request: Request) -> str:
+    if request.endpoint in SEARCH_ENDPOINTS:
+        output = str(request.params.get("output", "metalink")).lower()
+        return f"{request.endpoint} [{output}]"
+    return request.endpoint
+
+def current_rss() -> int:
+    """
+    Resident memory of this process in bytes (The app runs in this process, in both modes).
+    """
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Not linux. Only the peak is available, in KB:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@asynccontextmanager
+async def app_client(app, mode: str = "inprocess") -> AsyncIterator[httpx.AsyncClient]:
+    """
+    A client for 'app'. "inprocess" calls the ASGI app directly, "uvicorn"
+    runs it under a real uvicorn server on a free local port (in a background thread).
+    """
+    timeout = httpx.Timeout(120)
+    if mode == "inprocess":
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=timeout) as client:
+            yield client
+        return
+    if mode != "uvicorn":
+        raise ValueError(f"Unknown mode '{mode}'. Expected 'inprocess' or 'uvicorn'")
+
+    import uvicorn  # pylint: disable=import-outside-toplevel
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, name="loadtest-uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn failed to start")
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=timeout, limits=limits) as client:
+            yield client
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+async def run_load(
+        client: httpx.AsyncClient,
+        workload: List[Request],
+        concurrency: int,
+        total: int,
+        rps: Optional[float] = None,
+    ) -> List[Result]:
+    """
+    Sends 'total' requests, cycling through 'workload', with at most 'concurrency' in flight.
+
+    Without 'rps', each client sends its next request as soon as the last one finishes.
+    With it, requests are started on a fixed schedule, and latency is measured from when
+    each one was *scheduled*, so a backed-up server can't hide its queueing time.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    results: List[Result] = []
+    start = time.perf_counter()
+
+    async def produce():
+        for i in range(total):
+            scheduled = None
+            if rps:
+                scheduled = start + i / rps
+                if (delay := scheduled - time.perf_counter()) > 0:
+                    await asyncio.sleep(delay)
+            await queue.put((workload[i % len(workload)], scheduled))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def consume():
+        while (item := await queue.get()) is not None:
+            request, scheduled = item
+            before = scheduled if scheduled is not None else time.perf_counter()
+            try:
+                if request.json is not None:
+                    response = await client.request(request.method, request.endpoint, params=request.params, json=request.json)
+                elif request.method == "GET":
+                    response = await client.get(request.endpoint, params=request.params)
+                else:
+                    response = await client.request(request.method, request.endpoint, data=request.params)
+                status, size = response.status_code, len(response.content)
+            except httpx.HTTPError:
+                status, size = 0, 0
+            results.append(Result(
+                group=request_group(request),
+                status=status,
+                seconds=time.perf_counter() - before,
+                size=size,
+                rss=current_rss(),
+            ))
+
+    await asyncio.gather(produce(), *(consume() for _ in range(concurrency)))
+    return results
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return float("nan")
+    rank = max(1, round(percent / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize(results: List[Result], wall_seconds: float) -> List[dict]:
+    """
+    One row per group (endpoint + output format), then one for everything.
+    """
+    groups = {}
+    for result in results:
+        groups.setdefault(result.group, []).append(result)
+    rows = []
+    for group, group_results in sorted(groups.items()) + [("TOTAL", results)]:
+        latencies = sorted(result.seconds for result in group_results)
+        rows.append({
+            "group": group,
+            "requests": len(group_results),
+            "errors": sum(1 for result in group_results if not 200 <= result.status < 300),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            # Share of the run's wall time, so the groups add up to the total:
+            "throughput_rps": len(group_results) / wall_seconds,
+            "mb_per_request": sum(result.size for result in group_results) / len(group_results) / 2**20,
+            "peak_rss_mb": max(result.rss for result in group_results) / 2**20,
+        })
+    return rows
+
+def format_report(rows: List[dict]) -> str:
+    header = f"{'endpoint [output]':<44} {'reqs':>6} {'errs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'MB/req':>7} {'RSS MB':>7}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(
+            f"{row['group']:<44} {row['requests']:>6} {row['errors']:>5} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f}"
+            f" {row['p99_ms']:>9.1f} {row['throughput_rps']:>8.1f} {row['mb_per_request']:>7.2f} {row['peak_rss_mb']:>7.0f}"
+        )
+    return "\n".join(lines)
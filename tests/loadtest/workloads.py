@@ -0,0 +1,76 @@
+"""
+Where the load tester's requests come from:
+ - query_combinations: every combination of a dict of possible values (what LoadTesterApiKiller3000's 'complex_query' runs).
+ - from_replay: a JSON-lines file of recorded requests, like 'requests.jsonl' next to this file.
+"""
+import itertools
+import json
+import os
+from typing import List, NamedTuple, Optional
+
+REPLAY_PATH = os.path.join(os.path.dirname(__file__), "requests.jsonl")
+
+DEFAULT_ENDPOINT = "/services/search/param"
+
+# A mix of the searches we see the most, in every output format:
+DEFAULT_QUERIES = {
+    "endpoint": DEFAULT_ENDPOINT,
+    "maxResults": [5, 250],
+    "platform": ["S1", "ALOS"],
+    "intersectsWith": [
+        "linestring(-119.543 37.925, -118.443 37.7421)",
+        "polygon((-119.543 37.925, -118.443 37.7421, -118.682 36.8525, -119.77 37.0352, -119.543 37.925 ))",
+    ],
+    "output": ["jsonlite", "geojson", "csv", "kml", "metalink", "count"],
+}
+
+
+class Request(NamedTuple):
+    endpoint: str
+    params: dict
+    method: str = "GET"
+    # Sent as a JSON body, instead of 'params' being sent as a form:
+    json: Optional[dict] = None
+
+
+def query_combinations(query_dict: dict) -> List[dict]:
+    """
+    Every combination of the values in 'query_dict', as a list of query dicts.
+    Values that aren't lists are in every combination, i.e:
+        {"platform": ["S1", "ALOS"], "maxResults": 5}
+        -> [{"platform": "S1", "maxResults": 5}, {"platform": "ALOS", "maxResults": 5}]
+    """
+    keys = list(query_dict)
+    values = [value if isinstance(value, list) else [value] for value in query_dict.values()]
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+def from_combinations(query_dict: dict) -> List[Request]:
+    """
+    query_combinations, as Requests. The "endpoint" key says where to send each one.
+    """
+    requests = []
+    for query in query_combinations(query_dict):
+        endpoint = query.pop("endpoint", DEFAULT_ENDPOINT)
+        requests.append(Request(endpoint=endpoint, params=query))
+    return requests
+
+def from_replay(path: str = REPLAY_PATH) -> List[Request]:
+    """
+    Reads recorded requests, one JSON object per line:
+        {"endpoint": "/services/search/param", "params": {"platform": "S1"}, "method": "GET"}
+        {"endpoint": "/services/utils/wkt", "method": "POST", "json": {"wkt": "POINT(0 0)"}}
+    ("method" defaults to GET, blank lines and lines starting with '#' are skipped)
+    """
+    requests = []
+    with open(path, "r", encoding="utf-8") as replay_file:
+        for line in replay_file:
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            recorded = json.loads(line)
+            requests.append(Request(
+                endpoint=recorded["endpoint"],
+                params=recorded.get("params", {}),
+                method=recorded.get("method", "GET").upper(),
+                json=recorded.get("json"),
+            ))
+    return requests
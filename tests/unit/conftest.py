@@ -0,0 +1,53 @@
+"""
+Shared fixtures for running the API in-process, against the CMR stand-in from tests/loadtest
+(so nothing here needs the network).
+"""
+import asyncio
+
+import pytest
+
+from SearchAPI.application import application, cache, cmr_client, executor
+from SearchAPI.application.asf_env import load_config_file
+from tests.loadtest.cmr_stand_in import CMRStandIn, serve_cmr
+from tests.loadtest.runner import app_client
+
+# Every maturity's CMR goes to the stand-in:
+CMR_HOSTS = {config['cmr_base'] for config in load_config_file().values()}
+
+
+@pytest.fixture
+def cmr():
+    """
+    The CMR stand-in. Every search matches 'hits' granules, set 'latency' to slow it down.
+    """
+    with serve_cmr(CMRStandIn(hits=3000), CMR_HOSTS) as stand_in:
+        yield stand_in
+
+@pytest.fixture
+def app(monkeypatch):
+    """
+    The API, with its per-worker executor, caches and CMR clients reset. They're built on
+    first use, so a test can size them with the SEARCHAPI_* env vars before its first request.
+    """
+    monkeypatch.setattr(executor, '_executor', None)
+    monkeypatch.setattr(executor, '_parse_pool', None)
+    monkeypatch.setattr(cache, '_response_cache', None)
+    monkeypatch.setattr(cache, '_stack_cache', None)
+    monkeypatch.setattr(cmr_client, '_clients', {})
+    yield application.app
+    if executor._executor is not None:
+        executor._executor.shutdown(wait=False)
+    if executor._parse_pool is not None:
+        executor._parse_pool.shutdown(wait=False)
+
+@pytest.fixture
+def call_api(app):
+    """
+    Runs 'test(client)' against the app, and returns what it does. Fails if it takes longer than 'timeout' seconds.
+    """
+    def call(test, timeout: float = 60):
+        async def run():
+            async with app_client(app) as client:
+                return await asyncio.wait_for(test(client), timeout)
+        return asyncio.run(run())
+    return call
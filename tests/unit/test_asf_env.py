@@ -0,0 +1,23 @@
+from SearchAPI.application import asf_env
+from SearchAPI.application.asf_env import load_config_file, load_config_maturity
+
+
+def test_maturities_fill_in_from_default():
+    default = load_config_file()['default']
+    for maturity in load_config_file():
+        config = load_config_maturity(maturity)
+        for block in ('session_pool', 'cmr_client', 'list_search', 'bulk_download'):
+            assert config[block] == default[block]
+
+def test_maturity_overrides_default():
+    config = load_config_maturity('prod')
+    assert config['cmr_base'] == 'cmr.earthdata.nasa.gov'
+    assert config['cmr_headers']['Client-Id'] != load_config_file()['default']['cmr_headers']['Client-Id']
+
+def test_merge_is_recursive():
+    configs = asf_env._merge_defaults({
+        'default': {'page_size': 250, 'pool': {'size': 4, 'ttl': 60}},
+        'prod': {'pool': {'size': 32}, 'extra': [1, 2]},
+    })
+    assert configs['prod'] == {'page_size': 250, 'pool': {'size': 32, 'ttl': 60}, 'extra': [1, 2]}
+    assert configs['default'] == {'page_size': 250, 'pool': {'size': 4, 'ttl': 60}}
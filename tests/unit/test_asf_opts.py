@@ -0,0 +1,35 @@
+import pytest
+from fastapi import HTTPException
+
+from SearchAPI.application import application  # noqa: F401 (Importing the app builds KEYWORD_TABLE)
+from SearchAPI.application.asf_opts import KEYWORD_TABLE, get_asf_opts, string_to_list, string_to_num_or_range_list
+
+
+@pytest.mark.parametrize('keyword, key, destringify', [
+    ('maxresults', 'maxResults', None),
+    ('platform', 'platform', string_to_list),
+    ('relativeorbit', 'relativeOrbit', string_to_num_or_range_list),
+    ('offnadirangle', 'offNadirAngle', string_to_num_or_range_list),
+    ('absoluteorbit', 'absoluteOrbit', string_to_num_or_range_list),
+    # Legacy alias:
+    ('collectionname', 'campaign', None),
+])
+def test_keyword_table(keyword, key, destringify):
+    assert KEYWORD_TABLE[keyword].key == key
+    assert KEYWORD_TABLE[keyword].destringify is destringify
+
+def test_keyword_table_is_read_only():
+    with pytest.raises(TypeError):
+        KEYWORD_TABLE['platform'] = None
+
+def test_get_asf_opts():
+    opts = get_asf_opts({'PLATFORM': 'S1,ALOS', 'RelativeOrbit': '100-120,150', 'MAXRESULTS': '10', 'collectionName': 'ABoVE', 'output': 'csv'})
+    assert opts.platform == ['S1', 'ALOS']
+    assert opts.relativeOrbit == [(100, 120), 150]
+    assert opts.maxResults == 10
+    assert opts.campaign == 'ABoVE'
+
+def test_get_asf_opts_bad_range():
+    with pytest.raises(HTTPException) as exc_info:
+        get_asf_opts({'relativeOrbit': '120-100'})
+    assert exc_info.value.status_code == 400
@@ -0,0 +1,51 @@
+import orjson
+import pytest
+
+
+def batch_lines(call_api, body) -> list:
+    async def search(client):
+        return await client.post('/services/search/batch', json=body)
+    response = call_api(search)
+    assert response.status_code == 200
+    return sorted((orjson.loads(line) for line in response.content.splitlines()), key=lambda line: line['index'])
+
+
+def test_bad_queries_only_fail_themselves(app, cmr, call_api):
+    lines = batch_lines(call_api, [
+        {'platform': 'S1', 'output': 'count'},
+        {'platform': 'S1', 'output': 5},
+        'S1',
+        {'platform': 'S1', 'output': 'kml'},
+        {'platform': 'S1', 'relativeOrbit': 'abc', 'output': 'count'},
+        {'platform': 'S1', 'output': 'jsonlite', 'maxResults': 2},
+    ])
+    assert [line['index'] for line in lines] == list(range(6))
+    assert lines[0]['hits'] == cmr.hits
+    for line in lines[1:5]:
+        assert line['error']['status'] == 400
+    assert len(lines[5]['response']['results']) == 2
+
+def test_shared_keywords_go_to_every_query(app, cmr, call_api):
+    lines = batch_lines(call_api, {
+        'output': 'count',
+        'relativeOrbit': 'abc',
+        'queries': [
+            {'platform': 'S1'},
+            # Its own value wins:
+            {'platform': 'S1', 'relativeOrbit': 5},
+        ],
+    })
+    assert lines[0]['error']['status'] == 400
+    assert 'error' not in lines[1]
+    assert isinstance(lines[1]['hits'], int)
+
+@pytest.mark.parametrize('body', [
+    {'platform': 'S1'},
+    {'queries': 'S1'},
+    [],
+    {'queries': [{'platform': 'S1'}], 'maturity': 5},
+])
+def test_bad_batch(app, cmr, call_api, body):
+    async def search(client):
+        return await client.post('/services/search/batch', json=body)
+    assert call_api(search).status_code == 400
@@ -0,0 +1,188 @@
+import asf_search as asf
+import pytest
+import tenacity
+from asf_search.exceptions import CMRIncompleteError
+from asf_search.search.search_generator import query_cmr
+
+from SearchAPI.application import application, cmr_client
+from SearchAPI.application.cache import (
+    CachedResponse, CachedStack, CompletePages, MemoryCacheBackend, ResponseCache, StackCache,
+    get_response_cache, search_cache_key, stack_cache_key,
+)
+
+PARAMS = {'platform': 'S1', 'output': 'jsonlite', 'maxResults': 5}
+
+
+def test_same_search_same_key():
+    opts = asf.ASFSearchOptions(platform='S1', maxResults=5)
+    key = search_cache_key(opts, 'jsonlite', 'prod')
+    assert search_cache_key(asf.ASFSearchOptions(maxResults=5, platform='S1'), 'JSONLITE', 'prod') == key
+    # The session is how the search is sent, not what it finds:
+    assert search_cache_key(asf.ASFSearchOptions(platform='S1', maxResults=5, session=asf.ASFSession()), 'jsonlite', 'prod') == key
+
+@pytest.mark.parametrize('opts, output, maturity, pretty', [
+    (asf.ASFSearchOptions(platform='S1', maxResults=6), 'jsonlite', 'prod', False),
+    (asf.ASFSearchOptions(platform='S1', maxResults=5), 'geojson', 'prod', False),
+    (asf.ASFSearchOptions(platform='S1', maxResults=5), 'jsonlite', 'test', False),
+    (asf.ASFSearchOptions(platform='S1', maxResults=5), 'jsonlite', 'prod', True),
+])
+def test_different_response_different_key(opts, output, maturity, pretty):
+    assert search_cache_key(opts, output, maturity, pretty) != search_cache_key(asf.ASFSearchOptions(platform='S1', maxResults=5), 'jsonlite', 'prod')
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_bytes=10)
+    for key in 'abc':
+        backend.set(key, CachedResponse(content=b'1234', media_type='text/plain', headers={}), ttl=60)
+        # Keep 'a' fresh:
+        backend.get('a')
+    assert backend.get('a') is not None
+    assert backend.get('b') is None
+    assert backend.get('c') is not None
+
+def test_memory_backend_expires_entries():
+    backend = MemoryCacheBackend(max_bytes=10)
+    backend.set('a', CachedResponse(content=b'1234', media_type='text/plain', headers={}), ttl=0)
+    assert backend.get('a') is None
+
+def pages_then_error():
+    yield asf.ASFSearchResults([])
+    raise CMRIncompleteError('CMR returned page of incomplete results')
+
+@pytest.mark.parametrize('pages, cached', [
+    ([asf.ASFSearchResults([]), asf.ASFSearchResults([])], True),
+    (pages_then_error(), False),
+])
+def test_stream_is_only_cached_once_complete(pages, cached):
+    cache = ResponseCache(MemoryCacheBackend(max_bytes=2**20), ttl=60, max_entry_bytes=2**20)
+    pages = CompletePages(pages)
+    body = (b'page' for _ in pages)
+    stream = cache.cache_stream('key', {'content': body, 'media_type': 'text/plain', 'headers': {}}, is_complete=lambda: pages.complete)
+    try:
+        assert b''.join(stream) == b'pagepage'
+    except CMRIncompleteError:
+        assert not cached
+    assert (cache.get('key') is not None) == cached
+
+def test_stream_cut_short_isnt_cached():
+    # i.e. the serializer stopped reading pages early:
+    cache = ResponseCache(MemoryCacheBackend(max_bytes=2**20), ttl=60, max_entry_bytes=2**20)
+    stream = cache.cache_stream('key', {'content': iter([b'page']), 'media_type': 'text/plain', 'headers': {}}, is_complete=lambda: False)
+    assert b''.join(stream) == b'page'
+    assert cache.get('key') is None
+
+
+REFERENCE = 'S1B_IW_SLC__1SDV_20210102T032031_20210102T032058_024970_02F8C3_C081'
+
+def test_same_stack_same_key():
+    key = stack_cache_key(REFERENCE, asf.ASFSearchOptions(), 'prod')
+    assert stack_cache_key(REFERENCE, asf.ASFSearchOptions(session=asf.ASFSession()), 'prod') == key
+
+@pytest.mark.parametrize('reference, opts, maturity', [
+    ('ALPSRP111041130', asf.ASFSearchOptions(), 'prod'),
+    (REFERENCE, asf.ASFSearchOptions(start='2021-01-01T00:00:00Z'), 'prod'),
+    # The same reference can be a different stack in another maturity's CMR:
+    (REFERENCE, asf.ASFSearchOptions(), 'test'),
+    (REFERENCE, asf.ASFSearchOptions(), 'prod-private'),
+])
+def test_different_stack_different_key(reference, opts, maturity):
+    assert stack_cache_key(reference, opts, maturity) != stack_cache_key(REFERENCE, asf.ASFSearchOptions(), 'prod')
+
+def cached_stack(products: int = 0, count: int = None) -> CachedStack:
+    return CachedStack(reference=None, stack_opts=None, stack=list(range(products)), count=products if count is None else count)
+
+def test_stack_cache_hit_and_miss():
+    stacks = StackCache(max_products=100, ttl=60)
+    assert stacks.get('a') is None
+    stack = cached_stack(3)
+    stacks.set('a', stack)
+    assert stacks.get('a') is stack
+    assert stacks.get('b') is None
+
+def test_stack_cache_expires_entries():
+    stacks = StackCache(max_products=100, ttl=0)
+    stacks.set('a', cached_stack(3))
+    assert stacks.get('a') is None
+
+def test_stack_cache_evicts_least_recently_used_by_products():
+    # Each entry is the reference, plus its stack:
+    stacks = StackCache(max_products=8, ttl=60)
+    stacks.set('a', cached_stack(3))
+    stacks.set('b', cached_stack(3))
+    stacks.get('a')
+    stacks.set('c', cached_stack(1))
+    assert [key for key in 'abc' if stacks.get(key) is not None] == ['a', 'c']
+    # Too big to ever fit, so it isn't cached at all (and doesn't push anything out):
+    stacks.set('d', cached_stack(8))
+    assert [key for key in 'abcd' if stacks.get(key) is not None] == ['a', 'c']
+
+def test_stack_cache_replaces_an_entry():
+    stacks = StackCache(max_products=5, ttl=60)
+    stacks.set('a', cached_stack(count=10))
+    stacks.set('a', cached_stack(3))
+    stacks.set('b', cached_stack(0))
+    assert stacks.get('a').count == 3
+    assert stacks.get('b') is not None
+
+def baseline(call_api, cmr, params: dict) -> tuple:
+    async def get(client):
+        response = await client.get('/services/search/baseline', params={'reference': REFERENCE, **params})
+        return response, cmr.requests
+    return call_api(get)
+
+def test_second_stack_is_a_hit_in_any_output(app, cmr, call_api):
+    cmr.hits = 20
+    miss, requests = baseline(call_api, cmr, {'output': 'csv'})
+    hit, requests_after_hit = baseline(call_api, cmr, {'output': 'jsonlite'})
+    assert (miss.status_code, hit.status_code) == (200, 200)
+    assert (miss.headers['X-Cache'], hit.headers['X-Cache']) == ('MISS', 'HIT')
+    assert requests_after_hit == requests
+    assert hit.headers['CMR-Hits'] == miss.headers['CMR-Hits']
+
+def test_stacks_are_cached_per_maturity(app, cmr, call_api):
+    cmr.hits = 20
+    responses = [baseline(call_api, cmr, {'output': 'csv', 'maturity': maturity})[0] for maturity in ('prod', 'test', 'prod', 'test')]
+    assert [response.headers['X-Cache'] for response in responses] == ['MISS', 'MISS', 'HIT', 'HIT']
+
+
+def search(call_api, cmr, params: dict) -> tuple:
+    """
+    Returns the response, and how many requests CMR has had by the time it's all read.
+    """
+    async def get(client):
+        response = await client.get('/services/search/param', params=params)
+        return response, cmr.requests
+    return call_api(get)
+
+@pytest.mark.parametrize('streaming', ['TRUE', 'FALSE'])
+def test_second_search_is_a_hit(monkeypatch, app, cmr, call_api, streaming):
+    monkeypatch.setenv('SEARCHAPI_STREAMING', streaming)
+    monkeypatch.setenv('SEARCHAPI_CACHE', 'memory')
+    miss, requests = search(call_api, cmr, PARAMS)
+    hit, requests_after_hit = search(call_api, cmr, PARAMS)
+    assert (miss.headers['X-Cache'], hit.headers['X-Cache']) == ('MISS', 'HIT')
+    assert hit.content == miss.content
+    # The hit never went to CMR:
+    assert requests_after_hit == requests
+
+def test_searches_with_a_cmr_token_arent_cached(monkeypatch, app, cmr, call_api):
+    monkeypatch.setenv('SEARCHAPI_CACHE', 'memory')
+    for _ in range(2):
+        response, _ = search(call_api, cmr, {**PARAMS, 'cmr_token': 'secret'})
+        assert response.status_code == 200
+        assert 'X-Cache' not in response.headers
+
+@pytest.mark.parametrize('use_async', [True, False])
+def test_search_that_fails_partway_isnt_cached(monkeypatch, app, cmr, call_api, use_async):
+    monkeypatch.setenv('SEARCHAPI_STREAMING', 'TRUE')
+    monkeypatch.setenv('SEARCHAPI_CACHE', 'memory')
+    monkeypatch.setattr(cmr_client, 'INCOMPLETE_PAGE_WAIT', 0)
+    monkeypatch.setattr(query_cmr.retry, 'wait', tenacity.wait_none())
+    if not use_async:
+        # Same as 'use_async: False' in maturities.yml:
+        monkeypatch.setattr(application, 'get_cmr_client', lambda maturity=None: None)
+    # The first page is fine, so the response has already started by the time CMR gives up:
+    cmr.hits = 600
+    cmr.short_pages_after = 250
+    with pytest.raises(CMRIncompleteError):
+        search(call_api, cmr, {'platform': 'S1', 'output': 'jsonlite'})
+    assert not get_response_cache().backend._entries
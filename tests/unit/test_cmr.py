@@ -0,0 +1,86 @@
+import asf_search as asf
+import pytest
+import requests
+
+from SearchAPI.application import application
+from SearchAPI.application.cmr import CMRHits, count_cmr_hits
+
+
+def cmr_page(body: str, hits: int, search_after: str = None) -> requests.Response:
+    """
+    A response to a CMR page request, as the session's response hook sees it.
+    """
+    request = requests.Request('POST', 'https://cmr.earthdata.nasa.gov/search/granules.umm_json', data=body)
+    if search_after is not None:
+        request.headers['CMR-Search-After'] = search_after
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['CMR-Hits'] = str(hits)
+    response.request = request.prepare()
+    return response
+
+def test_hits_come_from_each_subquerys_first_page():
+    cmr_hits = CMRHits()
+    cmr_hits(cmr_page('platform=S1&beamMode=IW', 700))
+    cmr_hits(cmr_page('platform=S1&beamMode=IW', 700, search_after='["after"]'))
+    # A retried first page isn't counted twice:
+    cmr_hits(cmr_page('platform=S1&beamMode=IW', 700))
+    cmr_hits(cmr_page('platform=S1&beamMode=EW', 50))
+    assert (cmr_hits.subqueries, cmr_hits.hits) == (2, 750)
+
+def test_is_complete_once_every_subquery_reported():
+    opts = asf.ASFSearchOptions(platform='S1', beamMode=['IW', 'EW'])
+    cmr_hits = CMRHits()
+    cmr_hits.record('platform=S1&beamMode=IW', 700)
+    assert not cmr_hits.is_complete(opts)
+    cmr_hits.record('platform=S1&beamMode=EW', 50)
+    assert cmr_hits.is_complete(opts)
+
+def test_is_complete_for_searches_split_up_differently():
+    cmr_hits = CMRHits()
+    cmr_hits.expect(3)
+    cmr_hits.record('chunk 1', 250)
+    assert not cmr_hits.is_complete(asf.ASFSearchOptions(granule_list=['a']))
+    cmr_hits.record('chunk 2', 250)
+    cmr_hits.record('chunk 3', 10)
+    assert cmr_hits.is_complete(asf.ASFSearchOptions(granule_list=['a']))
+
+def test_count_cmr_hits_unhooks_itself():
+    session = asf.ASFSession()
+    hooks = list(session.hooks['response'])
+    with count_cmr_hits(session) as cmr_hits:
+        assert cmr_hits in session.hooks['response']
+        session.hooks['response'][-1](cmr_page('platform=S1', 5))
+    assert session.hooks['response'] == hooks
+    assert cmr_hits.hits == 5
+
+
+@pytest.mark.parametrize('use_async', [True, False])
+@pytest.mark.parametrize('streaming', ['TRUE', 'FALSE'])
+def test_cmr_hits_header(monkeypatch, app, cmr, call_api, use_async, streaming):
+    monkeypatch.setenv('SEARCHAPI_STREAMING', streaming)
+    monkeypatch.setenv('SEARCHAPI_CACHE', 'none')
+    if not use_async:
+        monkeypatch.setattr(application, 'get_cmr_client', lambda maturity=None: None)
+    cmr.hits = 300
+
+    async def search(client):
+        return await client.get('/services/search/param', params={'platform': 'S1', 'beamMode': 'IW', 'output': 'jsonlite'})
+    response = call_api(search)
+    assert len(response.json()['results']) == 300
+    assert response.headers['CMR-Hits'] == '300'
+
+@pytest.mark.parametrize('use_async', [True, False])
+@pytest.mark.parametrize('streaming', ['TRUE', 'FALSE'])
+def test_no_cmr_hits_header_when_maxresults_skips_subqueries(monkeypatch, app, cmr, call_api, use_async, streaming):
+    monkeypatch.setenv('SEARCHAPI_STREAMING', streaming)
+    monkeypatch.setenv('SEARCHAPI_CACHE', 'none')
+    if not use_async:
+        monkeypatch.setattr(application, 'get_cmr_client', lambda maturity=None: None)
+
+    async def search(client):
+        # Two subqueries (one per beam mode), the first one has plenty:
+        return await client.get('/services/search/param', params={'platform': 'S1', 'beamMode': 'IW,EW', 'output': 'jsonlite', 'maxResults': 5})
+    response = call_api(search)
+    assert len(response.json()['results']) == 5
+    assert 'CMR-Hits' not in response.headers
@@ -0,0 +1,90 @@
+import asyncio
+
+import asf_search as asf
+import pytest
+
+from SearchAPI.application import cmr_client
+from SearchAPI.application.asf_internals import CMRIncompleteError
+from SearchAPI.application.cmr import CMRHits
+
+
+@pytest.mark.parametrize('workers', [1, 2, 4])
+def test_streamed_searches_fill_every_executor_thread(monkeypatch, app, cmr, call_api, workers):
+    # Each streamed search's serializer holds an executor thread while it waits on the next CMR page.
+    # With as many searches as threads, the pages have to be parsed somewhere else, or nothing finishes:
+    monkeypatch.setenv('SEARCHAPI_EXECUTOR_WORKERS', str(workers))
+    monkeypatch.setenv('SEARCHAPI_STREAMING', 'TRUE')
+    monkeypatch.setenv('SEARCHAPI_CACHE', 'none')
+    # (Slow enough that the serializer is always waiting by the time the next page comes in)
+    cmr.latency = 1
+
+    async def searches(client):
+        return await asyncio.gather(*(
+            client.get('/services/search/param', params={'platform': 'S1', 'output': 'jsonlite', 'maxResults': 750})
+            for _ in range(workers)
+        ))
+    for response in call_api(searches, timeout=30):
+        assert response.status_code == 200
+        assert len(response.json()['results']) == 750
+
+def test_incomplete_page_fails_the_stream(monkeypatch, app, cmr, call_api):
+    monkeypatch.setenv('SEARCHAPI_STREAMING', 'TRUE')
+    monkeypatch.setenv('SEARCHAPI_CACHE', 'none')
+    monkeypatch.setattr(cmr_client, 'INCOMPLETE_PAGE_WAIT', 0)
+    # The first page is fine, so the response has already started by the time CMR gives up:
+    cmr.hits = 600
+    cmr.short_pages_after = 250
+
+    async def search(client):
+        return await client.get('/services/search/param', params={'platform': 'S1', 'output': 'jsonlite'})
+    # Not a normal end to the stream, with only the first 250 results:
+    with pytest.raises(CMRIncompleteError):
+        call_api(search)
+
+
+def search_pages(call_api, opts: asf.ASFSearchOptions, cmr_hits: CMRHits = None) -> list:
+    """
+    Every page AsyncCMRClient.search_pages yields for 'opts'.
+    """
+    async def search(client):
+        return [page async for page in cmr_client.get_cmr_client('local').search_pages(opts, cmr_hits)]
+    return call_api(search)
+
+def test_pages_through_cmr(app, cmr, call_api):
+    cmr.hits = 600
+    pages = search_pages(call_api, asf.ASFSearchOptions(platform='S1'))
+    # One page per CMR page, and only the last one is the end of the search:
+    assert [len(page) for page in pages] == [250, 250, 100]
+    assert [page.searchComplete for page in pages] == [False, False, True]
+    assert cmr.requests == 3
+    assert len({product.properties['fileID'] for page in pages for product in page}) == len(cmr.granules)
+
+def test_subqueries_are_merged_in_order(app, cmr, call_api):
+    cmr.hits = 300
+    cmr_hits = CMRHits()
+    # Split into a subquery per beam mode:
+    pages = search_pages(call_api, asf.ASFSearchOptions(platform='S1', beamMode=['IW', 'FBS']), cmr_hits)
+    beam_modes = [product.properties['beamModeType'] for page in pages for product in page]
+    assert beam_modes == ['IW'] * 300 + ['FBS'] * 300
+    # Each subquery's last page is the end of that subquery:
+    assert [len(page) for page in pages] == [250, 50, 250, 50]
+    assert [page.searchComplete for page in pages] == [False, True, False, True]
+    assert (cmr_hits.subqueries, cmr_hits.hits) == (2, 600)
+
+@pytest.mark.parametrize('max_results, pages, requests', [
+    (100, [100], 1),
+    (250, [250], 1),
+    (400, [250, 150], 2),
+])
+def test_stops_at_max_results(app, cmr, call_api, max_results, pages, requests):
+    found = search_pages(call_api, asf.ASFSearchOptions(platform='S1', maxResults=max_results))
+    assert [len(page) for page in found] == pages
+    assert found[-1].searchComplete
+    # Nothing past maxResults is asked for (CMR has 3000):
+    assert cmr.requests == requests
+
+def test_stops_at_max_results_in_the_first_subquery(app, cmr, call_api):
+    cmr.hits = 300
+    found = search_pages(call_api, asf.ASFSearchOptions(platform='S1', beamMode=['IW', 'FBS'], maxResults=260))
+    assert [len(page) for page in found] == [250, 10]
+    assert all(product.properties['beamModeType'] == 'IW' for page in found for product in page)
@@ -0,0 +1,88 @@
+import json
+from datetime import datetime
+
+import asf_search as asf
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+shapely = pytest.importorskip('shapely')
+
+from SearchAPI.application import columnar  # noqa: E402 (Only once pyarrow's known to be there)
+from SearchAPI.application.asf_internals import as_ASFProduct  # noqa: E402
+from tests.loadtest.cmr_stand_in import FIXTURES_PATH  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def products():
+    with open(FIXTURES_PATH, 'r', encoding='utf-8') as fixtures_file:
+        return [as_ASFProduct(granule, session=asf.ASFSession()) for granule in json.load(fixtures_file)]
+
+def pages(products, page_size: int = 4):
+    return [asf.ASFSearchResults(products[i:i + page_size]) for i in range(0, len(products), page_size)]
+
+def read_parquet(products, batch_size: int):
+    return pq.read_table(pa.BufferReader(b''.join(columnar.parquet_stream(pages(products), batch_size=batch_size))))
+
+
+def test_parquet_round_trip(products):
+    table = read_parquet(products, batch_size=len(products))
+    assert table.schema.remove_metadata() == columnar.SCHEMA.remove_metadata()
+    assert table.num_rows == len(products)
+    rows = table.to_pylist()
+    for product, row in zip(products, rows):
+        assert row['sceneName'] == product.properties['sceneName']
+        assert row['fileID'] == product.properties['fileID']
+        assert row['bytes'] == product.properties['bytes']
+        assert row['startTime'] == datetime.fromisoformat(product.properties['startTime'])
+        assert shapely.from_wkb(row['geometry']).equals(shapely.geometry.shape(product.geometry))
+
+def test_parquet_has_geoparquet_metadata(products):
+    metadata = read_parquet(products, batch_size=len(products)).schema.metadata
+    geo = json.loads(metadata[b'geo'])
+    assert geo == columnar.GEO_METADATA
+    assert geo['primary_column'] == 'geometry'
+    assert geo['columns']['geometry']['encoding'] == 'WKB'
+
+def test_one_row_group_per_batch(products):
+    data = b''.join(columnar.parquet_stream(pages(products), batch_size=4))
+    assert pq.ParquetFile(pa.BufferReader(data)).num_row_groups == 2
+
+def test_properties_without_a_column_are_kept(products):
+    rows = read_parquet(products, batch_size=len(products)).to_pylist()
+    for product, row in zip(products, rows):
+        other = {name: value for name, value in product.properties.items() if name not in columnar.COLUMN_NAMES}
+        assert other
+        assert json.loads(row['otherProperties']) == json.loads(json.dumps(other, default=str))
+
+def test_arrow_round_trip(products):
+    data = b''.join(columnar.arrow_stream(pages(products), batch_size=4))
+    table = pa.ipc.open_stream(data).read_all()
+    assert table['sceneName'].to_pylist() == [product.properties['sceneName'] for product in products]
+    assert json.loads(table.schema.metadata[b'geo']) == columnar.GEO_METADATA
+
+def test_empty_search_is_still_a_file():
+    table = pq.read_table(pa.BufferReader(b''.join(columnar.parquet_stream([asf.ASFSearchResults([])]))))
+    assert table.num_rows == 0
+    assert b'geo' in table.schema.metadata
+
+@pytest.mark.parametrize('value, expected', [('287', 287), (12, 12), ('NA', None), (None, None)])
+def test_int_columns_take_strings(value, expected):
+    assert columnar._int(value) == expected
+
+def test_timestamps_without_a_zone():
+    timestamps = columnar._timestamps(['2021-01-01T00:00:00Z', '2021-01-01T00:00:00.5', 'nonsense', None]).to_pylist()
+    assert [timestamp.isoformat() if timestamp else None for timestamp in timestamps] == [
+        '2021-01-01T00:00:00+00:00', '2021-01-01T00:00:00.500000+00:00', None, None,
+    ]
+
+
+def test_parquet_search(app, cmr, call_api):
+    async def search(client):
+        return await client.get('/services/search/param', params={'platform': 'S1', 'output': 'parquet', 'maxResults': 300})
+    response = call_api(search)
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'application/vnd.apache.parquet'
+    table = pq.read_table(pa.BufferReader(response.content))
+    assert table.num_rows == 300
+    assert b'geo' in table.schema.metadata
@@ -0,0 +1,118 @@
+import gzip
+import zlib
+
+import pytest
+from fastapi import Request
+
+from SearchAPI.application import compression
+
+BODY = b'{"results": [' + b', '.join(b'{"granuleName": "S1A_IW_SLC__1SDV_%d"}' % i for i in range(200)) + b']}'
+
+
+@pytest.fixture
+def every_encoder(monkeypatch):
+    # Negotiating doesn't need the packages, so it works the same whether or not brotli/zstandard are installed:
+    monkeypatch.setattr(compression, 'ENCODERS', {'zstd': compression._Zstd, 'br': compression._Brotli, 'gzip': compression._Gzip})
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    (None, None),
+    ('', None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('GZIP', 'gzip'),
+    ('gzip, deflate, br', 'br'),
+    ('gzip, deflate, br, zstd', 'zstd'),
+    # Ties go to the better one:
+    ('gzip;q=0.5, br;q=0.5', 'br'),
+    ('gzip;q=1.0, br;q=0.5, zstd;q=0.1', 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('*', 'zstd'),
+    ('*;q=0.5, zstd;q=0.1', 'br'),
+    ('gzip, *;q=0', 'gzip'),
+    ('*;q=0', None),
+    ('gzip;q=0', None),
+    ('gzip;q=nonsense', None),
+    ('deflate, compress', None),
+    (' br ; q=0.8 , gzip ; q=0.9 ', 'gzip'),
+])
+def test_negotiate(every_encoder, accept_encoding, expected):
+    assert compression.negotiate(accept_encoding) == expected
+
+def test_negotiate_skips_encoders_that_arent_installed(monkeypatch):
+    monkeypatch.setattr(compression, 'ENCODERS', {'gzip': compression._Gzip})
+    assert compression.negotiate('zstd, br') is None
+    assert compression.negotiate('zstd, br;q=0.9, gzip;q=0.1') == 'gzip'
+
+
+def decompress(encoding: str, data: bytes) -> bytes:
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    if encoding == 'br':
+        return pytest.importorskip('brotli').decompress(data)
+    return pytest.importorskip('zstandard').ZstdDecompressor().decompressobj().decompress(data)
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br', 'zstd'])
+def test_compress_round_trip(encoding):
+    if encoding not in compression.ENCODERS:
+        pytest.skip(f'{encoding} is not installed')
+    response_info = compression.compress({'content': BODY, 'media_type': 'application/json', 'headers': {}}, encoding, 'jsonlite')
+    assert response_info['headers'] == {'Vary': 'Accept-Encoding', 'Content-Encoding': encoding}
+    assert decompress(encoding, response_info['content']) == BODY
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br', 'zstd'])
+def test_compress_stream_round_trip(encoding):
+    if encoding not in compression.ENCODERS:
+        pytest.skip(f'{encoding} is not installed')
+    chunks = [BODY[i:i + 700] for i in range(0, len(BODY), 700)]
+    response_info = compression.compress_stream({'content': iter(chunks), 'media_type': 'application/json', 'headers': {}}, encoding, 'jsonlite')
+    assert response_info['headers']['Content-Encoding'] == encoding
+    assert decompress(encoding, b''.join(response_info['content'])) == BODY
+
+def test_gzip_chunks_are_flushed():
+    # Each chunk can be decompressed as soon as it's sent:
+    chunks = [BODY[:2000], BODY[2000:]]
+    stream = compression.compress_stream({'content': iter(chunks), 'media_type': 'application/json', 'headers': {}}, 'gzip', 'jsonlite')['content']
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(next(stream)) == chunks[0]
+
+@pytest.mark.parametrize('content', [b'{}', b'x' * 1023])
+def test_small_bodies_go_out_as_is(content):
+    response_info = compression.compress({'content': content, 'media_type': 'application/json', 'headers': {}}, 'gzip', 'jsonlite')
+    assert response_info['content'] == content
+    assert response_info['headers'] == {'Vary': 'Accept-Encoding'}
+    response_info = compression.compress_stream({'content': iter([content[:1], content[1:]]), 'media_type': 'application/json', 'headers': {}}, 'gzip', 'jsonlite')
+    assert b''.join(response_info['content']) == content
+    assert 'Content-Encoding' not in response_info['headers']
+
+@pytest.mark.parametrize('output, expected', [('jsonlite', 'gzip'), ('JSONLITE', 'gzip'), ('count', None), ('parquet', None)])
+def test_response_encoding(output, expected):
+    request = Request({'type': 'http', 'headers': [(b'accept-encoding', b'gzip')]})
+    assert compression.response_encoding(request, output) == expected
+
+
+def search(call_api, headers: dict, params: dict = None):
+    async def get(client):
+        return await client.get('/services/search/param', params=params or {'platform': 'S1', 'output': 'jsonlite', 'maxResults': 50}, headers=headers)
+    return call_api(get)
+
+@pytest.mark.parametrize('streaming', ['TRUE', 'FALSE'])
+def test_search_is_compressed(monkeypatch, app, cmr, call_api, streaming):
+    monkeypatch.setenv('SEARCHAPI_STREAMING', streaming)
+    response = search(call_api, {'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    # (httpx decodes it)
+    assert len(response.json()['results']) == 50
+
+def test_search_without_accept_encoding(app, cmr, call_api):
+    response = search(call_api, {'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert len(response.json()['results']) == 50
+
+def test_compression_turned_off(monkeypatch, app, cmr, call_api):
+    monkeypatch.setenv('SEARCHAPI_COMPRESSION', 'FALSE')
+    response = search(call_api, {'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert 'Vary' not in response.headers
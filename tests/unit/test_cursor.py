@@ -0,0 +1,86 @@
+import base64
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+from SearchAPI.application import application
+from SearchAPI.application.cursor import CURSOR_VERSION, SearchCursor, decode_cursor, encode_cursor, first_cursor
+
+QUERY = '0123456789abcdef'
+
+
+def token(*fields) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(list(fields))).rstrip(b'=').decode('ascii')
+
+
+@pytest.mark.parametrize('cursor', [
+    first_cursor(QUERY),
+    SearchCursor(query=QUERY, subquery=2, search_after='["s1-granule",1698796800000]', offset=500, skip=120),
+])
+def test_cursor_round_trip(cursor):
+    assert decode_cursor(encode_cursor(cursor), QUERY) == cursor
+
+@pytest.mark.parametrize('tampered', [
+    'not a cursor!',
+    token(),
+    token({'version': CURSOR_VERSION}),
+    token(CURSOR_VERSION, QUERY, 'x', None, 0, 0),
+    token(CURSOR_VERSION, QUERY, -1, None, 0, 0),
+    token(CURSOR_VERSION, QUERY, 0, None, 0, []),
+    token(CURSOR_VERSION, QUERY, 0, None, 0, -5),
+    token(CURSOR_VERSION, QUERY, 0, None, 0, 250),
+    token(CURSOR_VERSION, QUERY, 0, None, 1.5, 0),
+    token(CURSOR_VERSION, QUERY, 0, None, True, 0),
+    token(CURSOR_VERSION, QUERY, 0, 5, 0, 0),
+    token(CURSOR_VERSION, QUERY, 0, 'after\r\nX-Injected: 1', 0, 0),
+    token(CURSOR_VERSION, QUERY, 0, None, 0, 0, 1500),
+    token(CURSOR_VERSION, QUERY, 0, None, 0),
+    token('2', QUERY, 0, None, 0, 0),
+])
+def test_tampered_cursors_are_rejected(tampered):
+    with pytest.raises(HTTPException) as exc_info:
+        decode_cursor(tampered, QUERY)
+    assert exc_info.value.status_code == 400
+
+def test_cursor_from_another_search():
+    with pytest.raises(HTTPException) as exc_info:
+        decode_cursor(encode_cursor(first_cursor('fedcba9876543210')), QUERY)
+    assert exc_info.value.status_code == 400
+    assert 'different search' in exc_info.value.detail
+
+def test_cursor_from_an_older_version():
+    # Version 1 cursors carried the hit count along:
+    with pytest.raises(HTTPException) as exc_info:
+        decode_cursor(token(1, QUERY, 0, None, 0, 0, 300), QUERY)
+    assert exc_info.value.status_code == 400
+    assert 'older version' in exc_info.value.detail
+
+
+@pytest.mark.parametrize('use_async', [True, False])
+def test_walk_every_page(monkeypatch, app, cmr, call_api, use_async):
+    if not use_async:
+        # Same as 'use_async: False' in maturities.yml:
+        monkeypatch.setattr(application, 'get_cmr_client', lambda maturity=None: None)
+    cmr.hits = 300
+    params = {'platform': 'S1', 'output': 'ndjson', 'maxResults': 70}
+
+    async def walk(client):
+        pages = []
+        cursor = None
+        while True:
+            response = await client.get('/services/search/param', params={**params, **({'cursor': cursor} if cursor else {})})
+            assert response.status_code == 200
+            pages.append(response)
+            if (cursor := response.headers.get('Next-Cursor')) is None:
+                return pages
+    pages = call_api(walk)
+    assert [len(page.content.splitlines()) for page in pages] == [70, 70, 70, 70, 20]
+    assert {page.headers['CMR-Hits'] for page in pages} == {'300'}
+
+def test_tampered_cursor_is_a_400(app, cmr, call_api):
+    async def search(client):
+        return await client.get('/services/search/param', params={
+            'platform': 'S1', 'output': 'ndjson', 'cursor': token(CURSOR_VERSION, QUERY, 'x', None, 0, []),
+        })
+    assert call_api(search).status_code == 400
@@ -0,0 +1,88 @@
+import asyncio
+import time
+from urllib.parse import parse_qs
+
+import asf_search as asf
+import httpx
+import pytest
+
+from SearchAPI.application import download, output
+from SearchAPI.application.cache import MemoryCacheBackend
+from SearchAPI.application.download import BulkDownloadClient
+
+URLS = ['https://datapool.asf.alaska.edu/SLC/SA/S1A_IW_SLC__1SDV_20231101T000000.zip']
+
+
+@pytest.fixture
+def bulk_download():
+    """
+    A BulkDownloadClient, talking to a bulk-download API that writes the filename it's sent into the script.
+    """
+    client = BulkDownloadClient(
+        url='https://bulk-download.test/', timeout=5, max_connections=1, max_keepalive_connections=1,
+        idle_timeout=1, script_cache=MemoryCacheBackend(max_bytes=2**20),
+    )
+    client.requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        form = parse_qs(request.content.decode('utf-8'))
+        client.requests.append(form)
+        return httpx.Response(200, text=f"# Usage: python {form['filename'][0]}\nURLS = {form['products'][0].split(',')}\n")
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    yield client
+    client.close()
+
+
+def test_cached_script_has_each_requests_filename(bulk_download):
+    first = bulk_download.script(URLS, filename='asf-results-1.py')
+    second = bulk_download.script(URLS, filename='asf-results-2.py')
+    assert len(bulk_download.requests) == 1
+    assert 'python asf-results-1.py' in first
+    assert 'python asf-results-2.py' in second
+    assert 'asf-results-1.py' not in second
+
+def test_download_goes_to_the_searchs_maturity(monkeypatch):
+    maturities = []
+
+    class Client:
+        def script(self, urls, filename=None):
+            return f'# {filename}\n'
+
+    def get_client(maturity=None):
+        maturities.append(maturity)
+        return Client()
+    monkeypatch.setattr(output, 'get_bulk_download_client', get_client)
+    output.as_output(asf.ASFSearchResults([]), 'download', maturity='test')
+    assert maturities == ['test']
+
+def test_closing_clients_doesnt_block_the_event_loop(monkeypatch):
+    closed = []
+
+    class Client:
+        def close(self):
+            # (BulkDownloadClient.close blocks while its loop shuts down)
+            time.sleep(0.2)
+            closed.append(self)
+    clients = {'prod': Client(), 'test': Client()}
+    monkeypatch.setattr(download, '_clients', dict(clients))
+
+    async def close_while_ticking():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+        ticker = asyncio.create_task(tick())
+        start = time.perf_counter()
+        await download.close_bulk_download_clients()
+        elapsed = time.perf_counter() - start
+        ticker.cancel()
+        return ticks, elapsed
+    ticks, elapsed = asyncio.run(close_while_ticking())
+    assert ticks > 5
+    # Side by side, not one after the other:
+    assert elapsed < 0.35
+    assert sorted(map(id, closed)) == sorted(map(id, clients.values()))
+    assert not download._clients
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from SearchAPI.application import application, constants
+from SearchAPI.application.executor import BoundedExecutor
+
+
+def test_full_executor_rejects_with_a_503():
+    executor = BoundedExecutor(max_workers=1, queue_depth=1)
+    release = threading.Event()
+
+    async def requests():
+        # One running, one queued behind it. The third has nowhere to go:
+        running = [asyncio.ensure_future(executor.run(release.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as exc_info:
+            await executor.run(lambda: 'rejected')
+        release.set()
+        await asyncio.gather(*running)
+        return exc_info.value
+    try:
+        rejected = asyncio.run(requests())
+        assert rejected.status_code == 503
+        assert rejected.headers == {'Retry-After': str(constants.EXECUTOR_RETRY_AFTER)}
+        # Once they're done, their slots are free again:
+        assert asyncio.run(executor.run(lambda: 'accepted')) == 'accepted'
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def is_full(executor: BoundedExecutor) -> bool:
+    try:
+        asyncio.run(executor.run(lambda: None))
+    except HTTPException as exc:
+        assert exc.status_code == 503
+        return True
+    return False
+
+async def read(stream, items: int = None) -> list:
+    read_items = []
+    async for item in stream:
+        read_items.append(item)
+        if len(read_items) == items:
+            break
+    return read_items
+
+def test_stream_holds_a_slot_until_its_done():
+    executor = BoundedExecutor(max_workers=1, queue_depth=0)
+    try:
+        stream = executor.iterate(iter([1, 2, 3]))
+        assert is_full(executor)
+        # A second stream is turned away before it starts, not partway through:
+        with pytest.raises(HTTPException) as exc_info:
+            executor.iterate(iter([]))
+        assert exc_info.value.status_code == 503
+        assert asyncio.run(read(stream)) == [1, 2, 3]
+        assert not is_full(executor)
+    finally:
+        executor.shutdown()
+
+def failing():
+    yield 1
+    raise ValueError('serializer failed')
+
+def closed_partway(stream):
+    # i.e. the client disconnected:
+    async def read_one():
+        assert await read(stream, items=1) == [1]
+        await stream.aclose()
+    asyncio.run(read_one())
+
+def raised(stream):
+    with pytest.raises(ValueError):
+        asyncio.run(read(stream))
+
+def never_started(stream):
+    del stream
+
+@pytest.mark.parametrize('end_stream', [closed_partway, raised, never_started])
+def test_stream_gives_its_slot_back_however_it_ends(end_stream):
+    executor = BoundedExecutor(max_workers=1, queue_depth=0)
+    try:
+        end_stream(executor.iterate(failing()))
+        assert not is_full(executor)
+    finally:
+        executor.shutdown()
+
+@pytest.mark.parametrize('use_async', [True, False])
+def test_streamed_search_fits_in_one_slot(monkeypatch, app, cmr, call_api, use_async):
+    monkeypatch.setenv('SEARCHAPI_EXECUTOR_WORKERS', '1')
+    monkeypatch.setenv('SEARCHAPI_EXECUTOR_QUEUE_DEPTH', '0')
+    monkeypatch.setenv('SEARCHAPI_STREAMING', 'TRUE')
+    if not use_async:
+        monkeypatch.setattr(application, 'get_cmr_client', lambda maturity=None: None)
+
+    async def search(client):
+        return await client.get('/services/search/param', params={'platform': 'S1', 'output': 'csv', 'maxResults': 300})
+    # Setting the stream up, then streaming it, one after the other:
+    assert call_api(search).status_code == 200
+    assert call_api(search).status_code == 200
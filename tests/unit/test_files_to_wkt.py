@@ -0,0 +1,138 @@
+import asyncio
+import json
+import math
+
+import asf_search as asf
+import pytest
+import shapely
+from fastapi import HTTPException
+from shapely.geometry import Polygon
+from starlette.requests import Request
+
+from SearchAPI.application import constants
+from SearchAPI.application.files_to_wkt import read_upload, simplify_to_budget
+
+SQUARE = {
+    'type': 'FeatureCollection',
+    'features': [{
+        'type': 'Feature',
+        'properties': {},
+        'geometry': {'type': 'Polygon', 'coordinates': [[[-150, 64], [-149, 64], [-149, 65], [-150, 65], [-150, 64]]]},
+    }],
+}
+
+
+def circle(vertices: int, radius: float = 1.0, center: tuple = (-150, 64)) -> Polygon:
+    # A little jagged, so it doesn't simplify down to nothing:
+    return Polygon([
+        (center[0] + radius * (1 + 0.01 * (i % 2)) * math.cos(2 * math.pi * i / vertices),
+         center[1] + radius * (1 + 0.01 * (i % 2)) * math.sin(2 * math.pi * i / vertices))
+        for i in range(vertices)
+    ])
+
+def geojson_file(geometry: dict = None, size: int = None) -> bytes:
+    """
+    A geojson file with 'geometry' (The square by default), padded out to exactly 'size' bytes.
+    """
+    collection = SQUARE if geometry is None else {**SQUARE, 'features': [{**SQUARE['features'][0], 'geometry': geometry}]}
+    data = json.dumps(collection).encode('utf-8')
+    if size is not None:
+        assert len(data) <= size
+        data += b' ' * (size - len(data))
+    return data
+
+def upload(call_api, *files: bytes):
+    async def post(client):
+        return await client.post(
+            '/services/utils/files_to_wkt',
+            files=[('files', (f'aoi{i}.geojson', data, 'application/geo+json')) for i, data in enumerate(files)],
+        )
+    return call_api(post)
+
+def read(*files: bytes) -> list:
+    """
+    Sizes of the files 'read_upload' reads out of a multipart upload of 'files'. Sent without
+    a Content-Length (i.e. chunked), so nothing's turned away up front: it's all counted as it streams in.
+    """
+    boundary = 'boundary'
+    body = b''.join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="aoi{i}.geojson"\r\n\r\n'.encode() + data + b'\r\n'
+        for i, data in enumerate(files)
+    ) + f'--{boundary}--\r\n'.encode()
+    chunks = [body[i:i + 1000] for i in range(0, len(body), 1000)]
+
+    async def receive():
+        return {'type': 'http.request', 'body': chunks.pop(0), 'more_body': bool(chunks)}
+    request = Request({
+        'type': 'http',
+        'method': 'POST',
+        'headers': [(b'content-type', f'multipart/form-data; boundary={boundary}'.encode())],
+    }, receive)
+
+    async def read_files():
+        return [file.size for file in await read_upload(request)]
+    return asyncio.run(read_files())
+
+@pytest.fixture
+def small_limits(monkeypatch):
+    monkeypatch.setattr(constants, 'FILES_TO_WKT_MAX_FILE_BYTES', 4096)
+    monkeypatch.setattr(constants, 'FILES_TO_WKT_MAX_TOTAL_BYTES', 3 * 4096)
+
+
+def test_file_just_under_the_limit(small_limits):
+    assert read(geojson_file(size=4096)) == [4096]
+
+def test_file_just_over_the_limit(small_limits):
+    with pytest.raises(HTTPException) as exc_info:
+        read(geojson_file(size=4097))
+    assert exc_info.value.status_code == 413
+
+def test_upload_just_under_the_total_limit(small_limits):
+    assert read(*[geojson_file(size=4096)] * 3) == [4096] * 3
+
+def test_upload_just_over_the_total_limit(small_limits):
+    # Each file's fine on its own:
+    with pytest.raises(HTTPException) as exc_info:
+        read(*[geojson_file(size=4096)] * 2, geojson_file(size=4096), b' ')
+    assert exc_info.value.status_code == 413
+
+@pytest.mark.parametrize('files', [
+    [geojson_file(size=4097)],
+    # Turned away by its Content-Length, before any of it's read:
+    [geojson_file(size=4096)] * 4,
+])
+def test_oversized_upload_is_a_413(app, call_api, small_limits, files):
+    response = upload(call_api, *files)
+    assert response.status_code == 413
+    assert 'limit' in response.json()['error']['report']
+
+
+def test_shape_under_budget_is_left_alone():
+    shape = circle(100)
+    simplified, repairs = simplify_to_budget(shape, shapely.get_num_coordinates(shape))
+    assert simplified is shape
+    assert repairs == []
+
+@pytest.mark.parametrize('vertices, budget', [(5000, 500), (20000, 1000), (1000, 999)])
+def test_shape_over_budget_is_simplified_to_fit(vertices, budget):
+    shape = circle(vertices)
+    simplified, repairs = simplify_to_budget(shape, budget)
+    assert shapely.get_num_coordinates(simplified) <= budget
+    # Not simplified any further than it has to be, so it's still the same shape:
+    assert shapely.get_num_coordinates(simplified) >= budget // 4
+    assert simplified.is_valid
+    assert abs(simplified.area - shape.area) / shape.area < 0.02
+    assert [repair['type'] for repair in repairs] == ['SIMPLIFY']
+    assert f'from {vertices + 1} to' in repairs[0]['report']
+
+# asf.filesToWKT comes from the Discovery-asf_search checkout the Dockerfile installs, not the asf_search release:
+@pytest.mark.skipif(not hasattr(asf, 'filesToWKT'), reason="this asf_search can't parse files")
+def test_upload_is_simplified_before_its_validated(monkeypatch, app, call_api):
+    monkeypatch.setattr(constants, 'FILES_TO_WKT_MAX_VERTICES', 1000)
+    response = upload(call_api, geojson_file(shapely.geometry.mapping(circle(20000))))
+    assert response.status_code == 200
+    data = response.json()
+    assert 'SIMPLIFY' in [repair['type'] for repair in data['repairs']]
+    assert shapely.get_num_coordinates(shapely.from_wkt(data['wkt']['unwrapped'])) <= 1000
+    # What was uploaded, before it was simplified:
+    assert shapely.get_num_coordinates(shapely.from_wkt(data['parsed wkt'])) == 20001
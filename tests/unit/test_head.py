@@ -0,0 +1,100 @@
+import re
+
+import pytest
+
+from SearchAPI.application import application, output
+
+PARAMS = {'platform': 'S1', 'maxResults': 5}
+REFERENCE = 'S1B_IW_SLC__1SDV_20210102T032031_20210102T032058_024970_02F8C3_C081'
+# Different on every response:
+VOLATILE_HEADERS = ('x-response-time', 'content-length')
+
+
+@pytest.fixture(autouse=True)
+def head_hits(monkeypatch):
+    monkeypatch.setenv('SEARCHAPI_HEAD_HITS', 'TRUE')
+    monkeypatch.setenv('SEARCHAPI_CACHE', 'none')
+
+def comparable(headers) -> dict:
+    headers = {key: value for key, value in headers.items() if key not in VOLATILE_HEADERS}
+    # The file's named after when it was sent:
+    if 'content-disposition' in headers:
+        headers['content-disposition'] = re.sub(r'\d{4}-\d\d-\d\d_\d\d-\d\d-\d\d', '<time>', headers['content-disposition'])
+    return headers
+
+def head_then_get(call_api, path: str, params: dict, headers: dict = None) -> tuple:
+    # In that order, so a HEAD's X-Cache is never a HIT from the GET before it:
+    async def requests(client):
+        head = await client.head(path, params=params, headers=headers)
+        get = await client.get(path, params=params, headers=headers)
+        return get, head
+    return call_api(requests)
+
+@pytest.mark.parametrize('output_format', ['jsonlite', 'jsonlite2', 'geojson', 'csv', 'kml', 'metalink', 'parquet', 'count'])
+def test_head_has_the_same_headers_as_get(app, cmr, call_api, output_format):
+    get, head = head_then_get(call_api, '/services/search/param', {**PARAMS, 'output': output_format}, {'Accept-Encoding': 'identity'})
+    assert (get.status_code, head.status_code) == (200, 200)
+    assert comparable(head.headers) == comparable(get.headers)
+    assert head.headers['CMR-Hits'] == '3000'
+    # No body, and no length unless it's the same as the GET's:
+    assert head.content == b''
+    if output_format == 'count':
+        assert head.headers['Content-Length'] == get.headers['Content-Length']
+    else:
+        assert 'Content-Length' not in head.headers
+
+def test_head_on_a_cached_search(monkeypatch, app, cmr, call_api):
+    monkeypatch.setenv('SEARCHAPI_CACHE', 'memory')
+    params = {'platform': 'S1', 'maxResults': 250, 'output': 'jsonlite'}
+
+    async def requests(client):
+        await client.get('/services/search/param', params=params, headers={'Accept-Encoding': 'gzip'})
+        get = await client.get('/services/search/param', params=params, headers={'Accept-Encoding': 'gzip'})
+        head = await client.head('/services/search/param', params=params, headers={'Accept-Encoding': 'gzip'})
+        return get, head
+    get, head = call_api(requests)
+    assert (get.headers['X-Cache'], head.headers['X-Cache']) == ('HIT', 'HIT')
+    assert comparable(head.headers) == comparable(get.headers)
+    assert head.headers['Content-Encoding'] == 'gzip'
+    assert head.content == b''
+
+def test_head_baseline_has_the_same_headers_as_get(app, cmr, call_api):
+    cmr.hits = 20
+    get, head = head_then_get(call_api, '/services/search/baseline', {'reference': REFERENCE, 'output': 'csv'}, {'Accept-Encoding': 'identity'})
+    assert (get.status_code, head.status_code) == (200, 200)
+    assert comparable(head.headers) == comparable(get.headers)
+    assert (head.headers['X-Cache'], head.headers['CMR-Hits']) == ('MISS', '20')
+    assert head.content == b''
+
+@pytest.mark.parametrize('path, params', [
+    ('/services/search/param', {**PARAMS, 'output': 'nonsense'}),
+    ('/services/search/baseline', {'reference': REFERENCE, 'output': 'nonsense'}),
+])
+def test_unknown_output_is_a_400(app, cmr, call_api, path, params):
+    get, head = head_then_get(call_api, path, params)
+    assert (get.status_code, head.status_code) == (400, 400)
+    assert head.content == b''
+
+def test_head_renders_nothing(monkeypatch, app, cmr, call_api):
+    def as_stream(*args, **kwargs):
+        raise AssertionError('HEAD rendered a response body')
+    monkeypatch.setattr(output, 'as_stream', as_stream)
+    monkeypatch.setattr(application, 'as_stream', as_stream)
+    monkeypatch.setenv('SEARCHAPI_HEAD_HITS', 'FALSE')
+
+    async def head(client):
+        return await client.head('/services/search/param', params={**PARAMS, 'output': 'parquet'})
+    response = call_api(head)
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'application/vnd.apache.parquet'
+    # Without SEARCHAPI_HEAD_HITS, it's all from the params. CMR is never asked:
+    assert 'CMR-Hits' not in response.headers
+    assert cmr.requests == 0
+
+@pytest.mark.parametrize('output_format', [*output.OUTPUT_TYPES, 'JSON'])
+def test_output_metadata_matches_as_stream(output_format):
+    metadata = output.output_metadata(output_format)
+    response_info = output.as_stream([], output_format)
+    response_info.pop('content').close()
+    assert metadata['media_type'] == response_info['media_type']
+    assert comparable(metadata['headers']) == comparable(response_info['headers'])
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import asf_search as asf
+import pytest
+
+from SearchAPI.application import application, cmr_client
+from SearchAPI.application.asf_env import load_config_maturity
+from SearchAPI.application.product_lists import ListSearch, dedupe_names, get_list_search
+
+# Scene names in the CMR stand-in's fixtures, not in date order (ERS is the oldest, the GRD the newest):
+ERS = 'E1_19942_STD_F287'
+SLC = 'S1B_IW_SLC__1SDV_20210102T032031_20210102T032058_024970_02F8C3_C081'
+ALOS = 'ALPSRP111041130'
+GRD = 'S1B_IW_GRDH_1SDV_20211110T032039_20211110T032104_029520_0385E6_60DB'
+LATER_SLC = 'S1B_IW_SLC__1SDV_20210126T032030_20210126T032057_025320_0303F3_7BE5'
+
+
+def product(scene_name: str, file_id: str = None):
+    return SimpleNamespace(properties={'sceneName': scene_name, 'fileID': file_id or f'{scene_name}-SLC'})
+
+def test_dedupe_names_keeps_the_first():
+    assert dedupe_names(['b', 'a', 'b', 'c', 'a']) == ['b', 'a', 'c']
+
+def test_list_is_split_into_chunks():
+    list_search = ListSearch(asf.ASFSearchOptions(granule_list=['a', 'b', 'a', 'c', 'd', 'e']), 'granule_list', chunk_size=2)
+    assert list_search.chunks == [['a', 'b'], ['c', 'd'], ['e']]
+    assert list_search.chunk_opts(['c', 'd']).granule_list == ['c', 'd']
+    # The full list is left alone:
+    assert list_search.opts.granule_list == ['a', 'b', 'a', 'c', 'd', 'e']
+
+def test_chunks_are_never_longer_than_a_cmr_page():
+    names = [str(i) for i in range(600)]
+    list_search = ListSearch(asf.ASFSearchOptions(granule_list=names), 'granule_list', chunk_size=1000)
+    assert [len(chunk) for chunk in list_search.chunks] == [250, 250, 100]
+
+def test_only_list_searches_are_split():
+    assert get_list_search(asf.ASFSearchOptions(platform='S1')) is None
+    assert get_list_search(asf.ASFSearchOptions(product_list=['a-SLC'])).keyword == 'product_list'
+
+def test_products_come_back_in_requested_order():
+    list_search = ListSearch(asf.ASFSearchOptions(granule_list=['b', 'a', 'c', 'd']), 'granule_list', chunk_size=2)
+    first = list_search.in_requested_order([product('a'), product('b')])
+    assert [p.properties['sceneName'] for p in first] == ['b', 'a']
+    # A product already returned for an earlier chunk isn't sent again:
+    second = list_search.in_requested_order([product('d'), product('a'), product('c')])
+    assert [p.properties['sceneName'] for p in second] == ['c', 'd']
+
+def test_products_match_by_file_id_too():
+    list_search = ListSearch(asf.ASFSearchOptions(product_list=['b-GRD', 'a-GRD']), 'product_list')
+    ordered = list_search.in_requested_order([product('a', 'a-GRD'), product('b', 'b-GRD'), product('x', 'x-GRD')])
+    # Products that match no name at all go last:
+    assert [p.properties['fileID'] for p in ordered] == ['b-GRD', 'a-GRD', 'x-GRD']
+
+def test_products_sharing_a_name_stay_in_cmr_order():
+    list_search = ListSearch(asf.ASFSearchOptions(granule_list=['b', 'a']), 'granule_list')
+    ordered = list_search.in_requested_order([product('a', 'a-2'), product('b'), product('a', 'a-1')])
+    assert [p.properties['fileID'] for p in ordered] == ['b-SLC', 'a-2', 'a-1']
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """
+    'list_search: chunk_size: 2', so a short list spans a few chunks.
+    """
+    config = load_config_maturity('local')
+    monkeypatch.setattr(cmr_client, 'load_config_maturity', lambda maturity=None: {**config, 'list_search': {**config['list_search'], 'chunk_size': 2}})
+
+@pytest.mark.parametrize('use_async', [True, False])
+@pytest.mark.parametrize('streaming', ['TRUE', 'FALSE'])
+def test_list_search_across_chunks(monkeypatch, app, cmr, call_api, small_chunks, use_async, streaming):
+    monkeypatch.setenv('SEARCHAPI_STREAMING', streaming)
+    if not use_async:
+        monkeypatch.setattr(application, 'get_cmr_client', lambda maturity=None: None)
+    # ERS is asked for twice, and once in a later chunk:
+    names = [ERS, SLC, ALOS, ERS, GRD, LATER_SLC]
+
+    async def search(client):
+        return await client.get('/services/search/param', params={'granule_list': ','.join(names), 'output': 'jsonlite'})
+    response = call_api(search)
+    assert response.status_code == 200
+    # In the order they were asked for, each only once. Not by date:
+    assert [result['granuleName'] for result in response.json()['results']] == [ERS, SLC, ALOS, GRD, LATER_SLC]
+    if use_async:
+        # One CMR query per chunk: [ERS, SLC], [ALOS, GRD], [LATER_SLC]
+        assert cmr.requests == 3
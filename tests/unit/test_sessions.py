@@ -0,0 +1,80 @@
+import pytest
+from requests.adapters import HTTPAdapter
+
+from SearchAPI.application import sessions
+from SearchAPI.application.sessions import PooledAdapter, SessionPool
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions.time, 'monotonic', clock)
+    return clock
+
+def new_pool(token_sessions: int = 2, token_ttl: float = 60) -> SessionPool:
+    return SessionPool(pool_connections=1, pool_maxsize=2, idle_timeout=30, token_sessions=token_sessions, token_ttl=token_ttl)
+
+def adapter(session):
+    return session.get_adapter('https://cmr.earthdata.nasa.gov')
+
+
+def test_anonymous_sessions_share_one_adapter():
+    pool = new_pool()
+    first, second = pool.session(), pool.session()
+    assert first is not second
+    assert adapter(first) is adapter(second)
+    assert 'Authorization' not in first.headers
+
+def test_same_token_reuses_its_adapter():
+    pool = new_pool()
+    first, second = pool.session('token-a'), pool.session('token-a')
+    assert adapter(first) is adapter(second)
+    assert first.headers['Authorization'] == 'Bearer token-a'
+    # Other tokens, and anonymous requests, never share it:
+    assert adapter(pool.session('token-b')) is not adapter(first)
+    assert adapter(pool.session()) is not adapter(first)
+
+def test_token_adapter_expires(clock):
+    pool = new_pool(token_ttl=60)
+    first = adapter(pool.session('token-a'))
+    clock.now += 59
+    assert adapter(pool.session('token-a')) is first
+    clock.now += 1
+    assert adapter(pool.session('token-a')) is not first
+
+def test_least_recently_used_token_is_evicted(monkeypatch):
+    closed = []
+    monkeypatch.setattr(PooledAdapter, 'close', lambda self: closed.append(self))
+    pool = new_pool(token_sessions=2)
+    a, b = adapter(pool.session('token-a')), adapter(pool.session('token-b'))
+    # Keep 'a' fresh, so 'b' is the oldest when 'c' comes in:
+    assert adapter(pool.session('token-a')) is a
+    c = adapter(pool.session('token-c'))
+    assert closed == [b]
+    assert adapter(pool.session('token-a')) is a
+    assert adapter(pool.session('token-c')) is c
+    assert adapter(pool.session('token-b')) is not b
+
+def test_idle_adapter_drops_its_connections(monkeypatch, clock):
+    monkeypatch.setattr(HTTPAdapter, 'send', lambda self, request, **kwargs: 'sent')
+    pooled = PooledAdapter(idle_timeout=30)
+    cleared = []
+    monkeypatch.setattr(pooled.poolmanager, 'clear', lambda: cleared.append(clock.now))
+    clock.now += 30
+    assert pooled.send(None) == 'sent'
+    assert not cleared
+    clock.now += 31
+    pooled.send(None)
+    assert cleared == [clock.now]
+
+def test_pool_is_sized_from_maturities_yml():
+    pool = sessions.get_session_pool('local')
+    assert sessions.get_session_pool('local') is pool
+    assert (pool.pool_connections, pool.pool_maxsize, pool.token_sessions) == (4, 32, 128)
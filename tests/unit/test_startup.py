@@ -0,0 +1,7 @@
+from tests.benchmarks import bench_startup
+
+
+def test_lazy_modules_arent_imported_at_startup():
+    # Same check as 'python -m tests.benchmarks.bench_startup', without the timing budget:
+    result = bench_startup.run(runs=1)
+    assert bench_startup.eager_imports(result) == []
@@ -0,0 +1,83 @@
+import asyncio
+import importlib
+
+import pytest
+
+from SearchAPI.application import application, wkt_cache
+
+search_generator = importlib.import_module('asf_search.search.search_generator')
+
+POLYGON = 'POLYGON((-150 64, -149 64, -149 65, -150 65, -150 64))'
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    wkt_cache._validate_exact.cache_clear()
+    wkt_cache._validate_normalized.cache_clear()
+
+@pytest.mark.parametrize('wkt, normalized', [
+    ('point( 1  2 )', 'POINT(1 2)'),
+    ('POLYGON ((1 1, 2 1 ,2 2,1 1))', 'POLYGON((1 1,2 1,2 2,1 1))'),
+    ('\tmultipoint(\n(1 2), (3 4))', 'MULTIPOINT((1 2),(3 4))'),
+])
+def test_normalize_wkt(wkt, normalized):
+    assert wkt_cache.normalize_wkt(wkt) == normalized
+
+def test_same_string_is_an_exact_hit():
+    first = wkt_cache.validate_wkt(POLYGON)
+    second = wkt_cache.validate_wkt(POLYGON)
+    assert second[0] is first[0]
+    assert wkt_cache._validate_exact.cache_info().hits == 1
+    assert wkt_cache._validate_normalized.cache_info().hits == 0
+    assert wkt_cache.wkt_cache_stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'size': 1, 'max_size': wkt_cache.CACHE_SIZE}
+
+def test_same_shape_written_differently_is_a_normalized_hit():
+    first = wkt_cache.validate_wkt(POLYGON)
+    second = wkt_cache.validate_wkt(POLYGON.lower().replace(', ', ' , '))
+    assert second[0] is first[0]
+    assert wkt_cache._validate_exact.cache_info().hits == 0
+    assert wkt_cache._validate_normalized.cache_info().hits == 1
+    assert wkt_cache.wkt_cache_stats()['hits'] == 1
+    assert wkt_cache.wkt_cache_stats()['misses'] == 1
+
+def test_repairs_are_a_copy():
+    _, _, repairs = wkt_cache.validate_wkt(POLYGON)
+    repairs.append('changed')
+    assert 'changed' not in wkt_cache.validate_wkt(POLYGON)[2]
+
+def test_invalid_wkt_isnt_cached():
+    for _ in range(2):
+        with pytest.raises(Exception):
+            wkt_cache.validate_wkt('POLYGON((nonsense')
+    assert wkt_cache.wkt_cache_stats()['size'] == 0
+
+
+def test_install_swaps_asf_searchs_validate_wkt(monkeypatch):
+    monkeypatch.setattr(search_generator, 'validate_wkt', search_generator.validate_wkt)
+    assert wkt_cache.install()
+    assert search_generator.validate_wkt is wkt_cache.validate_wkt
+
+def test_install_warns_without_validate_wkt(monkeypatch):
+    warnings = []
+    monkeypatch.delattr(search_generator, 'validate_wkt')
+    monkeypatch.setattr(wkt_cache.api_logger, 'warning', warnings.append)
+    assert not wkt_cache.install()
+    assert not hasattr(search_generator, 'validate_wkt')
+    assert len(warnings) == 1
+
+def test_installed_on_startup_not_import(monkeypatch, app, cmr):
+    monkeypatch.setattr(search_generator, 'validate_wkt', search_generator.validate_wkt)
+    assert search_generator.validate_wkt is not wkt_cache.validate_wkt
+
+    async def startup():
+        async with application.lifespan(app):
+            return search_generator.validate_wkt
+    assert asyncio.run(startup()) is wkt_cache.validate_wkt
+
+def test_stats_in_deep_health_check(app, cmr, call_api):
+    async def validate_then_check(client):
+        for wkt in (POLYGON, POLYGON, POLYGON.lower()):
+            assert (await client.post('/services/utils/wkt', json={'wkt': wkt})).status_code == 200
+        return await client.get('/health', params={'deep': True})
+    stats = call_api(validate_then_check).json()['ASFSearchAPI']['wkt_cache']
+    assert stats == {'hits': 2, 'misses': 1, 'hit_rate': 2 / 3, 'size': 1, 'max_size': wkt_cache.CACHE_SIZE}